@@ -1,30 +1,36 @@
 #!/usr/bin/env python
 import copy
-import os
+from functools import partial
 
 import inject
-from redis import StrictRedis
 
 from bin.common import basic_config
 from latigo.executor import PredictionExecutor
+from latigo.executor.process_pool import ExecutorProcessPool
+from latigo.time_series_api.cache_backends import CacheBackend, cache_backend_factory
 
 
-def inject_config(binder):
+def inject_config(binder, config: dict):
     """Application components boilerplate."""
-    binder.bind(StrictRedis, StrictRedis(
-        host=os.environ["CACHE_HOST"],
-        password=os.environ["CACHE_PASSWORD"],
-        port=os.environ["CACHE_PORT"],
-        ssl=True,
-    ))
+    binder.bind(CacheBackend, cache_backend_factory(config.get("cache")))
 
 
-if __name__ == "__main__":
+def run_executor(config: dict):
+    """Run the executor in the current process."""
     # Configure all dependencies only when the service is ready
-    inject.configure_once(inject_config, bind_in_runtime=False)
-
-    config = basic_config("executor")
+    inject.configure_once(partial(inject_config, config=config), bind_in_runtime=False)
 
     executor = PredictionExecutor(config=copy.deepcopy(config))
     executor.print_summary()
     executor.run()
+
+
+if __name__ == "__main__":
+    config = basic_config("executor")
+    processes = config.get("executor", {}).get("processes", 1)
+
+    if processes == 1:
+        run_executor(config)
+    else:
+        # each process has its own executor and dependencies, they share only the Kafka consumer group
+        ExecutorProcessPool(processes=processes, target=partial(run_executor, config)).run()
@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+"""Create output tags of the models in Time Series API ahead of their first prediction.
+
+Usage: onboard_output_tags.py PROJECT [PROJECT ...]
+
+Executor configuration is used ("model_info", "prediction_storage" and optional "output_tags_onboarding" sections).
+"""
+import argparse
+import logging
+import sys
+from functools import partial
+
+import inject
+
+from bin.common import basic_config
+from bin.executor import inject_config
+from latigo.model_info import model_info_provider_factory
+from latigo.time_series_api import OutputTagsOnboarding, TimeSeriesAPIPredictionStorageProvider
+
+logger = logging.getLogger("latigo")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create output tags of the Gordo models in Time Series API.")
+    parser.add_argument("projects", nargs="+", help="Gordo projects which models should be onboarded")
+    args = parser.parse_args()
+
+    config = basic_config("executor")
+    inject.configure_once(partial(inject_config, config=config), bind_in_runtime=False)
+
+    model_info_provider = model_info_provider_factory(config["model_info"])
+    prediction_storage_provider = TimeSeriesAPIPredictionStorageProvider(config["prediction_storage"])
+    onboarding = OutputTagsOnboarding(
+        model_info_provider, prediction_storage_provider, config.get("output_tags_onboarding")
+    )
+
+    model_names_by_project = model_info_provider.get_all_model_names_by_project(projects=args.projects)
+    logger.info("Onboarding output tags of %s projects", len(model_names_by_project))
+    res = onboarding.onboard(model_names_by_project)
+    sys.exit(1 if res["failed"] else 0)
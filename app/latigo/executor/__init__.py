@@ -1,5 +1,8 @@
 import logging
+import threading
 import typing
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
 import pylogctx
 import sys
@@ -12,6 +15,7 @@ from requests_ms_auth import __version__ as auth_version
 
 from latigo import __version__ as latigo_version
 from latigo.auth import auth_check
+from latigo.executor.pipeline import PredictionPipeline
 from latigo.gordo import NoTagDataInDataLake
 from latigo.log import measure
 from latigo.metadata_storage import prediction_metadata_storage_provider_factory
@@ -21,11 +25,14 @@ from latigo.prediction_storage import prediction_storage_provider_factory
 from latigo.sensor_data import sensor_data_provider_factory
 from latigo.task_queue import task_queue_receiver_factory
 from latigo.time_series_api import get_time_series_id_from_response
-from latigo.time_series_api.time_series_exceptions import NoCommonAssetFound
+from latigo.time_series_api.cache_stats import TAG_METADATA_CACHE_CONTEXT_KEY, TAG_METADATA_CACHE_STATS
+from latigo.time_series_api.time_series_exceptions import NoCommonAssetFound, PredictionNotStored
 from latigo.types import PredictionDataSet, Task
+from latigo.utils import get_process_rss_mb
 
 GORDO_EXCEPTIONS = (ResourceGone, NotFound, BadGordoRequest, HttpUnprocessableEntity)
 IOC_DATA_EXCEPTIONS = (InsufficientDataAfterRowFilteringError, InsufficientDataError, NoTagDataInDataLake)
+RETRIABLE_EXCEPTIONS = (PredictionNotStored,)  # temporary errors, task is received once more
 
 logger = logging.getLogger(__name__)
 
@@ -124,22 +131,58 @@ class PredictionExecutor:
             self._fail("No executor config specified")
 
         self.log_debug_enabled = self.executor_config.get("log_debug_enabled", False)
+        self.max_concurrent_tasks = self.executor_config.get("max_concurrent_tasks", 1)
+        if not isinstance(self.max_concurrent_tasks, int) or self.max_concurrent_tasks < 1:
+            self._fail(f"'max_concurrent_tasks' should be a positive integer, got '{self.max_concurrent_tasks}'")
+
+        # limits after what executor stops processing new tasks, so the process could be restarted. 0 - no limit.
+        self.max_tasks_per_process = self.executor_config.get("max_tasks_per_process", 0)
+        self.max_rss_mb = self.executor_config.get("max_rss_mb", 0)
+        self._received_tasks_count = 0
+
+        self.pipeline: typing.Optional[PredictionPipeline] = None
+        pipeline_config = self.executor_config.get("pipeline", None)
+        if pipeline_config:
+            try:
+                self.pipeline = PredictionPipeline(executor=self, config=pipeline_config)
+            except ValueError as err:
+                self._fail(str(err))
 
-    @staticmethod
-    def print_summary():
+        # queue might stop fetching new tasks while the executor is busy with the received ones
+        self.task_queue.set_max_in_flight(
+            self.pipeline.max_in_flight_tasks if self.pipeline else self.max_concurrent_tasks
+        )
+
+    def print_summary(self):
         """Log some debug info about executor."""
         logger.info(
             f"\nExecutor settings:\n"
             f"  Latigo Version:   {latigo_version}\n"
             f"  Gordo Version:    {gordo_version}\n"
             f"  Auth Version:     {auth_version}\n"
+            f"  Concurrent tasks: {self.max_concurrent_tasks}\n"
+            f"  Pipeline:         {self.pipeline}\n"
         )
 
     def execute_prediction_for_task(self, task: Task, revision: str) -> typing.Optional[PredictionDataSet]:
         """Execute prediction for the given model and time range.
 
         Return: prediction data OR None (if error occurred).
+
+        Raise:
+            - NoTagDataInDataLake: if some tags of the model recently did not exist, so Gordo is not asked in vain.
         """
+        spec = self.model_info_provider.get_spec(
+            project_name=task.project_name, model_name=task.model_name, revision=revision
+        )
+        if spec:
+            tags_without_data = self.sensor_data_provider.get_tags_without_data([tag.name for tag in spec.tag_list])
+            if tags_without_data:
+                raise NoTagDataInDataLake(
+                    task.project_name, task.model_name, task.from_time, task.to_time,
+                    f"tags {tags_without_data} recently were not found",
+                )
+
         model_training_period = self.model_info_provider.get_model_training_dates(
             project_name=task.project_name, model_name=task.model_name, revision=revision
         )
@@ -166,21 +209,28 @@ class PredictionExecutor:
     def _get_tags_time_series_ids_for_model(self, prediction_data: PredictionDataSet) -> typing.Dict[str, str]:
         """Fetch 'Time Series IDs' of the model`s 'input_tags'.
 
+        IDs that were resolved on the data fetching are reused, otherwise they are resolved once more.
+
         Args:
             prediction_data: dataframe as a result of prediction execution and prediction metadata.
         """
+        if prediction_data.input_time_series_ids:
+            return prediction_data.input_time_series_ids
+
         input_time_series_ids: typing.Dict[str, str] = {}  # {tag_name: time_series_id}
 
         spec = self.model_info_provider.get_spec(
             project_name=prediction_data.meta_data.project_name,
             model_name=prediction_data.meta_data.model_name,
+            revision=prediction_data.meta_data.revision,
         )
         common_facility = self.prediction_storage_provider.get_facility_by_tag_name(spec.tag_list[0])
 
+        metas = self.prediction_storage_provider.get_meta_by_names(
+            names=[tag.name for tag in spec.tag_list], facility=common_facility
+        )
         for tag in spec.tag_list:
-            meta = self.prediction_storage_provider.get_meta_by_name(name=tag.name, facility=common_facility)
-
-            tag_id = get_time_series_id_from_response(meta)
+            tag_id = get_time_series_id_from_response(metas.get(tag.name))
             input_time_series_ids[tag.name] = tag_id
 
         return input_time_series_ids
@@ -192,40 +242,143 @@ class PredictionExecutor:
         finally:
             self.task_queue.close()
 
+    def receive_task(self) -> typing.Optional[Task]:
+        """Fetch one task from the queue and stop the executor if it reached its limits."""
+        task = self.task_queue.get_task()
+        if task:
+            self._received_tasks_count += 1
+            self._check_process_limits()
+        return task
+
+    def _check_process_limits(self):
+        """Stop receiving new tasks if the executor process should be recycled."""
+        if self.max_tasks_per_process and self._received_tasks_count >= self.max_tasks_per_process:
+            logger.info(
+                "Executor received %s tasks and will be stopped after they are processed.", self._received_tasks_count
+            )
+            self._is_ready = False
+            return
+
+        if self.max_rss_mb:
+            rss_mb = get_process_rss_mb()
+            if rss_mb >= self.max_rss_mb:
+                logger.info(
+                    "Executor uses %.1f MB of memory and will be stopped after the tasks are processed.", rss_mb
+                )
+                self._is_ready = False
+
     def _run(self):
         pylogctx.context.clear()
 
+        if self.pipeline:
+            self.pipeline.run()
+            return
+
+        if self.max_concurrent_tasks > 1:
+            self._run_concurrently()
+            return
+
         while self._is_ready:
-            try:
-                self.process_one_prediction_task()
-            except IOC_DATA_EXCEPTIONS as err:
-                logger.warning("Data error: %r", err)
-            except GORDO_EXCEPTIONS as err:
-                logger.warning("Gordo error: %r", err)
-            except NoCommonAssetFound as err:
-                logger.warning("Prediction was not stored: %r", err)
-            except HTTPError as err:
-                logger.exception("Unknown error: HTTPError: %s",  err.response.text)
-            except Exception:
-                logger.exception("Unknown error")
-            except KeyboardInterrupt:
-                self._is_ready = False
-            finally:
-                pylogctx.context.clear()
+            self._run_safely(self.process_one_prediction_task)
+
+    def _run_concurrently(self):
+        """Execute several tasks at once on a bounded pool of worker threads.
+
+        A new task is fetched from the queue only when one of the workers is free,
+        so no more than 'max_concurrent_tasks' tasks are in flight at any moment.
+        """
+        free_workers = threading.BoundedSemaphore(self.max_concurrent_tasks)
+
+        with ThreadPoolExecutor(
+            max_workers=self.max_concurrent_tasks, thread_name_prefix="latigo-executor-"
+        ) as workers:
+            while self._is_ready:
+                free_workers.acquire()
+                task = None
+                try:
+                    task = self.receive_task()
+                except KeyboardInterrupt:
+                    self._is_ready = False
+                except Exception:
+                    logger.exception("Unknown error while receiving the task")
+
+                if not task:
+                    free_workers.release()
+                    if self._is_ready:
+                        logger.warning(f"[No task was received from queue] Will re-fetch.")
+                    continue
+
+                future = workers.submit(self._run_safely, self.process_prediction_task, task)
+                future.add_done_callback(lambda _: free_workers.release())
+
+    def _run_safely(self, func: typing.Callable, *args) -> typing.Any:
+        """Call 'func' and log known errors of the task processing instead of raising them.
+
+        Return: result of the 'func' OR None (if error occurred).
+        """
+        try:
+            return func(*args)
+        except IOC_DATA_EXCEPTIONS as err:
+            logger.warning("Data error: %r", err)
+        except GORDO_EXCEPTIONS as err:
+            logger.warning("Gordo error: %r", err)
+        except NoCommonAssetFound as err:
+            logger.warning("Prediction was not stored: %r", err)
+        except RETRIABLE_EXCEPTIONS as err:
+            logger.warning("Prediction was not stored: %r", err)
+        except HTTPError as err:
+            logger.exception("Unknown error: HTTPError: %s",  err.response.text)
+        except Exception:
+            logger.exception("Unknown error")
+        except KeyboardInterrupt:
+            self._is_ready = False
+        finally:
+            pylogctx.context.clear()
 
-    @measure("process_prediction_task", logger=logger)
     def process_one_prediction_task(self):
         """Fetch and make prediction for one model from queue."""
-        task = self.task_queue.get_task()
+        task = self.receive_task()
         if not task:
             logger.warning(f"[No task was received from queue] Will re-fetch.")
             return
 
+        self.process_prediction_task(task)
+
+    @measure("process_prediction_task", logger=logger)
+    def process_prediction_task(self, task: Task):
+        """Make prediction for the given task and store its results.
+
+        Task is marked as done in the queue after its results were stored or it failed with an error.
+        Totals of the tag metadata cache calls of the task are logged with its measurement.
+        """
         pylogctx.context.update(task=task)
         logger.info("Starting task processing.")
 
-        revision = self.model_info_provider.get_project_latest_revisions(task.project_name)
-        pylogctx.context.update(revision=revision)
+        with self.acknowledge_task(task), TAG_METADATA_CACHE_STATS.track(TAG_METADATA_CACHE_CONTEXT_KEY):
+            revision = self.model_info_provider.get_project_latest_revisions(task.project_name)
+            pylogctx.context.update(revision=revision)
+
+            prediction_data = self.execute_prediction_for_task(task, revision)
+            self.store_prediction_data_and_metadata(prediction_data)
 
-        prediction_data = self.execute_prediction_for_task(task, revision)
-        self.store_prediction_data_and_metadata(prediction_data)
+    @contextmanager
+    def acknowledge_task(self, task: Task, on_success: bool = True):
+        """Mark the task as done in the queue at the end of the block.
+
+        Failed task is marked as done as well: it would fail once more, so it should not block the next tasks.
+        Task that failed with a temporary error ("RETRIABLE_EXCEPTIONS") is returned to the queue to be retried.
+        Task is not marked if the block was interrupted (KeyboardInterrupt), so it's received once more.
+
+        Args:
+            - on_success: whether to mark the task if the block finished without errors.
+        """
+        try:
+            yield
+        except RETRIABLE_EXCEPTIONS:
+            self.task_queue.retry_task(task)
+            raise
+        except Exception:
+            self.task_queue.task_done(task)
+            raise
+        if on_success:
+            self.task_queue.task_done(task)
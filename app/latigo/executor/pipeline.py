@@ -0,0 +1,140 @@
+"""Staged execution of the prediction tasks.
+
+Processing of the task is split into the stages that are connected by the bounded queues:
+    - "receive": fetch the task from the queue and resolve the latest revision of its project;
+    - "predict": execute prediction in Gordo;
+    - "store": store prediction results to the Time Series API and its metadata to the Metadata API.
+
+Each stage has its own amount of workers, so the next task might be predicted while results of the previous one are
+uploaded. The queue between stages is bounded: if the next stage is busy, the previous one waits (backpressure).
+"""
+import logging
+import queue
+import threading
+import typing
+
+import pylogctx
+
+from latigo.log import measure
+from latigo.time_series_api.cache_stats import TAG_METADATA_CACHE_CONTEXT_KEY, TAG_METADATA_CACHE_STATS
+from latigo.types import PredictionDataSet, Task
+
+logger = logging.getLogger(__name__)
+
+_STOP_WORKER = object()  # signal for the worker to finish its work
+
+
+class PredictionPipeline:
+    def __init__(self, executor, config: dict):
+        """Prepare the pipeline for the executor.
+
+        Args:
+            executor: PredictionExecutor with all the providers initialized.
+            config: "executor.pipeline" config section.
+        """
+        self.executor = executor
+        self.receive_workers = self._get_positive_int(config, "receive_workers", 1)
+        self.predict_workers = self._get_positive_int(config, "predict_workers", 1)
+        self.store_workers = self._get_positive_int(config, "store_workers", 1)
+        self.queue_size = self._get_positive_int(config, "queue_size", 1)
+
+        self._predict_queue: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        self._store_queue: queue.Queue = queue.Queue(maxsize=self.queue_size)
+
+    def __str__(self):
+        return (
+            f"PredictionPipeline(receive_workers={self.receive_workers}, predict_workers={self.predict_workers}, "
+            f"store_workers={self.store_workers}, queue_size={self.queue_size})"
+        )
+
+    @property
+    def max_in_flight_tasks(self) -> int:
+        """Amount of the received tasks that are not done at which the receive workers might be blocked.
+
+        Receive worker blocks when the predict workers and the queue before them are full, so the tasks of the store
+        stage are not counted: otherwise the queue would not stop fetching while the receive workers do not poll it.
+        """
+        return self.receive_workers + self.queue_size + self.predict_workers
+
+    @staticmethod
+    def _get_positive_int(config: dict, name: str, default: int) -> int:
+        value = config.get(name, default)
+        if not isinstance(value, int) or value < 1:
+            raise ValueError(f"'{name}' of the pipeline should be a positive integer, got '{value}'")
+        return value
+
+    def run(self):
+        """Run all the stages until the executor is ready and wait till all received tasks are processed."""
+        receivers = self._start_workers("receive", self.receive_workers, self._receive_tasks)
+        predictors = self._start_workers(
+            "predict", self.predict_workers, self._consume, self._predict_queue, self._predict
+        )
+        storers = self._start_workers("store", self.store_workers, self._consume, self._store_queue, self._store)
+
+        self._join(receivers)
+        self._stop(predictors, self._predict_queue)
+        self._stop(storers, self._store_queue)
+
+    @staticmethod
+    def _start_workers(stage: str, amount: int, target: typing.Callable, *args) -> typing.List[threading.Thread]:
+        workers = [
+            threading.Thread(target=target, args=args, name=f"latigo-{stage}-{i}", daemon=True) for i in range(amount)
+        ]
+        for worker in workers:
+            worker.start()
+        return workers
+
+    def _join(self, workers: typing.List[threading.Thread]):
+        for worker in workers:
+            while worker.is_alive():
+                try:
+                    worker.join()
+                except KeyboardInterrupt:
+                    logger.warning("Pipeline is stopping. Waiting for the received tasks to be processed.")
+                    self.executor._is_ready = False
+
+    def _stop(self, workers: typing.List[threading.Thread], source: queue.Queue):
+        """Finish the workers after they process all the items that are left in the 'source' queue."""
+        for _ in workers:
+            source.put(_STOP_WORKER)
+        self._join(workers)
+
+    def _receive_tasks(self):
+        while self.executor._is_ready:
+            item = self.executor._run_safely(self._receive)
+            if item:
+                self._predict_queue.put(item)
+
+    def _consume(self, source: queue.Queue, func: typing.Callable):
+        while True:
+            item = source.get()
+            if item is _STOP_WORKER:
+                break
+            self.executor._run_safely(func, *item)
+
+    def _receive(self) -> typing.Optional[typing.Tuple[Task, str]]:
+        task = self.executor.receive_task()
+        if not task:
+            logger.warning(f"[No task was received from queue] Will re-fetch.")
+            return None
+
+        pylogctx.context.update(task=task)
+        logger.info("Starting task processing.")
+        with self.executor.acknowledge_task(task, on_success=False):
+            revision = self.executor.model_info_provider.get_project_latest_revisions(task.project_name)
+        return task, revision
+
+    @measure("pipeline_predict_stage", logger=logger)
+    def _predict(self, task: Task, revision: str):
+        pylogctx.context.update(task=task, revision=revision)
+        with self.executor.acknowledge_task(task, on_success=False), TAG_METADATA_CACHE_STATS.track(
+            TAG_METADATA_CACHE_CONTEXT_KEY
+        ):
+            prediction_data = self.executor.execute_prediction_for_task(task, revision)
+        self._store_queue.put((task, revision, prediction_data))
+
+    @measure("pipeline_store_stage", logger=logger)
+    def _store(self, task: Task, revision: str, prediction_data: PredictionDataSet):
+        pylogctx.context.update(task=task, revision=revision)
+        with self.executor.acknowledge_task(task), TAG_METADATA_CACHE_STATS.track(TAG_METADATA_CACHE_CONTEXT_KEY):
+            self.executor.store_prediction_data_and_metadata(prediction_data)
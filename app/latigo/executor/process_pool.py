@@ -0,0 +1,131 @@
+"""Pool of the executor processes.
+
+Pandas and Gordo client work is CPU-bound and serialized by the GIL, so one executor process can not use all the
+cores of the pod. Pool starts several executor processes (they share one Kafka consumer group) and starts the new one
+each time some of them exits: executor finishes itself after the configured amount of tasks or memory usage.
+
+Process that fails at startup (bad config, unreachable cache, etc.) is restarted with exponential backoff,
+and the pool exits with an error after several such failures in a row, as the single executor process does.
+"""
+import logging
+import multiprocessing
+import signal
+import sys
+import typing
+from time import monotonic, sleep
+
+logger = logging.getLogger(__name__)
+
+
+def _run_worker(target: typing.Callable[[], None]):
+    """Run the executor in the worker process.
+
+    Worker inherits SIGTERM handler of the pool on fork, so it's reset to the default one:
+    otherwise "terminate" of the pool would be ignored by the worker.
+    """
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    target()
+
+
+class ExecutorProcessPool:
+    CHECK_INTERVAL = 1  # in seconds, how often to check that all the workers are alive
+    TERMINATE_TIMEOUT = 10  # in seconds, how long to wait for the worker to exit before it's killed
+    STARTUP_TIME = 60  # in seconds, worker that exits with an error sooner is considered failed at startup
+    RESTART_BACKOFF = 1  # in seconds, delay of the restart after the first startup failure, doubled after each next
+    MAX_RESTART_BACKOFF = 60  # in seconds
+    MAX_STARTUP_FAILURES = 5  # pool is stopped after such amount of the startup failures of the worker in a row
+
+    def __init__(self, processes: int, target: typing.Callable[[], None]):
+        """Prepare the pool.
+
+        Args:
+            processes: amount of the worker processes to keep running.
+            target: function that runs the executor in the worker process.
+        """
+        if not isinstance(processes, int) or processes < 1:
+            raise ValueError(f"'processes' should be a positive integer, got '{processes}'")
+        self.processes = processes
+        self.target = target
+        self._is_ready = True  # might be needed to exit supervising-loop
+        self._workers: typing.List[typing.Optional[multiprocessing.Process]] = [None] * processes
+        self._started_at = [0.0] * processes  # per slot, when its worker was started
+        self._restart_at = [0.0] * processes  # per slot, when its worker could be started
+        self._startup_failures = [0] * processes  # per slot, startup failures of its workers in a row
+
+    def __str__(self):
+        return f"ExecutorProcessPool(processes={self.processes})"
+
+    def run(self):
+        """Keep all the worker processes running until the pool is stopped."""
+        signal.signal(signal.SIGTERM, self._stop)
+        logger.info("Starting %s executor processes.", self.processes)
+
+        try:
+            while self._is_ready:
+                self._restart_exited_workers()
+                sleep(self.CHECK_INTERVAL)
+        except KeyboardInterrupt:
+            self._is_ready = False
+        finally:
+            self._terminate_workers()
+
+    def _stop(self, signum, frame):
+        logger.info("Received signal %s, stopping the executor processes.", signum)
+        self._is_ready = False
+
+    def _restart_exited_workers(self):
+        for slot, worker in enumerate(self._workers):
+            if worker and worker.is_alive():
+                continue
+            if worker:
+                worker.join()
+                self._workers[slot] = None
+                self._handle_exited_worker(slot, worker)
+            if monotonic() >= self._restart_at[slot]:
+                self._workers[slot] = self._start_worker(slot)
+
+    def _handle_exited_worker(self, slot: int, worker: multiprocessing.Process):
+        """Delay the restart of the worker that failed at startup or stop the pool if it fails again and again."""
+        now = monotonic()
+        if not worker.exitcode or now - self._started_at[slot] >= self.STARTUP_TIME:
+            self._startup_failures[slot] = 0
+            logger.info("Executor process %s exited with code %s. Starting the new one.", worker.pid, worker.exitcode)
+            return
+
+        failures = self._startup_failures[slot] = self._startup_failures[slot] + 1
+        if failures >= self.MAX_STARTUP_FAILURES:
+            self._fail(
+                f"Executor process failed at startup {failures} times in a row (last exit code {worker.exitcode}). "
+                "Stopping all the executor processes."
+            )
+        delay = min(self.RESTART_BACKOFF * 2 ** (failures - 1), self.MAX_RESTART_BACKOFF)
+        self._restart_at[slot] = now + delay
+        logger.warning(
+            "Executor process %s failed at startup with code %s. Starting the new one in %s seconds.",
+            worker.pid,
+            worker.exitcode,
+            delay,
+        )
+
+    @staticmethod
+    def _fail(message: str):
+        logger.error(message)
+        raise sys.exit(message)
+
+    def _start_worker(self, slot: int) -> multiprocessing.Process:
+        worker = multiprocessing.Process(target=_run_worker, args=(self.target,), name=f"latigo-executor-{slot}")
+        worker.start()
+        self._started_at[slot] = monotonic()
+        return worker
+
+    def _terminate_workers(self):
+        alive_workers = [worker for worker in self._workers if worker and worker.is_alive()]
+        for worker in alive_workers:
+            worker.terminate()
+        for worker in alive_workers:
+            worker.join(self.TERMINATE_TIMEOUT)
+            if worker.is_alive():
+                logger.warning("Executor process %s did not exit after SIGTERM, killing it.", worker.pid)
+                worker.kill()
+                worker.join()
+        logger.info("All executor processes were stopped.")
@@ -4,6 +4,7 @@ import pprint
 import pandas as pd
 import requests
 import copy
+import threading
 from datetime import datetime
 import latigo.utils
 from latigo.prediction_execution import PredictionExecutionProviderInterface
@@ -72,16 +73,30 @@ def clean_gordo_client_args(raw: dict):
 
 
 class GordoClientPool:
+    """Pool of Gordo clients (one per project).
+
+    Clients might be allocated from several threads at once, so the allocation is guarded by the lock.
+    """
+
     def __init__(self, raw_config: dict):
         self.config = raw_config
         self.client_instances_by_hash: dict = {}
         self.client_instances_by_project: dict = {}
         self.client_auth_session: typing.Optional[requests.Session] = None
+        self._lock = threading.RLock()
 
     def __repr__(self):
         return f"GordoClientPool()"
 
     def allocate_instance(self, project: str):
+        client = self.client_instances_by_project.get(project, None)
+        if client:
+            return client
+
+        with self._lock:
+            return self._allocate_instance(project)
+
+    def _allocate_instance(self, project: str):
         client = self.client_instances_by_project.get(project, None)
         if not client:
             # Patch to all disableing the use of OAuth2Session's when developing locally
@@ -124,8 +139,9 @@ class GordoClientPool:
         self.client_instances_by_project.pop(project_name, None)
 
     def get_auth_session(self, auth_config: dict):
-        if not self.client_auth_session:
-            self.client_auth_session = requests_ms_auth.MsRequestsSession(
-                requests_ms_auth.MsSessionConfig(**auth_config)
-            )
+        with self._lock:
+            if not self.client_auth_session:
+                self.client_auth_session = requests_ms_auth.MsRequestsSession(
+                    requests_ms_auth.MsSessionConfig(**auth_config)
+                )
         return self.client_auth_session
@@ -1,9 +1,11 @@
 import typing
 import logging
+import threading
 import pandas as pd
+from contextlib import contextmanager
 from datetime import datetime
 
-from latigo.types import TimeRange, LatigoSensorTag
+from latigo.types import TIME_SERIES_IDS_META_KEY, TimeRange, LatigoSensorTag
 from latigo.sensor_data import SensorDataProviderInterface
 from latigo.types import SensorDataSpec
 
@@ -32,6 +34,9 @@ def _gordo_to_latigo_tag_list(
 class LatigoDataProvider(GordoBaseDataProvider):
     """
     A GordoBaseDataProvider that wraps Latigo spesific data providers
+
+    Time Series IDs of the tags that were resolved on the data loading are passed to the prediction
+    that is made inside 'collect_time_series_ids' block.
     """
 
     @capture_args
@@ -49,6 +54,9 @@ class LatigoDataProvider(GordoBaseDataProvider):
         if not self.latigo_config:
             raise Exception("No data_provider_config specified")
         self.sensor_data_provider = sensor_data_provider
+        # {id(collected): {tag_name: time_series_id}} of the running 'collect_time_series_ids' blocks
+        self._collectors: typing.Dict[int, typing.Dict[str, str]] = {}
+        self._collectors_lock = threading.Lock()
 
     def load_series(
         self,
@@ -95,10 +103,33 @@ class LatigoDataProvider(GordoBaseDataProvider):
             logger.error(f"No gordo data")
             return
 
+        time_series_ids = sensor_data.meta_data.get(TIME_SERIES_IDS_META_KEY)
+        if time_series_ids:
+            with self._collectors_lock:
+                for collected in self._collectors.values():
+                    collected.update(time_series_ids)
+
         for d in sensor_data.data:
             yield d
         return
 
+    @contextmanager
+    def collect_time_series_ids(self) -> typing.Iterator[typing.Dict[str, str]]:
+        """Collect {tag_name: time_series_id} from the meta data of the sensor data loaded inside the block.
+
+        Gordo client loads the data on its own threads and does not return its meta data with the prediction,
+        so each block gets its own dict. IDs of the tags loaded by concurrent predictions might be there as well,
+        ID of the tag does not depend on the prediction.
+        """
+        collected: typing.Dict[str, str] = {}
+        with self._collectors_lock:
+            self._collectors[id(collected)] = collected
+        try:
+            yield collected
+        finally:
+            with self._collectors_lock:
+                del self._collectors[id(collected)]
+
     def can_handle_tag(self, tag: SensorTag) -> bool:
         if self.sensor_data_provider:
             if self.sensor_data_provider:
@@ -1,5 +1,7 @@
 import logging
+import threading
 import typing
+from time import monotonic
 
 from gordo.client.io import BadGordoRequest
 
@@ -10,8 +12,23 @@ from .misc import expand_gordo_connection_string, expand_gordo_data_provider, ex
 
 logger = logging.getLogger(__name__)
 
+REVISION_CACHE_TIME_TO_LIVE = 60  # in seconds, how long the latest revision of the project is considered as latest
+MAX_CACHED_REVISIONS_PER_PROJECT = 2  # previous revision is kept for the tasks that are still in progress
+MISSING_MACHINE_CACHE_TIME_TO_LIVE = 60  # in seconds, how long the machine that failed to be fetched is not re-fetched
+
 
 class GordoModelInfoProvider(ModelInfoProviderInterface):
+    """Provide models info from Gordo.
+
+    Models (machines) metadata is changed only with the new revision of the project, so all the machines of the
+    revision are fetched once and kept in memory by (project, revision) key.
+    Latest revision of the project is refreshed after "revision_cache_ttl" seconds.
+
+    If all the machines of the revision could not be fetched at once (metadata of some machine is broken),
+    machines of such revision are fetched one by one. Machine that could not be fetched is not re-fetched
+    during "missing_machine_cache_ttl" seconds.
+    """
+
     def _prepare_auth(self):
         self.auth_config = self.config.get("auth")
 
@@ -27,6 +44,16 @@ class GordoModelInfoProvider(ModelInfoProviderInterface):
         )
         self.gordo_pool = GordoClientPool(raw_config=self.config)
 
+        self.revision_cache_ttl = self.config.get("revision_cache_ttl", REVISION_CACHE_TIME_TO_LIVE)
+        self._latest_revisions: typing.Dict[str, typing.Tuple[str, float]] = {}  # {project: (revision, expires_at)}
+        self.missing_machine_cache_ttl = self.config.get(
+            "missing_machine_cache_ttl", MISSING_MACHINE_CACHE_TIME_TO_LIVE
+        )
+        self._machines_by_revision: typing.Dict[typing.Tuple[str, str], typing.Dict[str, Machine]] = {}
+        # {(project, revision, model): expires_at} of the machines that could not be fetched
+        self._missing_machines: typing.Dict[typing.Tuple[str, str, str], float] = {}
+        self._cache_lock = threading.Lock()
+
     def __str__(self):
         return f"GordoModelInfoProvider()"
 
@@ -98,15 +125,12 @@ class GordoModelInfoProvider(ModelInfoProviderInterface):
             logger.exception("Failed machine for project '%s'", project_name)
 
     def get_machine_by_key(
-        self, project_name: str, model_name: str
+        self, project_name: str, model_name: str, revision: typing.Optional[str] = None
     ) -> typing.Optional[Model]:
-        machines = self.get_model_data(
-            projects=[project_name], model_names=[model_name]
-        )
-        if not machines:
-            return None
+        """Get model from the given (or latest if not passed) revision of the project."""
+        revision = revision or self.get_project_latest_revisions(project_name)
+        machine = self._get_machine(project_name=project_name, model_name=model_name, revision=revision)
         model = None
-        machine = machines[0]
         if machine:
             project_name = machine.project_name or "unnamed"
             model_name = machine.name or "unnamed"
@@ -118,9 +142,11 @@ class GordoModelInfoProvider(ModelInfoProviderInterface):
             )
         return model
 
-    def get_spec(self, project_name: str, model_name: str) -> typing.Optional[SensorDataSpec]:
+    def get_spec(
+        self, project_name: str, model_name: str, revision: typing.Optional[str] = None
+    ) -> typing.Optional[SensorDataSpec]:
         model = self.get_machine_by_key(
-            project_name=project_name, model_name=model_name
+            project_name=project_name, model_name=model_name, revision=revision
         )
         if not model:
             return None
@@ -128,16 +154,86 @@ class GordoModelInfoProvider(ModelInfoProviderInterface):
         return spec
 
     def get_project_latest_revisions(self, project_name: str):
-        """Fetch latest revision(version) of the project in Gordo."""
+        """Fetch latest revision(version) of the project in Gordo.
+
+        Revision is cached for "revision_cache_ttl" seconds.
+        """
+        with self._cache_lock:
+            cached = self._latest_revisions.get(project_name)
+        if cached and cached[1] > monotonic():
+            return cached[0]
+
         client = self.gordo_pool.allocate_instance(project_name)
-        return client.get_revisions()["latest"]
+        revision = client.get_revisions()["latest"]
+        with self._cache_lock:
+            self._latest_revisions[project_name] = (revision, monotonic() + self.revision_cache_ttl)
+        return revision
 
     def get_model_training_dates(self, project_name: str, model_name: str, revision: str = None) -> ModelTrainingPeriod:
         """Fetch model training dates from Gordo."""
-        client = self.gordo_pool.allocate_instance(project_name)
-        machines = client._get_machines(revision=revision, machine_names=[model_name])
+        revision = revision or self.get_project_latest_revisions(project_name)
+        machine = self._get_machine(project_name=project_name, model_name=model_name, revision=revision)
+        if not machine:
+            raise ValueError(f"Model '{model_name}' was not found in project '{project_name}' revision '{revision}'.")
 
-        train_end_date = machines[0].dataset.train_end_date
-        train_start_date = machines[0].dataset.train_start_date
+        train_end_date = machine.dataset.train_end_date
+        train_start_date = machine.dataset.train_start_date
 
         return ModelTrainingPeriod(train_start_date=train_start_date, train_end_date=train_end_date)
+
+    def _get_machine(self, project_name: str, model_name: str, revision: str) -> typing.Optional[Machine]:
+        """Get machine of the revision from cache or fetch all the machines of the revision from Gordo."""
+        with self._cache_lock:
+            machines = self._machines_by_revision.get((project_name, revision))
+        if machines is None:
+            machines = self._fetch_revision_machines(project_name, revision)
+
+        missing_key = (project_name, revision, model_name)
+        with self._cache_lock:
+            machine = machines.get(model_name)
+            missing_until = self._missing_machines.get(missing_key)
+        if machine is not None or (missing_until and missing_until > monotonic()):
+            return machine
+
+        # model might be missing if its metadata was not ready when the revision was fetched
+        # or if the revision could not be fetched at once.
+        client = self.gordo_pool.allocate_instance(project_name)
+        fetched = self._fetch_with_known_errors(
+            func=client._get_machines,
+            project_name=project_name,
+            revision=revision,
+            machine_names=[model_name],
+        )
+        with self._cache_lock:
+            if fetched:
+                machine = machines[model_name] = fetched[0]
+                self._missing_machines.pop(missing_key, None)
+            else:
+                self._missing_machines[missing_key] = monotonic() + self.missing_machine_cache_ttl
+        return machine
+
+    def _fetch_revision_machines(self, project_name: str, revision: str) -> typing.Dict[str, Machine]:
+        """Fetch all machines of the project revision from Gordo and put them to the cache."""
+        client = self.gordo_pool.allocate_instance(project_name)
+        fetched = self._fetch_with_known_errors(func=client._get_machines, project_name=project_name, revision=revision)
+        if fetched is None:
+            # known error was logged, machines of the revision will be fetched one by one
+            logger.warning("Models of project '%s' revision '%s' will be fetched one by one.", project_name, revision)
+            fetched = []
+
+        machines = {machine.name: machine for machine in fetched}
+
+        with self._cache_lock:
+            self._machines_by_revision[(project_name, revision)] = machines
+
+            # drop old revisions of the project
+            project_revisions = [key for key in self._machines_by_revision if key[0] == project_name]
+            for key in project_revisions[:-MAX_CACHED_REVISIONS_PER_PROJECT]:
+                del self._machines_by_revision[key]
+            now = monotonic()
+            self._missing_machines = {
+                key: expires_at for key, expires_at in self._missing_machines.items() if expires_at > now
+            }
+
+        logger.info("Fetched %s models of project '%s' revision '%s'.", len(machines), project_name, revision)
+        return machines
@@ -1,8 +1,9 @@
 import logging
-from typing import List
+from typing import Dict, List
 
 from latigo.gordo.gordo_exceptions import NoTagDataInDataLake
 from latigo.log import measure
+from latigo.time_series_api.misc import MODEL_INPUT_OPERATION
 from latigo.types import ModelTrainingPeriod, PredictionDataSetMetadata, Task
 
 from .client_pool import PredictionExecutionProviderInterface, GordoClientPool, PredictionDataSet, TimeRange
@@ -44,12 +45,13 @@ class GordoPredictionExecutionProvider(PredictionExecutionProviderInterface):
         if not client:
             raise Exception(f"No gordo client found for project '{project_name}' in gordo.execute_prediction()")
 
-        try:
-            result = client.predict(start=from_time, end=to_time, targets=[model_name], revision=revision)
-        except KeyError as e:
-            if "not in index" in str(e):  # data error (not some code error): "['GRA-TE -23-0701.PV'] not in index"
-                raise NoTagDataInDataLake(project_name, model_name, from_time, to_time, e)
-            raise
+        with self.config["data_provider"].collect_time_series_ids() as time_series_ids:
+            try:
+                result = client.predict(start=from_time, end=to_time, targets=[model_name], revision=revision)
+            except KeyError as e:
+                if "not in index" in str(e):  # data error (not some code error): "['GRA-TE -23-0701.PV'] not in index"
+                    raise NoTagDataInDataLake(project_name, model_name, from_time, to_time, e)
+                raise
 
         if not result:
             raise Exception("No result in gordo.execute_prediction()")
@@ -57,5 +59,20 @@ class GordoPredictionExecutionProvider(PredictionExecutionProviderInterface):
         if prediction_errors:
             raise Exception("Prediction failed in Gordo with: %s", '; '.join(prediction_errors))
         return PredictionDataSet(
-            meta_data=meta_data, time_range=TimeRange(from_time=from_time, to_time=to_time), data=result
+            meta_data=meta_data,
+            time_range=TimeRange(from_time=from_time, to_time=to_time),
+            data=result,
+            input_time_series_ids=self._get_input_time_series_ids(result, time_series_ids),
         )
+
+    @staticmethod
+    def _get_input_time_series_ids(result: List, time_series_ids: Dict[str, str]) -> Dict[str, str]:
+        """Take Time Series IDs of the input tags that were resolved when the data was loaded for the prediction.
+
+        Return empty dict if IDs of some input tags were not resolved.
+        """
+        df = result[0][1]
+        input_tag_names = [tag_name for operation, tag_name, *_ in df.columns if operation == MODEL_INPUT_OPERATION]
+        if not all(tag_name in time_series_ids for tag_name in input_tag_names):
+            return {}
+        return {tag_name: time_series_ids[tag_name] for tag_name in input_tag_names}
@@ -40,9 +40,11 @@ class ModelInfoProviderInterface:
     def get_model_by_key(self, project_name: str, model_name: str):
         raise NotImplementedError()
 
-    def get_spec(self, project_name: str, model_name: str) -> typing.Optional[SensorDataSpec]:
+    def get_spec(
+        self, project_name: str, model_name: str, revision: typing.Optional[str] = None
+    ) -> typing.Optional[SensorDataSpec]:
         """
-        Return a sensor data spec for given project name and model name
+        Return a sensor data spec for given project name and model name (of the latest revision if not passed)
         """
         raise NotImplementedError()
 
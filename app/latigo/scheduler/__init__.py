@@ -2,6 +2,7 @@ import sys
 import logging
 import pandas as pd
 import datetime
+import typing
 
 import pylogctx
 
@@ -13,7 +14,7 @@ from gordo import __version__ as gordo_version
 from requests_ms_auth import __version__ as auth_version
 from latigo.model_metadata_info import model_metadata_info_factory
 from latigo.types import Task
-from latigo.task_queue import task_queue_sender_factory
+from latigo.task_queue import DeliveryReport, task_queue_sender_factory
 from latigo.model_info import model_info_provider_factory
 from latigo.clock import OnTheClockTimer
 from latigo.utils import human_delta
@@ -112,6 +113,9 @@ class Scheduler:
             interval=self.continuous_prediction_interval,
         )
         self.run_at_once = self.scheduler_config.get("run_at_once", False)
+        self.put_tasks_retries = self.scheduler_config.get("put_tasks_retries", 2)
+        if not isinstance(self.put_tasks_retries, int) or self.put_tasks_retries < 0:
+            self._fail(f"'put_tasks_retries' should be a non-negative integer, got '{self.put_tasks_retries}'")
 
     def print_summary(self):
         now = datetime.datetime.now(utc)
@@ -130,9 +134,6 @@ class Scheduler:
         )
 
     def perform_prediction_step(self):
-        stats_projects_ok = set()
-        stats_models_ok = set()
-
         stats_start_time_utc = datetime.datetime.now(utc)
 
         # Use UTC time cause Queue will ignore timezone.
@@ -147,24 +148,42 @@ class Scheduler:
 
         model_names_by_project = self.model_info_provider.get_all_model_names_by_project(projects=projects)
 
-        for project_name, models in model_names_by_project.items():
-            for model_name in models:
-                task = Task(
-                    project_name=project_name,
-                    model_name=model_name,
-                    from_time=prediction_start_time_utc,
-                    to_time=prediction_end_time_utc,
-                )
-                with pylogctx.context(task=task):
-                    self.task_queue.put_task(task)
-
-                    stats_projects_ok.add(project_name)
-                    stats_models_ok.add(model_name)
+        tasks = [
+            Task(
+                project_name=project_name,
+                model_name=model_name,
+                from_time=prediction_start_time_utc,
+                to_time=prediction_end_time_utc,
+            )
+            for project_name, models in model_names_by_project.items()
+            for model_name in models
+        ]
+        report = self.put_tasks(tasks)
+
+        failed = {(task.project_name, task.model_name) for task in report.failed_tasks}
+        for task in report.failed_tasks:
+            with pylogctx.context(task=task):
+                logger.error(f"[Task was not scheduled] Model '{task.model_name}' of project '{task.project_name}'")
+        stats_projects_ok = {t.project_name for t in tasks if (t.project_name, t.model_name) not in failed}
+        stats_models_ok = {t.model_name for t in tasks if (t.project_name, t.model_name) not in failed}
 
         logger.info(
             f"Scheduled {len(stats_models_ok)} models over {len(stats_projects_ok)} projects."
         )
 
+    def put_tasks(self, tasks: typing.List[Task]) -> DeliveryReport:
+        """Put the tasks to the queue, failed ones are retried up to "put_tasks_retries" times."""
+        report = self.task_queue.put_tasks(tasks)
+        for attempt in range(1, self.put_tasks_retries + 1):
+            if not report.failed_tasks:
+                break
+            logger.warning(f"{report.failed} tasks were not delivered, retry {attempt} of {self.put_tasks_retries}")
+            retry_report = self.task_queue.put_tasks(report.failed_tasks)
+            report = DeliveryReport(
+                delivered=report.delivered + retry_report.delivered, failed_tasks=retry_report.failed_tasks
+            )
+        return report
+
     def run(self):
         """Start the main loop."""
         logger.info("Scheduler started processing")
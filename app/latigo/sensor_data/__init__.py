@@ -18,6 +18,12 @@ class SensorDataProviderInterface:
         """
         raise NotImplementedError()
 
+    def get_tags_without_data(self, tag_names: typing.Iterable[str]) -> typing.List[str]:
+        """
+        return the tags that recently did not exist in the data source, so the prediction with them could be skipped
+        """
+        return []
+
 
 def sensor_data_provider_factory(sensor_data_provider_config):
     sensor_data_provider_type = sensor_data_provider_config.get("type", None)
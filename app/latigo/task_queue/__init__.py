@@ -1,27 +1,62 @@
+import json
 import logging
-import pickle
+import struct
 import traceback
 import typing
+from datetime import datetime, timedelta, timezone
 
 from latigo.types import Task
 
 logger = logging.getLogger(__name__)
 
+# Kafka header with the format of the task message. Messages without it are JSON (format of the previous versions).
+TASK_FORMAT_HEADER = "task-format"
+TASK_FORMAT_JSON = "json"
+TASK_FORMAT_BINARY = "binary"
+TASK_FORMATS = (TASK_FORMAT_JSON, TASK_FORMAT_BINARY)
 
-def deserialize_task(task_bytes, mode="json") -> typing.Optional[Task]:
+# Binary task: version, "from_time" and "to_time" in epoch milliseconds, lengths of the project and model names.
+# UTF-8 names follow the head. Version should be increased on any change of the layout.
+BINARY_TASK_VERSION = 1
+_BINARY_TASK_HEAD = struct.Struct(">BqqHH")
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def serialize_task(task: Task, task_format: str = TASK_FORMAT_JSON) -> bytes:
+    """Serialize the task to bytes of the format.
+
+    Raise:
+        - ValueError: if format is unknown.
+    """
+    if task_format == TASK_FORMAT_JSON:
+        return task.to_json().encode()
+    if task_format == TASK_FORMAT_BINARY:
+        project_name = task.project_name.encode()
+        model_name = task.model_name.encode()
+        head = _BINARY_TASK_HEAD.pack(
+            BINARY_TASK_VERSION,
+            _to_epoch_ms(task.from_time),
+            _to_epoch_ms(task.to_time),
+            len(project_name),
+            len(model_name),
+        )
+        return head + project_name + model_name
+    raise ValueError(f"'{task_format}' is not valid task format, should be one of {TASK_FORMATS}")
+
+
+def deserialize_task(task_bytes, task_format: str = TASK_FORMAT_JSON) -> typing.Optional[Task]:
     """
-    Deserialize a task from bytes
+    Deserialize a task from bytes of the format
     """
     task = None
-    if mode == "pickle":
+    if task_format == TASK_FORMAT_BINARY:
         try:
-            task = pickle.loads(task_bytes)
-        except pickle.UnpicklingError as e:
+            task = _decode_binary_task(task_bytes)
+        except Exception as e:
             logger.error(
-                f"Could not deserialize task from pickle of size {len(task_bytes)}bytes: {e}"
+                f"Could not deserialize binary task of size {len(task_bytes)}bytes: '{task_bytes}', error:'{e}'"
             )
-            traceback.print_exc()
-    else:
+    elif task_format == TASK_FORMAT_JSON:
         try:
             # Rely on dataclass_json
             task = Task.from_json(task_bytes)
@@ -30,14 +65,105 @@ def deserialize_task(task_bytes, mode="json") -> typing.Optional[Task]:
                 f"Could not deserialize task from json of size {len(task_bytes)}bytes: '{task_bytes}', error:'{e}'"
             )
             traceback.print_exc()
+    else:
+        logger.error(f"Could not deserialize task of unknown format '{task_format}': '{task_bytes}'")
     return task
 
 
+def deserialize_tasks(
+    tasks_bytes: typing.List[bytes], task_formats: typing.Optional[typing.List[str]] = None
+) -> typing.List[typing.Optional[Task]]:
+    """Deserialize the batch of tasks. JSON tasks are parsed with one call.
+
+    If JSON tasks could not be parsed at once, they are deserialized one by one.
+
+    Args:
+        - tasks_bytes: serialized tasks;
+        - task_formats: format of each task, all of them are JSON if None.
+
+    Return:
+        tasks in the same order as their bytes, None for the ones that could not be deserialized.
+    """
+    if task_formats is None:
+        task_formats = [TASK_FORMAT_JSON] * len(tasks_bytes)
+    tasks: typing.List[typing.Optional[Task]] = []
+    json_indexes = []
+    for i, (task_bytes, task_format) in enumerate(zip(tasks_bytes, task_formats)):
+        if task_format == TASK_FORMAT_JSON:
+            json_indexes.append(i)
+            tasks.append(None)
+        else:
+            tasks.append(deserialize_task(task_bytes, task_format))
+    if not json_indexes:
+        return tasks
+
+    json_bytes = [tasks_bytes[i] for i in json_indexes]
+    try:
+        tasks_dicts = json.loads(b"[" + b",".join(json_bytes) + b"]")
+        json_tasks = [Task.from_dict(task_dict) for task_dict in tasks_dicts]
+    except Exception as e:
+        logger.warning(f"Could not deserialize batch of {len(json_bytes)} json tasks at once, error:'{e}'")
+        json_tasks = [deserialize_task(task_bytes) for task_bytes in json_bytes]
+    for i, task in zip(json_indexes, json_tasks):
+        tasks[i] = task
+    return tasks
+
+
+def _decode_binary_task(task_bytes: bytes) -> Task:
+    version, from_ms, to_ms, project_name_length, model_name_length = _BINARY_TASK_HEAD.unpack_from(task_bytes)
+    if version != BINARY_TASK_VERSION:
+        raise ValueError(f"Binary task version {version} is not supported")
+    model_name_start = _BINARY_TASK_HEAD.size + project_name_length
+    if len(task_bytes) != model_name_start + model_name_length:
+        raise ValueError(f"Binary task has size {len(task_bytes)}, but its head expects other one")
+    return Task(
+        project_name=task_bytes[_BINARY_TASK_HEAD.size : model_name_start].decode(),
+        model_name=task_bytes[model_name_start:].decode(),
+        from_time=_EPOCH + timedelta(milliseconds=from_ms),
+        to_time=_EPOCH + timedelta(milliseconds=to_ms),
+    )
+
+
+def _to_epoch_ms(time: datetime) -> int:
+    """Convert the time to epoch milliseconds. Time without timezone is treated as UTC."""
+    if time.tzinfo is None:
+        time = time.replace(tzinfo=timezone.utc)
+    return (time - _EPOCH) // timedelta(milliseconds=1)
+
+
+class DeliveryReport(typing.NamedTuple):
+    """Result of putting the tasks to the queue."""
+
+    delivered: int
+    failed_tasks: typing.List[Task]
+
+    @property
+    def failed(self) -> int:
+        return len(self.failed_tasks)
+
+
 class TaskQueueSenderInterface:
     def put_task(self, task: Task):
         """Put one task on the queue."""
         raise NotImplementedError()
 
+    def put_tasks(self, tasks: typing.Iterable[Task]) -> DeliveryReport:
+        """Put the tasks on the queue and return amount of the delivered ones and the tasks that failed.
+
+        Default implementation puts the tasks one by one.
+        """
+        delivered = 0
+        failed_tasks = []
+        for task in tasks:
+            try:
+                self.put_task(task)
+            except Exception:
+                logger.exception(f"Could not put the task {task}")
+                failed_tasks.append(task)
+            else:
+                delivered += 1
+        return DeliveryReport(delivered=delivered, failed_tasks=failed_tasks)
+
     def close(self):
         """Perform any required cleanup."""
 
@@ -49,6 +175,30 @@ class TaskQueueReceiverInterface:
         """
         raise NotImplementedError()
 
+    def get_tasks(self, max_n: int, timeout: float) -> typing.List[Task]:
+        """Return up to "max_n" tasks that were received during "timeout" seconds.
+
+        Default implementation returns at most one task received by "get_task".
+        """
+        task = self.get_task()
+        return [task] if task else []
+
+    def task_done(self, task: Task):
+        """Mark the received task as processed, so it's not received once more after the restart."""
+
+    def retry_task(self, task: Task):
+        """Return the task that failed with a temporary error to the queue, so it's received once more.
+
+        Default implementation marks the task as done.
+        """
+        self.task_done(task)
+
+    def set_max_in_flight(self, max_in_flight: int):
+        """Set the amount of the received tasks that are processed at once by the receiver's owner.
+
+        Queue might stop fetching new tasks while there are so many tasks that are not done yet.
+        """
+
     def close(self):
         """Perform any required cleanup."""
 
@@ -1,19 +1,43 @@
 import json
 import logging
 import pprint
+import threading
 import typing
-from time import sleep
+from collections import deque
+from time import monotonic
 
-from confluent_kafka import Producer, Consumer, KafkaException, KafkaError
+from confluent_kafka import Producer, Consumer, KafkaException, KafkaError, TopicPartition
 
 from latigo.log import measure
-from latigo.task_queue import deserialize_task, TaskQueueSenderInterface, TaskQueueReceiverInterface
+from latigo.task_queue import (
+    TASK_FORMAT_HEADER,
+    TASK_FORMAT_JSON,
+    TASK_FORMATS,
+    DeliveryReport,
+    TaskQueueReceiverInterface,
+    TaskQueueSenderInterface,
+    deserialize_tasks,
+    serialize_task,
+)
 from latigo.types import Task
 from latigo.utils import parse_event_hub_connection_string
 
 logger = logging.getLogger(__name__)
 logger_confluent = logging.getLogger(__name__ + ".confluent")
 
+LINGER_MS = 50  # how long producer waits for the next messages to send them in one batch
+COMPRESSION_TYPE = "gzip"  # compression of the batches of messages
+FLUSH_TIMEOUT = 60  # in seconds, how long the delivery of the tasks is waited for, the rest of them are failed
+PREFETCH_SIZE = 1  # max amount of the messages that are consumed from Kafka at once
+POLL_TIMEOUT = 1  # in seconds, how long Kafka is polled for the task while tasks are coming
+MAX_IDLE_POLL_TIMEOUT = 60  # in seconds, ceiling of the poll timeout that grows while the queue is empty
+IDLE_POLL_TIMEOUT_FACTOR = 2  # poll timeout is multiplied by it after each empty poll
+KEEPALIVE_INTERVAL = 5  # in seconds, how often Kafka is polled while the partitions are paused
+COMMIT_INTERVAL = 5  # in seconds, how often offsets of the processed tasks are committed in manual-commit mode
+MAX_TASK_RETRIES = 3  # how many times the task that failed with a temporary error is received once more
+
+PartitionKey = typing.Tuple[str, int]  # (topic, partition)
+
 
 def stats_callback(stats_json_str):
     stats_json = json.loads(stats_json_str)
@@ -56,7 +80,79 @@ def prepare_kafka_config(
     # fmt: on
 
 
+class OffsetTracker:
+    """Offsets of the received messages per partition that are committed only after their tasks are done.
+
+    Committed offset of the partition is the offset of its earliest message that is not done yet (or the one after
+    the last received message), so only contiguous completed messages are committed. Messages of the tasks
+    that were in flight are received once more after the restart or re-balancing.
+    """
+
+    def __init__(self):
+        self._pending: typing.Dict[PartitionKey, typing.Set[int]] = {}  # offsets of the messages not done yet
+        self._next: typing.Dict[PartitionKey, int] = {}  # offset after the last received message
+        self._committed: typing.Dict[PartitionKey, int] = {}
+        self._lock = threading.Lock()
+
+    def received(self, partition: PartitionKey, offset: int):
+        with self._lock:
+            self._pending.setdefault(partition, set()).add(offset)
+            self._next[partition] = max(self._next.get(partition, 0), offset + 1)
+
+    def done(self, partition: PartitionKey, offset: int):
+        with self._lock:
+            pending = self._pending.get(partition)
+            if pending is not None:  # partition might be already revoked
+                pending.discard(offset)
+
+    def pop_offsets_to_commit(
+        self, partitions: typing.Optional[typing.Iterable[PartitionKey]] = None
+    ) -> typing.Dict[PartitionKey, int]:
+        """Return {partition: offset to commit} of the partitions that advanced after the previous call."""
+        with self._lock:
+            offsets = {}
+            for partition in self._next if partitions is None else partitions:
+                if partition not in self._next:
+                    continue
+                pending = self._pending[partition]
+                offset = min(pending) if pending else self._next[partition]
+                if offset != self._committed.get(partition):
+                    offsets[partition] = self._committed[partition] = offset
+            return offsets
+
+    def uncommit(self, partitions: typing.Iterable[PartitionKey]):
+        """Make the offsets of the partitions to be returned by the next "pop_offsets_to_commit" (commit failed)."""
+        with self._lock:
+            for partition in partitions:
+                self._committed.pop(partition, None)
+
+    def forget(self, partitions: typing.Iterable[PartitionKey]):
+        """Stop tracking the partitions, for example after they were revoked."""
+        with self._lock:
+            for partition in partitions:
+                self._pending.pop(partition, None)
+                self._next.pop(partition, None)
+                self._committed.pop(partition, None)
+
+
+def get_task_format(msg) -> str:
+    """Return format of the task from the message header, messages without the header are JSON."""
+    for key, value in msg.headers() or ():
+        if key == TASK_FORMAT_HEADER:
+            return value.decode() if isinstance(value, bytes) else value
+    return TASK_FORMAT_JSON
+
+
 class KafkaTaskQueueSender(TaskQueueSenderInterface):
+    """Send tasks to Kafka topic.
+
+    Tasks are serialized in "task_format" that is put to the message header, so receivers could read messages
+    of any format. "json" (default) is understood by the receivers of the previous versions, so "binary" should be
+    enabled only after all the executors were updated.
+
+    Producer sends messages in compressed batches ("linger.ms" and "compression.type" of the config).
+    """
+
     def __init__(self, config: dict):
         # Producer configuration
         # See https://github.com/edenhill/librdkafka/blob/master/CONFIGURATION.md
@@ -66,6 +162,16 @@ class KafkaTaskQueueSender(TaskQueueSenderInterface):
             raise Exception(f"No config parsed: {err}")
         if not self.topic:
             raise Exception("No topic configured: {err}")
+        self.task_format = config.get("task_format", TASK_FORMAT_JSON)
+        if self.task_format not in TASK_FORMATS:
+            raise ValueError(f"'{self.task_format}' is not valid task format, should be one of {TASK_FORMATS}")
+        self._headers = {TASK_FORMAT_HEADER: self.task_format.encode()}
+        self.flush_timeout = config.get("flush_timeout", FLUSH_TIMEOUT)
+        self.config = {
+            **self.config,
+            "linger.ms": config.get("linger.ms", LINGER_MS),
+            "compression.type": config.get("compression.type", COMPRESSION_TYPE),
+        }
 
         # Create Producer instance
         self.producer = Producer(self.config)
@@ -83,12 +189,57 @@ class KafkaTaskQueueSender(TaskQueueSenderInterface):
 
     def put_task(self, task: Task):
         """Put one task to the queue."""
-        self.producer.produce(self.topic, task.to_json(), on_delivery=self._delivery_callback)
+        self.producer.produce(
+            self.topic,
+            serialize_task(task, self.task_format),
+            headers=self._headers,
+            on_delivery=self._delivery_callback,
+        )
 
         # Ensure local queue is not overloaded, see this issue for details:
         # https://github.com/confluentinc/confluent-kafka-python/issues/16
         self.producer.poll(0)
 
+    def put_tasks(self, tasks: typing.Iterable[Task]) -> DeliveryReport:
+        """Produce the tasks and wait once till all of them are delivered.
+
+        Tasks which delivery failed or was not confirmed during "flush_timeout" seconds are returned as failed.
+        """
+        pending: typing.Dict[int, Task] = {}  # {id(task): task} of the tasks without delivery report
+        failed_tasks: typing.List[Task] = []
+        delivered = 0
+
+        def make_delivery_callback(task: Task) -> typing.Callable:
+            def on_delivery(err, msg):
+                nonlocal delivered
+                pending.pop(id(task), None)
+                if err:
+                    self._delivery_callback(err, msg)
+                    failed_tasks.append(task)
+                else:
+                    delivered += 1
+
+            return on_delivery
+
+        for task in tasks:
+            pending[id(task)] = task
+            value = serialize_task(task, self.task_format)
+            while True:
+                try:
+                    self.producer.produce(
+                        self.topic, value, headers=self._headers, on_delivery=make_delivery_callback(task)
+                    )
+                    break
+                except BufferError:
+                    # local queue of the producer is full, wait till some messages are delivered
+                    self.producer.poll(1)
+
+        not_flushed = self.producer.flush(self.flush_timeout)
+        if not_flushed:
+            logger.error(f"Delivery of {not_flushed} tasks was not confirmed during {self.flush_timeout} seconds")
+        failed_tasks.extend(pending.values())
+        return DeliveryReport(delivered=delivered, failed_tasks=failed_tasks)
+
     @staticmethod
     def _delivery_callback(err, msg):
         """Log out the delivery notification."""
@@ -97,6 +248,30 @@ class KafkaTaskQueueSender(TaskQueueSenderInterface):
 
 
 class KafkaTaskQueueReceiver(TaskQueueReceiverInterface):
+    """Receive tasks from Kafka topic.
+
+    Messages are consumed in batches of up to "prefetch_size" messages and deserialized at once.
+    Tasks that were not requested yet are kept in the local prefetch buffer.
+
+    While the queue is empty "get_task" polls Kafka longer and longer: its timeout is doubled after each empty poll
+    from "poll_timeout" till "max_idle_poll_timeout". Long poll returns as soon as the message arrives,
+    and timeout is reset to "poll_timeout" after the task is received.
+
+    If "pause_when_busy" is set, the assigned partitions are paused while the amount of the tasks in flight
+    (received but not marked with "task_done", including prefetched ones) reaches "set_max_in_flight" value.
+    Background thread polls Kafka every "keepalive_interval" seconds while they are paused, so the consumer
+    stays in the group during long tasks and "max.poll.interval.ms" could be short. Partitions are resumed
+    when one of the tasks is done.
+
+    In manual-commit mode ("manual_commit" config) auto commit is disabled and offset of the message is committed
+    only after its task was marked with "task_done" (see "OffsetTracker"). Commits are made in batches
+    every "commit_interval" seconds, on re-balancing and on closing. Offsets of the failed asynchronous commits
+    are committed once more with the next commit (see "on_commit_callback").
+
+    Task passed to "retry_task" is put back to the prefetch buffer (its offset stays not committed)
+    and is marked as done after "max_task_retries" retries.
+    """
+
     def __init__(self, config: dict):
         # Consumer configuration
         # See https://github.com/edenhill/librdkafka/blob/master/CONFIGURATION.md
@@ -105,6 +280,48 @@ class KafkaTaskQueueReceiver(TaskQueueReceiverInterface):
             raise Exception(f"No config parsed: {err}")
         if not self.topic:
             raise Exception("No topic configured: {err}")
+        self.prefetch_size = config.get("prefetch_size", PREFETCH_SIZE)
+        if not isinstance(self.prefetch_size, int) or self.prefetch_size < 1:
+            raise ValueError(f"'prefetch_size' should be a positive integer, got '{self.prefetch_size}'")
+        self.poll_timeout = config.get("poll_timeout", POLL_TIMEOUT)
+        self.max_idle_poll_timeout = config.get("max_idle_poll_timeout", MAX_IDLE_POLL_TIMEOUT)
+        for name, value in (("poll_timeout", self.poll_timeout), ("max_idle_poll_timeout", self.max_idle_poll_timeout)):
+            if not isinstance(value, (int, float)) or value <= 0:
+                raise ValueError(f"'{name}' should be a positive number, got '{value}'")
+        self._current_poll_timeout = self.poll_timeout
+        self._prefetched: typing.Deque[Task] = deque()
+        # buffer is shared by the receiving threads, its lock is never held while Kafka is polled,
+        # so "retry_task" and re-balancing callbacks do not wait for the long poll
+        self._prefetched_lock = threading.Lock()
+        # Kafka is polled by one thread at a time, the lock is taken before the buffer lock (never after it)
+        self._poll_lock = threading.Lock()
+
+        self.manual_commit = bool(config.get("manual_commit", False))
+        self.commit_interval = config.get("commit_interval", COMMIT_INTERVAL)
+        if not isinstance(self.commit_interval, (int, float)) or self.commit_interval < 0:
+            raise ValueError(f"'commit_interval' should be a non-negative number, got '{self.commit_interval}'")
+        if self.manual_commit:
+            self.config["enable.auto.commit"] = False
+            self.config["on_commit"] = self.on_commit_callback
+        self._offsets = OffsetTracker()
+        self._task_offsets: typing.Dict[int, typing.Tuple[Task, PartitionKey, int]] = {}  # {id(task): ...}
+        self._task_offsets_lock = threading.Lock()
+        self._committed_at = monotonic()
+        self.max_task_retries = config.get("max_task_retries", MAX_TASK_RETRIES)
+        if not isinstance(self.max_task_retries, int) or self.max_task_retries < 0:
+            raise ValueError(f"'max_task_retries' should be a non-negative integer, got '{self.max_task_retries}'")
+        self._task_retries: typing.Dict[int, int] = {}  # {id(task): amount of retries}, guarded by offsets lock
+
+        self.pause_when_busy = bool(config.get("pause_when_busy", False))
+        self.keepalive_interval = config.get("keepalive_interval", KEEPALIVE_INTERVAL)
+        if not isinstance(self.keepalive_interval, (int, float)) or self.keepalive_interval <= 0:
+            raise ValueError(f"'keepalive_interval' should be a positive number, got '{self.keepalive_interval}'")
+        self.max_in_flight = 0  # see "set_max_in_flight", 0 - partitions are not paused
+        self._in_flight = 0  # tasks that were returned by "get_tasks" and are not done yet
+        self._paused = False
+        self._flow_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._keepalive_thread: typing.Optional[threading.Thread] = None
         # Create Consumer instance
         self.consumer = Consumer(self.config)
         # Subscribe to topics
@@ -114,8 +331,12 @@ class KafkaTaskQueueReceiver(TaskQueueReceiverInterface):
         self.close()
 
     def close(self):
-        """Close the underlined client."""
+        """Commit offsets of the processed tasks and close the underlined client."""
+        self._closed.set()
+        if self._keepalive_thread and self._keepalive_thread is not threading.current_thread():
+            self._keepalive_thread.join()
         try:
+            self._commit(asynchronous=False)
             self.consumer.close()
             logger.info("Kafka consumer was closed.")
         except RuntimeError:
@@ -134,8 +355,7 @@ class KafkaTaskQueueReceiver(TaskQueueReceiverInterface):
         )
         self.consumer.subscribe([self.topic], on_assign=self.on_assignment_callback, on_revoke=self.on_revoke_callback)
 
-    @staticmethod
-    def on_assignment_callback(consumer, partitions: typing.List):
+    def on_assignment_callback(self, consumer, partitions: typing.List):
         """Callback for the subscription call.
 
         Notes:
@@ -146,9 +366,9 @@ class KafkaTaskQueueReceiver(TaskQueueReceiverInterface):
             logger.warning("[Empty subscription].")
         else:
             logger.info(f"[Subscribed successfully]: partitions - {partitions}.")
+        self._offsets.forget((partition.topic, partition.partition) for partition in partitions)
 
-    @staticmethod
-    def on_revoke_callback(consumer, partitions):
+    def on_revoke_callback(self, consumer, partitions):
         """Callback for the subscription call.
 
         Note:
@@ -159,68 +379,250 @@ class KafkaTaskQueueReceiver(TaskQueueReceiverInterface):
             f"[REVOKED subscription(s)] for partition(s) - {partitions}. "
             "If another consumer will unsubscribe - subscription will be renewed automatically."
         )
+        if not self.manual_commit:
+            return
+
+        # tasks of the revoked partitions will be received by other consumer
+        revoked = {(partition.topic, partition.partition) for partition in partitions}
+        self._commit(asynchronous=False, partitions=revoked)
+        self._offsets.forget(revoked)
+        with self._task_offsets_lock:
+            revoked_tasks = {key for key, (_, partition, _) in self._task_offsets.items() if partition in revoked}
+            for key in revoked_tasks:
+                del self._task_offsets[key]
+                self._task_retries.pop(key, None)
+        with self._prefetched_lock:
+            self._prefetched = deque(task for task in self._prefetched if id(task) not in revoked_tasks)
+
+    def on_commit_callback(self, err, partitions: typing.List):
+        """Callback of the offset commits, it's called by "consume" when the asynchronous commit is finished.
+
+        Offsets of the partitions that failed to be committed are committed with the next commit,
+        till then their tasks would be received once more after the restart or re-balancing.
+        """
+        failed = [(partition.topic, partition.partition) for partition in partitions if err or partition.error]
+        if failed:
+            self._offsets.uncommit(failed)
+            logger.warning(f"Could not commit offsets of the partitions {failed}: {err}")
 
-    def _receive_event(self, timeout=1) -> typing.Optional[bytes]:
+    def _receive_events(self, num_messages: int, timeout: float = 1) -> typing.List:
+        """Consume up to "num_messages" messages with one call and return the proper ones."""
         try:
-            logger.debug("Start polling the message from queue...")
-            msg = self.consumer.poll(timeout=timeout)
-            logger.debug("Pooling was ended, checking returned data...")
+            logger.debug("Start consuming up to %s messages from queue...", num_messages)
+            messages = self.consumer.consume(num_messages=num_messages, timeout=timeout)
+            logger.debug("Consuming was ended, checking returned data...")
         except Exception as e:
-            logger.warning(f"Error polling: {e}")
-            return None
-
-        if msg is None:
-            logger.info("Polling timed out after %s sec. No queue message was received.", timeout)
-            return None
-        if msg.error():
-            # Error or event
-            if msg.error().code() == KafkaError._PARTITION_EOF:
-                # End of partition event
-                logger.info(
-                    f"{msg.topic()} [msg.partition()] reached end at offset {msg.offset()}"
+            logger.warning(f"Error consuming: {e}")
+            return []
+
+        if not messages:
+            if timeout:
+                logger.info("Polling timed out after %s sec. No queue message was received.", timeout)
+            return []
+        return [msg for msg in messages if self._is_proper_message(msg, timeout)]
+
+    def _is_proper_message(self, msg, timeout: float) -> bool:
+        """Log the error or event the message represents, if any."""
+        if not msg.error():
+            return True
+
+        if msg.error().code() == KafkaError._PARTITION_EOF:
+            # End of partition event
+            logger.info(
+                f"{msg.topic()} [msg.partition()] reached end at offset {msg.offset()}"
+            )
+        else:
+            # Error
+            kafka_error = msg.error()
+            ke = KafkaException(kafka_error)
+
+            if kafka_error.code() in [KafkaError._TIMED_OUT_QUEUE, KafkaError._TIMED_OUT]:
+                # ordinary error messages when no message was received.
+                logger.warning(
+                    f"[TIMED_OUT errors] no messages were consumed throughout timeout - {timeout} sec: {ke}"
                 )
+            elif kafka_error.code() == KafkaError._TRANSPORT:
+                # when 'transport' was broken. Usually it'll be renewed automatically, but not all the time.
+                logger.error(f"[Broker transport failure] Calling to re-subscribe. Error: {ke}")
+
+                self.subscribe_to_topic()  # This is not 100% needed but it's better to have it here for now.
             else:
-                # Error
-                kafka_error = msg.error()
                 ke = KafkaException(kafka_error)
+                logger.error(f"Error occurred: {ke}")
+        return False
 
-                if kafka_error.code() in [KafkaError._TIMED_OUT_QUEUE, KafkaError._TIMED_OUT]:
-                    # ordinary error messages when no message was received.
-                    logger.warning(
-                        f"[TIMED_OUT errors] no messages were consumed throughout timeout - {timeout} sec: {ke}"
-                    )
-                elif kafka_error.code() == KafkaError._TRANSPORT:
-                    # when 'transport' was broken. Usually it'll be renewed automatically, but not all the time.
-                    logger.error(f"[Broker transport failure] Calling to re-subscribe. Error: {ke}")
-
-                    self.subscribe_to_topic()  # This is not 100% needed but it's better to have it here for now.
-                else:
-                    ke = KafkaException(kafka_error)
-                    logger.error(f"Error occurred: {ke}")
-            return None
-        else:
-            # Proper message
-            return msg.value()
+    @measure("get_task")
+    def get_task(self) -> typing.Optional[Task]:
+        """Poll queue for the task with the timeout that grows while the queue is empty."""
+        timeout = self._current_poll_timeout
+        tasks = self.get_tasks(max_n=1, timeout=timeout)
+        if tasks:
+            self._current_poll_timeout = self.poll_timeout
+            return tasks[0]
+
+        self._current_poll_timeout = min(timeout * IDLE_POLL_TIMEOUT_FACTOR, self.max_idle_poll_timeout)
+        logger.info("No tasks were received. Next poll timeout - %s seconds.", self._current_poll_timeout)
+        return None
+
+    def get_tasks(self, max_n: int, timeout: float) -> typing.List[Task]:
+        """Return up to "max_n" tasks from the prefetch buffer or consume them from Kafka during "timeout" seconds.
+
+        Kafka is polled for one message during the time left, then the messages that were already fetched
+        are drained without waiting up to "prefetch_size" (or "max_n") messages in total.
+        The tasks that are not returned stay in the buffer.
+        """
+        tasks: typing.List[Task] = []
+        deadline = monotonic() + timeout
+        while True:
+            with self._prefetched_lock:
+                while self._prefetched and len(tasks) < max_n:
+                    tasks.append(self._prefetched.popleft())
+            time_left = deadline - monotonic()
+            if tasks or time_left <= 0:
+                break
+            if not self._poll_lock.acquire(timeout=time_left):
+                continue
+
+            try:
+                if not self._prefetched:  # tasks might be prefetched by other thread while this one waited
+                    messages = self._receive_events(num_messages=1, timeout=time_left)
+                    drain_size = max(max_n, self.prefetch_size) - 1
+                    if messages and drain_size:
+                        messages += self._receive_events(num_messages=drain_size, timeout=0)
+                    with self._prefetched_lock:
+                        self._prefetch(messages)
+            finally:
+                self._poll_lock.release()
+            self._commit_if_due()
+
+        with self._flow_lock:
+            self._in_flight += len(tasks)
+        self._update_flow()
+        return tasks
+
+    def task_done(self, task: Task):
+        """Mark the task as processed, so offset of its message could be committed in manual-commit mode.
+
+        Paused partitions are resumed, if the receiver is not busy anymore.
+        """
+        with self._flow_lock:
+            self._in_flight = max(self._in_flight - 1, 0)
+        self._update_flow()
+        with self._task_offsets_lock:
+            self._task_retries.pop(id(task), None)
+            if not self.manual_commit:
+                return
+            _, partition, offset = self._task_offsets.pop(id(task), (None, None, None))
+        if partition is not None:
+            self._offsets.done(partition, offset)
+        self._commit_if_due()
+
+    def retry_task(self, task: Task):
+        """Put the task back to the prefetch buffer, so it's received once more and its offset is not committed.
+
+        Task is marked as done if it was already retried "max_task_retries" times.
+        """
+        with self._task_offsets_lock:
+            retries = self._task_retries.get(id(task), 0)
+            if retries < self.max_task_retries:
+                self._task_retries[id(task)] = retries + 1
+        if retries >= self.max_task_retries:
+            logger.error(f"Task failed after {retries} retries, it will not be retried anymore: {task}")
+            self.task_done(task)
+            return
+
+        logger.warning(f"Task will be retried ({retries + 1} of {self.max_task_retries}): {task}")
+        with self._flow_lock:
+            self._in_flight = max(self._in_flight - 1, 0)
+        with self._prefetched_lock:
+            self._prefetched.append(task)
+        self._update_flow()
+
+    def set_max_in_flight(self, max_in_flight: int):
+        """Set the amount of the tasks in flight at which the partitions are paused (if "pause_when_busy" is set)."""
+        self.max_in_flight = max_in_flight
+        if self.pause_when_busy and max_in_flight and not self._keepalive_thread:
+            self._keepalive_thread = threading.Thread(
+                target=self._keep_alive, name="latigo-kafka-keepalive", daemon=True
+            )
+            self._keepalive_thread.start()
+
+    def _update_flow(self):
+        """Pause the assigned partitions if the receiver is busy and resume them if it's not."""
+        if not self.pause_when_busy or not self.max_in_flight:
+            return
+        with self._flow_lock:
+            in_flight = self._in_flight + len(self._prefetched)
+            is_busy = in_flight >= self.max_in_flight
+            if is_busy == self._paused:
+                return
+            self._paused = is_busy
+            partitions = self.consumer.assignment()
+            if is_busy:
+                self.consumer.pause(partitions)
+            else:
+                self.consumer.resume(partitions)
+        logger.info(f"Partitions were {'paused' if is_busy else 'resumed'}, {in_flight} tasks are in flight.")
 
-    def _receive_event_with_backoff(self, backoff_sec=60) -> typing.Optional[Task]:
-        """Poll queue for the Message with passed timeout.
+    def _keep_alive(self):
+        """Poll Kafka while the partitions are paused, so the consumer is not excluded from the group.
 
-        Args:
-            backoff_sec: Time for Thread to sleep before next try to receive the Message from queue.
+        Poll is skipped if the receiving thread polls Kafka at the moment.
         """
-        task: typing.Optional[Task] = None
-        task_bytes = self._receive_event()
-
-        if not task_bytes:
-            logger.info("No bytes in the message after polling. Sleeping for backoff - %s seconds.", backoff_sec)
-            sleep(backoff_sec)
-        else:
-            task = deserialize_task(task_bytes)
+        while not self._closed.wait(self.keepalive_interval):
+            if not self._paused or not self._poll_lock.acquire(blocking=False):
+                continue
+            try:
+                with self._flow_lock:
+                    if self._paused:  # partitions might be assigned by re-balancing after pausing
+                        self.consumer.pause(self.consumer.assignment())
+                messages = self.consumer.consume(num_messages=self.prefetch_size, timeout=0)
+                messages = [msg for msg in messages if self._is_proper_message(msg, 0)]
+                with self._prefetched_lock:
+                    self._prefetch(messages)
+                self._commit_if_due()
+            except Exception:
+                logger.exception("Could not poll Kafka while partitions are paused")
+            finally:
+                self._poll_lock.release()
+
+    def _prefetch(self, messages: typing.List):
+        """Deserialize the messages and put their tasks to the prefetch buffer (should be called under its lock)."""
+        tasks = deserialize_tasks([msg.value() for msg in messages], [get_task_format(msg) for msg in messages])
+        for msg, task in zip(messages, tasks):
+            if self.manual_commit:
+                partition = (msg.topic(), msg.partition())
+                self._offsets.received(partition, msg.offset())
+                if not task:  # broken message is never processed, so it should not block commits of the next ones
+                    self._offsets.done(partition, msg.offset())
+                    continue
+                with self._task_offsets_lock:
+                    self._task_offsets[id(task)] = (task, partition, msg.offset())
             if not task:
-                logger.error(f"Could not deserialize task\n Task bytes:{str(task_bytes)}")
-
-        return task
-
-    @measure("get_task")
-    def get_task(self) -> typing.Optional[Task]:
-        return self._receive_event_with_backoff()
+                logger.error(f"Could not deserialize task\n Task bytes:{str(msg.value())}")
+                continue
+            self._prefetched.append(task)
+
+    def _commit_if_due(self):
+        if self.manual_commit and monotonic() - self._committed_at >= self.commit_interval:
+            self._commit()
+
+    def _commit(self, asynchronous: bool = True, partitions: typing.Optional[typing.Iterable[PartitionKey]] = None):
+        """Commit offsets of the contiguous processed messages of the partitions (all of them if None)."""
+        if not self.manual_commit:
+            return
+        self._committed_at = monotonic()
+        offsets = self._offsets.pop_offsets_to_commit(partitions)
+        if not offsets:
+            return
+        try:
+            self.consumer.commit(
+                offsets=[TopicPartition(topic, partition, offset) for (topic, partition), offset in offsets.items()],
+                asynchronous=asynchronous,
+            )
+        except KafkaException as e:
+            # offsets are committed with the next commit, till then their tasks would be received once more
+            self._offsets.uncommit(offsets)
+            logger.warning(f"Could not commit offsets {offsets}: {e}")
+        else:
+            logger.debug("Offsets were committed: %s", offsets)
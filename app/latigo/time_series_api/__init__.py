@@ -1,8 +1,10 @@
 from .client import *
+from .onboarding import *
 from .prediction_storage_provider import *
 from .sensor_data_provider import *
 
 __all__ = [
+    "OutputTagsOnboarding",
     "TagMetadataCache",
     "TimeSeriesAPIClient",
     "TimeSeriesAPIPredictionStorageProvider",
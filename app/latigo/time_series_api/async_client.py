@@ -0,0 +1,162 @@
+"""Asyncio implementation of the calls to Time Series API.
+
+It is used by TimeSeriesAPIClient when "async" flag is set in its config. All the clients of the process share
+one event loop that runs in the background thread and one aiohttp session with its connection pool,
+so the hundreds of metadata and data calls of the task overlap on that thread instead of blocking.
+
+Errors are raised as "requests.exceptions.HTTPError" to be handled the same way as with the sync client.
+"""
+import asyncio
+import logging
+import threading
+import typing
+
+import aiohttp
+import requests
+from requests.exceptions import HTTPError
+
+logger = logging.getLogger(__name__)
+
+MAX_CONNECTIONS = 100  # size of the connection pool shared by all the async clients of the process
+REQUEST_TIMEOUT = 300  # in seconds, the same as default timeout of requests_ms_auth
+
+_loop: typing.Optional[asyncio.AbstractEventLoop] = None
+_http_session: typing.Optional[aiohttp.ClientSession] = None
+_loop_lock = threading.Lock()
+
+
+def _run_loop(loop: asyncio.AbstractEventLoop):
+    asyncio.set_event_loop(loop)
+    loop.run_forever()
+
+
+async def _create_http_session() -> aiohttp.ClientSession:
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=MAX_CONNECTIONS),
+        timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT),
+        raise_for_status=False,
+    )
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """Return the event loop that is shared between all the async clients (started on the first call)."""
+    global _loop, _http_session
+    with _loop_lock:
+        if not _loop:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=_run_loop, args=(loop,), name="latigo-time-series-async", daemon=True).start()
+            _http_session = asyncio.run_coroutine_threadsafe(_create_http_session(), loop).result()
+            _loop = loop
+    return _loop
+
+
+def get_auth_headers(session: requests.Session) -> typing.Dict[str, str]:
+    """Make headers with the access token of the sync session (renew the token if it's expired)."""
+    session.access_token_check_and_renew()
+    headers = dict(getattr(session, "auto_adding_headers", None) or {})
+    headers["Authorization"] = f"Bearer {session.token['access_token']}"
+    return headers
+
+
+def _make_http_error(method: str, url: str, status: int, reason: str, content: bytes) -> HTTPError:
+    response = requests.Response()
+    response.status_code = status
+    response.reason = reason
+    response.url = url
+    response._content = content
+    return HTTPError(f"{status} Error: {reason} for {method} url: {url}", response=response)
+
+
+class AsyncTimeSeriesAPIClient:
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+
+    def __str__(self):
+        return f"AsyncTimeSeriesAPIClient({self.base_url})"
+
+    @staticmethod
+    def run(coroutine: typing.Awaitable) -> typing.Any:
+        """Run coroutine in the shared event loop and wait for its result in the current thread."""
+        return asyncio.run_coroutine_threadsafe(coroutine, get_event_loop()).result()
+
+    @staticmethod
+    async def _request(method: str, url: str, headers: typing.Dict[str, str], **kwargs) -> typing.Dict:
+        """Make the request and return its json.
+
+        Raise:
+            - HTTPError if response code is not 2xx.
+        """
+        async with _http_session.request(method, url, headers=headers, **kwargs) as res:  # type: ignore
+            if res.status >= 400:
+                content = await res.read()
+                raise _make_http_error(method, url, res.status, res.reason, content)
+            return await res.json(content_type=None)
+
+    @staticmethod
+    async def _gather_limited(coroutines: typing.Iterable[typing.Awaitable], limit: int, **kwargs) -> typing.List:
+        """Run coroutines concurrently, but not more then 'limit' at once. Results are in the order of coroutines."""
+        semaphore = asyncio.Semaphore(limit)
+
+        async def run_limited(coroutine):
+            async with semaphore:
+                return await coroutine
+
+        return await asyncio.gather(*(run_limited(coroutine) for coroutine in coroutines), **kwargs)
+
+    async def get_metadata(
+        self, names: typing.Iterable[str], facility: typing.Optional[str], headers: typing.Dict[str, str]
+    ) -> typing.Dict[str, typing.Dict]:
+        """Fetch metadata of the tags concurrently.
+
+        Return:
+            {tag_name: metadata}.
+        """
+        names = list(names)
+        params = [{"name": name, "facility": facility} if facility else {"name": name} for name in names]
+        metas = await asyncio.gather(
+            *(self._request("GET", self.base_url, headers=headers, params=param) for param in params)
+        )
+        return dict(zip(names, metas))
+
+    async def fetch_data_for_batches(
+        self, batches: typing.List[typing.List[typing.Dict]], headers: typing.Dict[str, str], limit: int
+    ) -> typing.List[typing.List[typing.Dict]]:
+        """Fetch data points for the batches of tag ids (max 100 in batch), not more then 'limit' batches at once.
+
+        Return:
+            data of the tags per batch, in the order of batches.
+        """
+        url = f"{self.base_url}/query/data"
+        batches_data = await self._gather_limited(
+            (self._request("POST", url, headers=headers, json=batch) for batch in batches), limit=limit
+        )
+        return [batch_data["data"]["items"] for batch_data in batches_data]
+
+    async def create_ids(
+        self, bodies: typing.List[typing.Dict], headers: typing.Dict[str, str]
+    ) -> typing.List[typing.Union[typing.Dict, Exception]]:
+        """Create timeseries tag objects concurrently.
+
+        Return:
+            created tag object or raised error per body, in the order of bodies.
+        """
+        return await asyncio.gather(
+            *(self._request("POST", self.base_url, headers=headers, json=body) for body in bodies),
+            return_exceptions=True,
+        )
+
+    async def store_multiple_datapoints(
+        self, bodies: typing.List[bytes], headers: typing.Dict[str, str], limit: int
+    ) -> typing.List[typing.Union[typing.Dict, Exception]]:
+        """Store the chunks of datapoints that are already encoded to JSON, not more then 'limit' chunks at once.
+
+        Return:
+            response or raised error per chunk, in the order of chunks.
+        """
+        url = f"{self.base_url}/data"
+        headers = {**headers, "Content-Type": "application/json"}
+        return await self._gather_limited(
+            (self._request("POST", url, headers=headers, data=body) for body in bodies),
+            limit=limit,
+            return_exceptions=True,
+        )
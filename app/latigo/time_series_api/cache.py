@@ -1,53 +1,435 @@
 import logging
+import random
+import threading
 import typing
+import uuid
+from collections import OrderedDict
+from time import monotonic, sleep, time
 
 import inject
 import ujson
-from redis import StrictRedis
+
+from .cache_backends import CacheBackend, delete_if_equal
+from .cache_stats import TAG_METADATA_CACHE_STATS
 
 logger = logging.getLogger(__name__)
 
 
 class TagMetadataCache:
-    """Storing and fetching tag metadata in Redis cache.
+    """Storing and fetching tag metadata in Redis cache (or other backend, see "cache_backends").
 
     Tag metadata is almost never changed, but sometimes it could.
     Cause of this we need to set TTL parameter and handle data changing.
+
+    One compact record is kept per tag name whatever facility it was fetched with:
+        {"facility": facility of the fetch or None, "items": [{"id": ..., "name": ..., "facility": ...}]}
+    Record fetched without facility (with tags of all the facilities) answers the lookups with any facility,
+    record fetched with facility answers only the lookups with the same facility.
+    Metadata is returned in the shape of TS API response: {"data": {"items": [...]}}, only with "ITEM_FIELDS".
+
+    Records without items (tag does not exist) live only "negative_cache_ttl" seconds, so the missing tag is not
+    requested from TS API by every task, but is found soon after it's created.
+    Tags which were not found in TS API are marked for "no_data_cache_ttl" seconds (see "set_no_data").
+
+    TTL of the records is extended by random jitter, so the tags cached at once do not expire at once.
+    Filling of the missing tags could be guarded by the short locks, so only one process requests them from TS API
+    (see "acquire_fill_locks" and "wait_for_many").
+
+    In refresh-ahead mode the record read during the last "refresh_ahead" part of its TTL is returned at once,
+    and the "refresh" callback is called to fetch the tag once more in the background.
+
+    Hot tags are also kept decoded in the in-process LRU tier that is checked before Redis.
+    Its entries live not longer then the Redis records they were read from: record keeps its "expires_at".
+    Metadata returned from cache should not be modified.
+
+    Hits, misses, stale reads, write failures, transferred bytes and latency of Redis calls are counted
+    in "stats" (see "cache_stats"), which is shared by all the caches of the process.
+
+    Instance is safe to be shared between threads: Redis client takes connections from its own pool
+    and in-process tier is guarded by the lock.
     """
 
     CACHE_TIME_TO_LIVE = 86400  # in seconds == 24 hours
+    LOCAL_CACHE_SIZE = 10000  # max amount of the tags in the in-process tier
+    LOCAL_CACHE_TIME_TO_LIVE = 600  # in seconds
+    NEGATIVE_CACHE_TIME_TO_LIVE = 300  # in seconds
+    NO_DATA_CACHE_TIME_TO_LIVE = 900  # in seconds, less than the scheduling interval
+    TIME_TO_LIVE_JITTER = 0.1  # max part of TTL that is randomly added to it
+    FILL_LOCK_TIME_TO_LIVE = 5000  # in milliseconds, the lock is released on its own if its owner failed
+    FILL_LOCK_WAIT = 2  # in seconds, how long the tag filled by other process is waited for
+    FILL_LOCK_POLL_INTERVAL = 0.05  # in seconds
+    ITEM_FIELDS = ("id", "name", "facility")  # fields of the tag objects that are kept in cache
+
+    def __init__(
+        self,
+        local_cache_size: int = LOCAL_CACHE_SIZE,
+        local_cache_ttl: int = LOCAL_CACHE_TIME_TO_LIVE,
+        negative_cache_ttl: int = NEGATIVE_CACHE_TIME_TO_LIVE,
+        no_data_cache_ttl: int = NO_DATA_CACHE_TIME_TO_LIVE,
+        refresh_ahead: float = 0,
+        refresh: typing.Optional[typing.Callable[[str, typing.Optional[str]], None]] = None,
+    ):
+        """Prepare the cache.
 
-    def __init__(self):
-        self._cache = inject.instance(StrictRedis)  # was initialized in the executor.py
+        Args:
+            - local_cache_size: max amount of the tags in the in-process tier. 0 disables the tier;
+            - local_cache_ttl: seconds during which the tag is taken from the in-process tier;
+            - negative_cache_ttl: seconds during which the tag that does not exist is not requested from TS API again;
+            - no_data_cache_ttl: seconds during which the tag not found in TS API is reported by "get_no_data".
+                0 disables marking of such tags;
+            - refresh_ahead: last part of TTL of the record (from 0 to 1) during which it's refreshed. 0 disables it;
+            - refresh: callback that refreshes metadata of the tag in the background, called with tag name
+                and facility of the record. Should not block.
+        """
+        for name, value in (
+            ("local_cache_size", local_cache_size),
+            ("local_cache_ttl", local_cache_ttl),
+            ("negative_cache_ttl", negative_cache_ttl),
+            ("no_data_cache_ttl", no_data_cache_ttl),
+        ):
+            if not isinstance(value, int) or value < 0:
+                raise ValueError(f"'{name}' of the tag metadata cache should be a non-negative integer, got '{value}'")
+        if not isinstance(refresh_ahead, (int, float)) or not 0 <= refresh_ahead < 1:
+            raise ValueError(f"'refresh_ahead' of the tag metadata cache should be from 0 to 1, got '{refresh_ahead}'")
+
+        self._cache = inject.instance(CacheBackend)  # was initialized in the executor.py
+        self.local_cache_size = local_cache_size
+        self.local_cache_ttl = local_cache_ttl
+        self.negative_cache_ttl = negative_cache_ttl
+        self.no_data_cache_ttl = no_data_cache_ttl
+        self.refresh_ahead = refresh_ahead if refresh else 0
+        self._refresh = refresh
+        self._local_cache: OrderedDict = OrderedDict()  # {key: (record, expires_at)}
+        self._local_cache_lock = threading.Lock()
+        self.stats = TAG_METADATA_CACHE_STATS
 
     def get_metadata(self, name: str, facility: typing.Optional[str]) -> typing.Optional[typing.Dict]:
         """Fetch tag metadata from cache if exists.
 
         Args:
             - name: name of the tag. Example: "1901.A-21TE28.MA_Y";
-            - facility: TS internal project identifier. Example: "1000".
+            - facility: TS internal project identifier. Example: "1000". None for the tags of all the facilities.
         """
-        key = self._make_metadata_key(name, facility)
+        meta, is_local = self._lookup(name, facility)
+        self._count_lookup(meta, is_local)
+        return meta
+
+    def _lookup(self, name: str, facility: typing.Optional[str]) -> typing.Tuple[typing.Optional[typing.Dict], bool]:
+        """Return metadata of the tag and whether it was taken from the in-process tier."""
+        key = self._make_metadata_key(name)
+        record = self._get_local(key)
+        is_local = bool(record)
+        if not record or self._is_expiring(record):
+            # record might be already refreshed in Redis by other process
+            with self.stats.timed("get"):
+                value = self._cache.get(key)
+            if value:
+                self.stats.count("bytes_read", len(value))
+                record = ujson.loads(value)
+                is_local = False
+                self._set_local(key, record)
+        if not record:
+            return None, False
 
-        res = self._cache.get(key)
-        if res:
-            res = ujson.loads(res)
-        return res
+        self._refresh_if_expiring(name, record)
+        return self._make_metadata(record, facility), is_local
 
     def set_metadata(self, name: str, facility: typing.Optional[str], meta: typing.Dict):
         """Set tag metadata to cache (overrides if exists).
 
         Args:
             - name: name of the tag. Example: "1901.A-21TE28.MA_Y";
-            - facility: TS internal project identifier. Example: "1000".
+            - facility: TS internal project identifier the metadata was fetched with. Example: "1000".
         """
-        key = self._make_metadata_key(name, facility)
-        dumped_meta = ujson.dumps(meta)
+        key = self._make_metadata_key(name)
+        record, ttl = self._prepare_record(meta, facility)
+        value = ujson.dumps(record)
 
-        res = self._cache.set(name=key, value=dumped_meta, ex=self.CACHE_TIME_TO_LIVE)
+        try:
+            with self.stats.timed("set"):
+                res = self._cache.set(name=key, value=value, ex=ttl)
+        except Exception:
+            self.stats.count("write_failures")
+            raise
         if not res:
+            self.stats.count("write_failures")
+            self.invalidate(name)
             raise Exception(f"Failed to store key '{key}' with value '{meta}' to cache.")
+        self.stats.count("bytes_written", len(value))
+        self._set_local(key, record)
+
+    def get_many(
+        self, names: typing.Iterable[str], facility: typing.Optional[str]
+    ) -> typing.Dict[str, typing.Optional[typing.Dict]]:
+        """Fetch metadata of the multiple tags from cache in one round-trip (MGET).
+
+        Args:
+            - names: names of the tags. Example: ["1901.A-21TE28.MA_Y"];
+            - facility: TS internal project identifier. Example: "1000".
+
+        Return:
+            {tag_name: metadata or None if it is not in cache}.
+        """
+        metas, local_names = self._lookup_many(names, facility)
+        for name, meta in metas.items():
+            self._count_lookup(meta, is_local=name in local_names)
+        return metas
+
+    def _lookup_many(
+        self, names: typing.Iterable[str], facility: typing.Optional[str]
+    ) -> typing.Tuple[typing.Dict[str, typing.Optional[typing.Dict]], typing.Set[str]]:
+        """Return metadata of the tags and names of the tags that were taken from the in-process tier."""
+        records: typing.Dict[str, typing.Optional[typing.Dict]] = {}
+        # {key: tag_name} of the tags that are not in the in-process tier or should be refreshed
+        missing_keys: typing.Dict[str, str] = {}
+        for name in names:
+            key = self._make_metadata_key(name)
+            records[name] = self._get_local(key)
+            if not records[name] or self._is_expiring(records[name]):
+                missing_keys[key] = name
+
+        if missing_keys:
+            with self.stats.timed("mget"):
+                values = self._cache.mget(list(missing_keys))
+            for (key, name), value in zip(missing_keys.items(), values):
+                if value:
+                    self.stats.count("bytes_read", len(value))
+                    records[name] = ujson.loads(value)
+                    self._set_local(key, records[name])
+
+        metas = {}
+        local_names = set()
+        for name, record in records.items():
+            if record:
+                self._refresh_if_expiring(name, record)
+            metas[name] = record and self._make_metadata(record, facility)
+            if metas[name] and self._make_metadata_key(name) not in missing_keys:
+                local_names.add(name)
+        return metas, local_names
+
+    def set_many(self, metas: typing.Dict[str, typing.Dict], facility: typing.Optional[str]):
+        """Set metadata of the multiple tags to cache in one round-trip (pipelined SET with EX).
+
+        Args:
+            - metas: {tag_name: metadata};
+            - facility: TS internal project identifier. Example: "1000".
+        """
+        if not metas:
+            return
+
+        records = {}
+        written_bytes = 0
+        pipeline = self._cache.pipeline(transaction=False)
+        for name, meta in metas.items():
+            records[name], ttl = self._prepare_record(meta, facility)
+            value = ujson.dumps(records[name])
+            written_bytes += len(value)
+            pipeline.set(name=self._make_metadata_key(name), value=value, ex=ttl)
+        try:
+            with self.stats.timed("set_many"):
+                results = pipeline.execute()
+        except Exception:
+            self.stats.count("write_failures", len(records))
+            raise
+        self.stats.count("bytes_written", written_bytes)
+
+        failed_names = []
+        for (name, record), res in zip(records.items(), results):
+            if res:
+                self._set_local(self._make_metadata_key(name), record)
+            else:
+                self.invalidate(name)
+                failed_names.append(name)
+        if failed_names:
+            self.stats.count("write_failures", len(failed_names))
+            raise Exception(f"Failed to store metadata of the tags {failed_names} with facility '{facility}' to cache.")
+
+    def set_no_data(self, names: typing.Iterable[str]):
+        """Mark the tags which were not found in TS API (in one round-trip)."""
+        names = list(names)
+        if not names or not self.no_data_cache_ttl:
+            return
+
+        pipeline = self._cache.pipeline(transaction=False)
+        for name in names:
+            pipeline.set(name=self._make_no_data_key(name), value=1, ex=self.no_data_cache_ttl)
+        with self.stats.timed("set_no_data"):
+            pipeline.execute()
+
+    def get_no_data(self, names: typing.Iterable[str]) -> typing.List[str]:
+        """Return the tags which were not found in TS API during last "no_data_cache_ttl" seconds."""
+        names = list(names)
+        if not names or not self.no_data_cache_ttl:
+            return []
+
+        with self.stats.timed("get_no_data"):
+            values = self._cache.mget([self._make_no_data_key(name) for name in names])
+        return [name for name, value in zip(names, values) if value]
+
+    def acquire_fill_lock(self, name: str, facility: typing.Optional[str]) -> typing.Optional[str]:
+        """Take the lock for requesting the tag from TS API and filling it to cache.
+
+        Return:
+            token of the lock if it was taken or None if other process fills the tag.
+        """
+        token = uuid.uuid4().hex
+        key = self._make_fill_lock_key(name, facility)
+        with self.stats.timed("acquire_fill_lock"):
+            is_acquired = self._cache.set(name=key, value=token, px=self.FILL_LOCK_TIME_TO_LIVE, nx=True)
+        return token if is_acquired else None
+
+    def acquire_fill_locks(self, names: typing.Iterable[str], facility: typing.Optional[str]) -> typing.Dict[str, str]:
+        """Take the locks of the multiple tags in one round-trip (pipelined SET with NX and PX).
+
+        Return:
+            {tag_name: token of the lock} of the taken locks. Other tags are filled by other processes.
+        """
+        tokens = {name: uuid.uuid4().hex for name in names}
+        if not tokens:
+            return {}
+
+        pipeline = self._cache.pipeline(transaction=False)
+        for name, token in tokens.items():
+            key = self._make_fill_lock_key(name, facility)
+            pipeline.set(name=key, value=token, px=self.FILL_LOCK_TIME_TO_LIVE, nx=True)
+        with self.stats.timed("acquire_fill_locks"):
+            results = pipeline.execute()
+        return {name: token for (name, token), is_acquired in zip(tokens.items(), results) if is_acquired}
+
+    def release_fill_lock(self, name: str, facility: typing.Optional[str], token: str):
+        """Release the lock if it's still owned (it might be expired and taken by other process)."""
+        self.release_fill_locks({name: token}, facility)
+
+    def release_fill_locks(self, tokens: typing.Dict[str, str], facility: typing.Optional[str]):
+        """Release the locks that are still owned in one round-trip (atomic compare-and-delete).
+
+        Args:
+            - tokens: {tag_name: token of the lock} as returned by "acquire_fill_locks".
+        """
+        if not tokens:
+            return
+        values = {self._make_fill_lock_key(name, facility): token.encode() for name, token in tokens.items()}
+        with self.stats.timed("release_fill_locks"):
+            delete_if_equal(self._cache, values)
+
+    def wait_for_metadata(self, name: str, facility: typing.Optional[str]) -> typing.Optional[typing.Dict]:
+        """Wait up to "FILL_LOCK_WAIT" seconds till the tag is filled to cache by other process."""
+        return self.wait_for_many([name], facility)[name]
+
+    def wait_for_many(
+        self, names: typing.Iterable[str], facility: typing.Optional[str]
+    ) -> typing.Dict[str, typing.Optional[typing.Dict]]:
+        """Wait up to "FILL_LOCK_WAIT" seconds till the tags are filled to cache by other processes.
+
+        Return:
+            {tag_name: metadata or None if the tag was not filled in time}.
+        """
+        metas: typing.Dict[str, typing.Optional[typing.Dict]] = dict.fromkeys(names)
+        deadline = monotonic() + self.FILL_LOCK_WAIT
+        while monotonic() < deadline:
+            sleep(self.FILL_LOCK_POLL_INTERVAL)
+            # the first lookups of the tags were already counted
+            filled, _ = self._lookup_many([name for name, meta in metas.items() if not meta], facility)
+            metas.update(filled)
+            if all(metas.values()):
+                break
+        return metas
+
+    def invalidate(self, name: str):
+        """Drop tag metadata from the in-process tier, so it will be taken from Redis next time."""
+        with self._local_cache_lock:
+            self._local_cache.pop(self._make_metadata_key(name), None)
+
+    def _get_local(self, key: str) -> typing.Optional[typing.Dict]:
+        if not self.local_cache_size:
+            return None
+
+        with self._local_cache_lock:
+            entry = self._local_cache.get(key)
+            if not entry:
+                return None
+            record, expires_at = entry
+            if monotonic() >= expires_at:
+                del self._local_cache[key]
+                return None
+            self._local_cache.move_to_end(key)
+            return record
+
+    def _set_local(self, key: str, record: typing.Dict):
+        if not self.local_cache_size:
+            return
+
+        ttl = self.local_cache_ttl
+        if "expires_at" in record:  # records of the previous versions do not have it
+            ttl = min(ttl, record["expires_at"] - time())
+        if ttl <= 0:
+            return
+        expires_at = monotonic() + ttl
+        with self._local_cache_lock:
+            self._local_cache[key] = (record, expires_at)
+            self._local_cache.move_to_end(key)
+            while len(self._local_cache) > self.local_cache_size:
+                self._local_cache.popitem(last=False)
+
+    def _prepare_record(self, meta: typing.Dict, facility: typing.Optional[str]) -> typing.Tuple[typing.Dict, int]:
+        """Make the record to be stored and its TTL.
+
+        Record gets the time of its expiration and the time of its refresh in refresh-ahead mode.
+        """
+        record = self._make_record(meta, facility)
+        ttl = self._get_ttl(record)
+        record["expires_at"] = int(time() + ttl)
+        if self.refresh_ahead and record["items"]:
+            record["refresh_at"] = int(time() + ttl * (1 - self.refresh_ahead))
+        return record, ttl
+
+    def _count_lookup(self, meta: typing.Optional[typing.Dict], is_local: bool):
+        if not meta:
+            self.stats.count("misses")
+            return
+        self.stats.count("hits")
+        if is_local:
+            self.stats.count("local_hits")
+
+    def _is_expiring(self, record: typing.Dict) -> bool:
+        refresh_at = record.get("refresh_at")
+        return bool(self.refresh_ahead and refresh_at and time() >= refresh_at)
+
+    def _refresh_if_expiring(self, name: str, record: typing.Dict):
+        if self._is_expiring(record):
+            self.stats.count("stale_reads")
+            self._refresh(name, record["facility"])  # type: ignore
+
+    def _get_ttl(self, record: typing.Dict) -> int:
+        ttl = self.CACHE_TIME_TO_LIVE if record["items"] else min(self.negative_cache_ttl, self.CACHE_TIME_TO_LIVE)
+        return ttl + random.randint(0, int(ttl * self.TIME_TO_LIVE_JITTER))
+
+    @classmethod
+    def _make_record(cls, meta: typing.Dict, facility: typing.Optional[str]) -> typing.Dict:
+        """Make compact record of the TS API response that was fetched with the facility."""
+        items = (meta.get("data") or {}).get("items") or []
+        compact_items = [{field: item.get(field) for field in cls.ITEM_FIELDS} for item in items]
+        return {"facility": facility, "items": compact_items}
+
+    @staticmethod
+    def _make_metadata(record: typing.Dict, facility: typing.Optional[str]) -> typing.Optional[typing.Dict]:
+        """Make metadata with the tag objects of the facility from the record or None if record can't answer."""
+        items = record["items"]
+        if record["facility"] is None:
+            if facility is not None:
+                items = [item for item in items if item["facility"] == facility]
+        elif record["facility"] != facility:
+            return None
+        return {"data": {"items": items}}
+
+    @staticmethod
+    def _make_metadata_key(name: str):
+        return f"tag-metadata::{name}"
+
+    @staticmethod
+    def _make_fill_lock_key(name: str, facility: typing.Optional[str]):
+        return f"tag-metadata-lock::{facility}::{name}"
 
     @staticmethod
-    def _make_metadata_key(name: str, facility: typing.Optional[str]):
-        return f"{facility}::{name}"
+    def _make_no_data_key(name: str):
+        return f"tag-no-data::{name}"
@@ -0,0 +1,263 @@
+"""Storages of the tag metadata cache.
+
+Backend is chosen by the "cache" section of the config (see "cache_backend_factory") and is bound
+with "inject" as "CacheBackend". Redis client is used as is, other backends implement the same subset
+of its API: "get", "mget", "set", "delete" and "pipeline" with "set" and "execute".
+Compare-and-delete of the keys (see "delete_if_equal") is made atomically by each backend in its own way.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import typing
+from time import time
+
+from redis import StrictRedis
+
+logger = logging.getLogger(__name__)
+
+SQLITE_DEFAULT_PATH = "/tmp/latigo-cache.sqlite3"
+SQLITE_BUSY_TIMEOUT = 10  # in seconds, how long the writer waits for the lock of the other process
+SQLITE_MAX_VARIABLES = 500  # max amount of the keys in one query
+SQLITE_PURGE_EVERY = 1000  # expired entries are deleted after such amount of writes
+
+Value = typing.Union[bytes, str, int, float]
+
+# deletes the keys that still have the expected values, KEYS and ARGV are the keys and their values
+DELETE_IF_EQUAL_SCRIPT = """
+local deleted = 0
+for i, key in ipairs(KEYS) do
+    if redis.call("get", key) == ARGV[i] then
+        deleted = deleted + redis.call("del", key)
+    end
+end
+return deleted
+"""
+
+
+class CacheBackend:
+    """Key-value storage with expiration of the keys. It's the subset of "redis.StrictRedis" API."""
+
+    def get(self, name: str) -> typing.Optional[bytes]:
+        raise NotImplementedError()
+
+    def mget(self, keys: typing.List[str]) -> typing.List[typing.Optional[bytes]]:
+        raise NotImplementedError()
+
+    def set(
+        self,
+        name: str,
+        value: Value,
+        ex: typing.Optional[int] = None,
+        px: typing.Optional[int] = None,
+        nx: bool = False,
+    ) -> typing.Optional[bool]:
+        """Set the value with expiration in seconds ("ex") or milliseconds ("px").
+
+        Return:
+            True if value was set. None if "nx" was passed and such key already exists.
+        """
+        raise NotImplementedError()
+
+    def delete(self, *names: str) -> int:
+        raise NotImplementedError()
+
+    def delete_if_equal(self, values: typing.Dict[str, bytes]) -> int:
+        """Delete the keys that still have the given values in one atomic operation (see "delete_if_equal")."""
+        raise NotImplementedError()
+
+    def pipeline(self, transaction: bool = True) -> typing.Any:
+        """Return object that collects "set" calls and makes them with one "execute" call."""
+        raise NotImplementedError()
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """Cache that is stored in the SQLite file on the local disk.
+
+    It survives restarts and is shared by all the processes that use the same file on the host
+    (database is in WAL mode, so readers do not wait for the writer). Each thread uses its own connection.
+    """
+
+    def __init__(self, path: str = SQLITE_DEFAULT_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._writes_count = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL)"
+            )
+
+    def __str__(self):
+        return f"SQLiteCacheBackend({self.path})"
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=SQLITE_BUSY_TIMEOUT, isolation_level=None)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def get(self, name: str) -> typing.Optional[bytes]:
+        return self.mget([name])[0]
+
+    def mget(self, keys: typing.List[str]) -> typing.List[typing.Optional[bytes]]:
+        values: typing.Dict[str, bytes] = {}
+        now = time()
+        for i in range(0, len(keys), SQLITE_MAX_VARIABLES):
+            batch = keys[i : i + SQLITE_MAX_VARIABLES]
+            rows = self._connection().execute(
+                f"SELECT key, value FROM cache WHERE key IN ({','.join('?' * len(batch))}) "
+                f"AND (expires_at IS NULL OR expires_at > ?)",
+                (*batch, now),
+            )
+            values.update(rows)
+        return [values.get(key) for key in keys]
+
+    def set(
+        self,
+        name: str,
+        value: Value,
+        ex: typing.Optional[int] = None,
+        px: typing.Optional[int] = None,
+        nx: bool = False,
+    ) -> typing.Optional[bool]:
+        connection = self._connection()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            res = self._set(connection, name, value, ex, px, nx)
+        self._count_writes(1)
+        return res
+
+    @staticmethod
+    def _set(
+        connection: sqlite3.Connection,
+        name: str,
+        value: Value,
+        ex: typing.Optional[int],
+        px: typing.Optional[int],
+        nx: bool,
+    ) -> typing.Optional[bool]:
+        now = time()
+        expires_at = now + ex if ex else now + px / 1000 if px else None
+        if not isinstance(value, bytes):
+            value = str(value).encode()
+        if not nx:
+            connection.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?)", (name, value, expires_at))
+            return True
+
+        connection.execute("DELETE FROM cache WHERE key = ? AND expires_at <= ?", (name, now))
+        inserted = connection.execute("INSERT OR IGNORE INTO cache VALUES (?, ?, ?)", (name, value, expires_at))
+        return True if inserted.rowcount else None
+
+    def delete(self, *names: str) -> int:
+        connection = self._connection()
+        with connection:
+            return connection.execute(
+                f"DELETE FROM cache WHERE key IN ({','.join('?' * len(names))})", names
+            ).rowcount
+
+    def delete_if_equal(self, values: typing.Dict[str, bytes]) -> int:
+        connection = self._connection()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            return sum(
+                connection.execute("DELETE FROM cache WHERE key = ? AND value = ?", item).rowcount
+                for item in values.items()
+            )
+
+    def ttl(self, name: str) -> int:
+        """Return seconds till key expiration, -1 if key does not expire or -2 if it does not exist."""
+        row = self._connection().execute("SELECT expires_at FROM cache WHERE key = ?", (name,)).fetchone()
+        if not row:
+            return -2
+        if row[0] is None:
+            return -1
+        ttl = round(row[0] - time())
+        return ttl if ttl > 0 else -2
+
+    def pipeline(self, transaction: bool = True) -> "SQLitePipeline":
+        return SQLitePipeline(self)
+
+    def _execute(self, commands: typing.List[typing.Tuple]) -> typing.List[typing.Optional[bool]]:
+        connection = self._connection()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            results = [self._set(connection, *command) for command in commands]
+        self._count_writes(len(commands))
+        return results
+
+    def _count_writes(self, count: int):
+        self._writes_count += count
+        if self._writes_count >= SQLITE_PURGE_EVERY:
+            self._writes_count = 0
+            self.purge_expired()
+
+    def purge_expired(self):
+        """Delete expired entries, so the file does not grow."""
+        connection = self._connection()
+        with connection:
+            connection.execute("DELETE FROM cache WHERE expires_at <= ?", (time(),))
+
+
+class SQLitePipeline:
+    """Collects "set" calls of the SQLite backend to make them in one transaction."""
+
+    def __init__(self, backend: SQLiteCacheBackend):
+        self._backend = backend
+        self._commands: typing.List[typing.Tuple] = []
+
+    def set(
+        self,
+        name: str,
+        value: Value,
+        ex: typing.Optional[int] = None,
+        px: typing.Optional[int] = None,
+        nx: bool = False,
+    ) -> "SQLitePipeline":
+        self._commands.append((name, value, ex, px, nx))
+        return self
+
+    def execute(self) -> typing.List[typing.Optional[bool]]:
+        commands, self._commands = self._commands, []
+        return self._backend._execute(commands)
+
+
+def delete_if_equal(backend: CacheBackend, values: typing.Dict[str, bytes]) -> int:
+    """Delete the keys that still have the given values, e.g. release the locks only by their owner.
+
+    Check and deletion are made atomically in one round-trip: with Lua script in Redis, in one transaction in SQLite.
+
+    Return:
+        amount of the deleted keys.
+    """
+    if not values:
+        return 0
+    if isinstance(backend, CacheBackend):
+        return backend.delete_if_equal(values)
+    return backend.eval(DELETE_IF_EQUAL_SCRIPT, len(values), *values, *values.values())
+
+
+def cache_backend_factory(config: typing.Optional[dict]) -> CacheBackend:
+    """Make the storage of the cache from the "cache" config section.
+
+    Redis ("redis" type, default) is connected with "CACHE_HOST", "CACHE_PASSWORD" and "CACHE_PORT"
+    environment variables. SQLite ("sqlite" type) is stored in the file from "path".
+    """
+    config = config or {}
+    cache_type = config.get("type", "redis")
+
+    if "redis" == cache_type:
+        return StrictRedis(  # type: ignore
+            host=os.environ["CACHE_HOST"],
+            password=os.environ["CACHE_PASSWORD"],
+            port=os.environ["CACHE_PORT"],
+            ssl=config.get("ssl", True),
+        )
+    if "sqlite" == cache_type:
+        return SQLiteCacheBackend(path=config.get("path", SQLITE_DEFAULT_PATH))
+    raise ValueError(f"'{cache_type}' is not valid cache type")
@@ -0,0 +1,146 @@
+"""Statistics of the tag metadata cache.
+
+Counters and latency histograms are collected for the whole process and logged every "SUMMARY_INTERVAL" seconds.
+Totals of the calls made by the thread inside "CacheStats.track" block are collected per task
+and might be attached to the log context of the task. Calls of other threads are not in the totals of the task.
+"""
+import logging
+import threading
+import typing
+from bisect import bisect_left
+from contextlib import contextmanager
+from time import monotonic
+
+import pylogctx
+
+logger = logging.getLogger(__name__)
+
+COUNTERS = ("hits", "local_hits", "misses", "stale_reads", "write_failures", "bytes_read", "bytes_written")
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)  # upper bounds in seconds
+SUMMARY_INTERVAL = 600  # in seconds
+
+
+class LatencyHistogram:
+    """Amount of the calls per latency bucket with total count and duration of the calls."""
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)  # the last one is for the calls slower then all the bounds
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds: float):
+        self.buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+
+    def as_dict(self) -> typing.Dict[str, typing.Any]:
+        bounds = [f"<={bound}" for bound in LATENCY_BUCKETS] + ["+inf"]
+        return {"count": self.count, "sum": round(self.total, 6), "buckets": dict(zip(bounds, self.buckets))}
+
+
+class CacheStats:
+    """Counters and latency histograms of the cache operations. Instance is safe to be shared between threads.
+
+    Counters:
+        - hits: lookups answered by the cache (in-process tier or Redis);
+        - local_hits: lookups answered by the in-process tier;
+        - misses: lookups which metadata was not in the cache;
+        - stale_reads: hits with the record that is in its refresh-ahead window;
+        - write_failures: records that were not stored to Redis;
+        - bytes_read, bytes_written: size of the values transferred to/from Redis.
+    """
+
+    def __init__(self, name: str, summary_interval: int = SUMMARY_INTERVAL):
+        self.name = name
+        self.summary_interval = summary_interval
+        self._counters: typing.Dict[str, int] = dict.fromkeys(COUNTERS, 0)
+        self._latencies: typing.Dict[str, LatencyHistogram] = {}
+        self._lock = threading.Lock()
+        self._summary_logged_at = monotonic()
+        self._local = threading.local()  # stack of the task totals of the thread
+
+    def __str__(self):
+        return f"CacheStats({self.name})"
+
+    def count(self, counter: str, value: int = 1):
+        """Increase the counter of the process and of the tasks tracked by the current thread."""
+        if not value:
+            return
+        with self._lock:
+            self._counters[counter] += value
+        for totals in self._get_tracked():
+            totals[counter] += value
+
+    @contextmanager
+    def timed(self, operation: str):
+        """Measure duration of the cache operation (one call to Redis). Example: "get", "mget", "set"."""
+        start = monotonic()
+        try:
+            yield
+        finally:
+            elapsed = monotonic() - start
+            with self._lock:
+                histogram = self._latencies.get(operation)
+                if histogram is None:
+                    histogram = self._latencies[operation] = LatencyHistogram()
+                histogram.observe(elapsed)
+            for totals in self._get_tracked():
+                totals["calls"] += 1
+                totals["seconds"] += elapsed
+
+    @contextmanager
+    def track(self, context_key: typing.Optional[str] = None):
+        """Collect totals of the cache operations made by the current thread inside the block.
+
+        Blocks might be nested, operations are counted in all of them.
+        Operations made by other threads are counted only for the process. For example, the input tags are looked up
+        by the Gordo client workers when they load the sensor data for the prediction: Gordo does not pass the task
+        to them, so their lookups can not be told apart from the lookups of the concurrent tasks.
+
+        Args:
+            - context_key: if passed, non-zero totals are put to the log context (pylogctx) with such key
+                at the end of the block, so the measurement of the task is logged with them.
+        """
+        totals: typing.Dict[str, typing.Any] = dict.fromkeys(COUNTERS + ("calls",), 0)
+        totals["seconds"] = 0.0
+        tracked = self._get_tracked()
+        tracked.append(totals)
+        try:
+            yield totals
+        finally:
+            tracked.pop()
+            totals["seconds"] = round(totals["seconds"], 3)
+            if context_key:
+                pylogctx.context.update(**{context_key: {name: value for name, value in totals.items() if value}})
+            self.log_summary_if_due()
+
+    def snapshot(self) -> typing.Dict[str, typing.Any]:
+        """Return counters, hit ratio and latency histograms (per operation) of the process."""
+        with self._lock:
+            counters = dict(self._counters)
+            latencies = {operation: histogram.as_dict() for operation, histogram in self._latencies.items()}
+        lookups = counters["hits"] + counters["misses"]
+        return {
+            "counters": counters,
+            "hit_ratio": round(counters["hits"] / lookups, 4) if lookups else None,
+            "latencies": latencies,
+        }
+
+    def log_summary_if_due(self):
+        now = monotonic()
+        with self._lock:
+            if now - self._summary_logged_at < self.summary_interval:
+                return
+            self._summary_logged_at = now
+        logger.info("Statistics of the %s: %s", self.name, self.snapshot())
+
+    def _get_tracked(self) -> typing.List[typing.Dict[str, typing.Any]]:
+        tracked = getattr(self._local, "tracked", None)
+        if tracked is None:
+            tracked = self._local.tracked = []
+        return tracked
+
+
+# shared by all the tag metadata caches of the process
+TAG_METADATA_CACHE_STATS = CacheStats("tag metadata cache")
+TAG_METADATA_CACHE_CONTEXT_KEY = "tag_metadata_cache"  # key of the task totals in the log context
@@ -1,14 +1,31 @@
 import logging
+import threading
 import typing
+from concurrent.futures import Future, ThreadPoolExecutor
+from time import sleep
+
+import ujson
+from requests.exceptions import HTTPError, RequestException
 
 from latigo.types import TimeRange
 
 from ..utils import get_batches
+from .async_client import AsyncTimeSeriesAPIClient, get_auth_headers
 from .cache import TagMetadataCache
 from .misc import _itemes_present, get_auth_session, parse_request_json
 
 logger = logging.getLogger(__name__)
 
+JSON_HEADERS = {"Content-Type": "application/json"}
+MAX_PARALLEL_BATCHES = 4  # max amount of the batches of the tags that are fetched concurrently
+MAX_PARALLEL_WRITES = 4  # max amount of the chunks of the datapoints that are stored concurrently
+WRITE_CHUNK_MAX_DATAPOINTS = 10000
+WRITE_CHUNK_MAX_BYTES = 4 * 1024 * 1024
+WRITE_RETRIES = 2  # how many times the failed chunks are stored once more
+
+# encoded datapoints of the tag: (time series id, [JSON of datapoint])
+EncodedItem = typing.Tuple[str, typing.List[str]]
+
 
 class TimeSeriesAPIClient:
     """Client to connect with Time Series API.
@@ -27,6 +44,8 @@ class TimeSeriesAPIClient:
         "name-x" indicating that the TS record is not active anymore.
     """
 
+    WRITE_RETRY_DELAY = 1  # in seconds, delay before storing failed datapoints once more (multiplied by attempt)
+
     def __str__(self):
         return f"TimeSeriesAPIClient({self.base_url})"
 
@@ -53,15 +72,64 @@ class TimeSeriesAPIClient:
             return self._fail("No auth_config found in config")
         self._create_session(force=False)
 
+    def _parse_max_parallel_batches(self):
+        self.max_parallel_batches = self.config.get("max_parallel_batches", MAX_PARALLEL_BATCHES)
+        self._batch_executor: typing.Optional[ThreadPoolExecutor] = None
+        if not isinstance(self.max_parallel_batches, int) or self.max_parallel_batches < 1:
+            return self._fail(f"'max_parallel_batches' should be a positive integer, got '{self.max_parallel_batches}'")
+        if self.max_parallel_batches > 1:
+            self._batch_executor = ThreadPoolExecutor(
+                max_workers=self.max_parallel_batches, thread_name_prefix="latigo-time-series-batch-"
+            )
+
+    def _parse_write_config(self):
+        self.max_parallel_writes = self._get_positive_int("max_parallel_writes", MAX_PARALLEL_WRITES)
+        self.write_chunk_max_datapoints = self._get_positive_int(
+            "write_chunk_max_datapoints", WRITE_CHUNK_MAX_DATAPOINTS
+        )
+        self.write_chunk_max_bytes = self._get_positive_int("write_chunk_max_bytes", WRITE_CHUNK_MAX_BYTES)
+        self.write_retries = self.config.get("write_retries", WRITE_RETRIES)
+        if not isinstance(self.write_retries, int) or self.write_retries < 0:
+            return self._fail(f"'write_retries' should be a non-negative integer, got '{self.write_retries}'")
+        self._write_executor: typing.Optional[ThreadPoolExecutor] = None
+        if self.max_parallel_writes and self.max_parallel_writes > 1:
+            self._write_executor = ThreadPoolExecutor(
+                max_workers=self.max_parallel_writes, thread_name_prefix="latigo-time-series-write-"
+            )
+
+    def _get_positive_int(self, name: str, default: int) -> typing.Optional[int]:
+        value = self.config.get(name, default)
+        if not isinstance(value, int) or value < 1:
+            return self._fail(f"'{name}' should be a positive integer, got '{value}'")
+        return value
+
     def __init__(self, config: dict):
         self.good_to_go = True
-        self._tag_metadata_cache = TagMetadataCache()
         self.config = config
         if not self.config:
             raise Exception("No config specified")
+        self._tag_metadata_cache = TagMetadataCache(
+            local_cache_size=self.config.get("metadata_local_cache_size", TagMetadataCache.LOCAL_CACHE_SIZE),
+            local_cache_ttl=self.config.get("metadata_local_cache_ttl", TagMetadataCache.LOCAL_CACHE_TIME_TO_LIVE),
+            negative_cache_ttl=self.config.get(
+                "metadata_negative_cache_ttl", TagMetadataCache.NEGATIVE_CACHE_TIME_TO_LIVE
+            ),
+            no_data_cache_ttl=self.config.get("no_data_cache_ttl", TagMetadataCache.NO_DATA_CACHE_TIME_TO_LIVE),
+            refresh_ahead=self.config.get("metadata_refresh_ahead", 0),
+            refresh=self._schedule_metadata_refresh,
+        )
+        # single-flight requests of the tag metadata, {(tag_name, facility): future of metadata}
+        self._metadata_in_flight: typing.Dict[typing.Tuple[str, typing.Optional[str]], Future] = {}
+        self._metadata_in_flight_lock = threading.Lock()
+        # tags which metadata is refreshed in the background (see "metadata_refresh_ahead")
+        self._metadata_refreshing: typing.Set[str] = set()
+        self._metadata_refresh_executor: typing.Optional[ThreadPoolExecutor] = None
         self._parse_auth_config()
         self._parse_base_url()
         self.do_async = self.config.get("async", False)
+        self._async_client = AsyncTimeSeriesAPIClient(self.base_url) if self.do_async else None
+        self._parse_max_parallel_batches()
+        self._parse_write_config()
         if not self.good_to_go:
             raise Exception("TimeSeriesAPIClient failed. Please see previous errors for clues as to why")
 
@@ -106,26 +174,48 @@ class TimeSeriesAPIClient:
                 sending for the prediction should be made.
             - if more then 100 "tag ids" will be sent to API - error
                 code is returned: {"statusCode":400}.
+            - batches of 100 "tag ids" are fetched concurrently, not more
+                then "max_parallel_batches" at once. Result is in the order of "tag_ids".
         """
-        url = f"{self.base_url}/query/data"
         max_ids_in_one_request = 100
+        batches = list(get_batches(tag_ids, batch_size=max_ids_in_one_request))
+        if self._async_client:
+            batches_data = self._async_client.run(
+                self._async_client.fetch_data_for_batches(
+                    [self._make_batch_request_data(batch, time_range) for batch in batches],
+                    headers=get_auth_headers(self.session),
+                    limit=self.max_parallel_batches,
+                )
+            )
+        elif len(batches) > 1 and self._batch_executor:
+            # batches are fetched concurrently, "map" returns results in the order of the batches
+            batches_data = self._batch_executor.map(self._fetch_data_for_batch, batches, [time_range] * len(batches))
+        else:
+            batches_data = (self._fetch_data_for_batch(batch, time_range) for batch in batches)
+
         tags_data = []
+        for batch_data in batches_data:
+            tags_data.extend(batch_data)
+        return tags_data
 
-        for batch in get_batches(tag_ids, batch_size=max_ids_in_one_request):
-            request_data = [
-                {
-                    "id": tag_id,
-                    "startTime": time_range.rfc3339_from(),
-                    "endTime": time_range.rfc3339_to(),
-                    "limit": 100000,
-                    "includeOutsidePoints": False,
-                }
-                for tag_id in batch
-            ]
-            rep_data = parse_request_json(self._post(url=url, json=request_data))
-            tags_data.extend(rep_data["data"]["items"])
+    def _fetch_data_for_batch(self, tag_ids: typing.Iterable[str], time_range: TimeRange) -> typing.List[typing.Dict]:
+        url = f"{self.base_url}/query/data"
+        request_data = self._make_batch_request_data(tag_ids, time_range)
+        rep_data = parse_request_json(self._post(url=url, json=request_data))
+        return rep_data["data"]["items"]
 
-        return tags_data
+    @staticmethod
+    def _make_batch_request_data(tag_ids: typing.Iterable[str], time_range: TimeRange) -> typing.List[typing.Dict]:
+        return [
+            {
+                "id": tag_id,
+                "startTime": time_range.rfc3339_from(),
+                "endTime": time_range.rfc3339_to(),
+                "limit": 100000,
+                "includeOutsidePoints": False,
+            }
+            for tag_id in tag_ids
+        ]
 
     def _get_metadata_from_api(self, name: str, facility: typing.Optional[str] = None) -> typing.Dict:
         """Fetch metadata from Time Series API.
@@ -151,10 +241,175 @@ class TimeSeriesAPIClient:
             return meta
 
         # get from Time Series API and store to cache
-        meta = self._get_metadata_from_api(name, facility)
-        if meta:
-            self._tag_metadata_cache.set_metadata(name, facility, meta)
-        return meta
+        return self._fill_metadata_single_flight(name, facility)
+
+    def _fill_metadata_single_flight(self, name: str, facility: typing.Optional[str]) -> typing.Dict:
+        """Fetch metadata of the tag from TS API and store it to cache once for all the concurrent callers.
+
+        Callers of the same process wait for the request that is already in flight. Across the processes
+        the one that takes the cache lock makes the request, others wait for its result in cache for a short time.
+        """
+        key = (name, facility)
+        with self._metadata_in_flight_lock:
+            future = self._metadata_in_flight.get(key)
+            is_owner = future is None
+            if is_owner:
+                future = self._metadata_in_flight[key] = Future()
+        if not is_owner:
+            return future.result()
+
+        try:
+            meta = self._fill_metadata(name, facility)
+        except BaseException as error:
+            future.set_exception(error)
+            raise
+        else:
+            future.set_result(meta)
+            return meta
+        finally:
+            with self._metadata_in_flight_lock:
+                del self._metadata_in_flight[key]
+
+    def _fill_metadata(self, name: str, facility: typing.Optional[str]) -> typing.Dict:
+        token = self._tag_metadata_cache.acquire_fill_lock(name, facility)
+        if not token:
+            meta = self._tag_metadata_cache.wait_for_metadata(name, facility)
+            if meta:
+                return meta
+
+        try:
+            meta = self._get_metadata_from_api(name, facility)
+            if meta:
+                self._tag_metadata_cache.set_metadata(name, facility, meta)
+            return meta
+        finally:
+            if token:
+                self._tag_metadata_cache.release_fill_lock(name, facility, token)
+
+    def _fill_metadata_many_single_flight(
+        self, names: typing.List[str], facility: typing.Optional[str]
+    ) -> typing.Dict[str, typing.Dict]:
+        """Fetch metadata of the tags from TS API and store it to cache once for all the concurrent callers.
+
+        Same as "_fill_metadata_single_flight", but tags that are not in flight in the process are filled in bulk.
+        """
+        owned_futures: typing.Dict[str, Future] = {}
+        other_futures: typing.Dict[str, Future] = {}
+        with self._metadata_in_flight_lock:
+            for name in names:
+                future = self._metadata_in_flight.get((name, facility))
+                if future is None:
+                    owned_futures[name] = self._metadata_in_flight[(name, facility)] = Future()
+                else:
+                    other_futures[name] = future
+
+        try:
+            metas = self._fill_metadata_many(list(owned_futures), facility)
+        except BaseException as error:
+            for future in owned_futures.values():
+                future.set_exception(error)
+            raise
+        else:
+            for name, future in owned_futures.items():
+                future.set_result(metas[name])
+        finally:
+            with self._metadata_in_flight_lock:
+                for name in owned_futures:
+                    del self._metadata_in_flight[(name, facility)]
+
+        metas.update({name: future.result() for name, future in other_futures.items()})
+        return metas
+
+    def _fill_metadata_many(
+        self, names: typing.List[str], facility: typing.Optional[str]
+    ) -> typing.Dict[str, typing.Dict]:
+        """Fill the tags to cache with one call to take the locks and one call to store the tags this process owns.
+
+        Only the tags which locks are taken by other processes are waited for.
+        """
+        if not names:
+            return {}
+
+        tokens = self._tag_metadata_cache.acquire_fill_locks(names, facility)
+        try:
+            metas = self._fetch_metadata_to_cache([name for name in names if name in tokens], facility)
+        finally:
+            self._tag_metadata_cache.release_fill_locks(tokens, facility)
+
+        waited_names = [name for name in names if name not in tokens]
+        if waited_names:
+            metas.update(self._tag_metadata_cache.wait_for_many(waited_names, facility))
+            # tags that were not filled by other processes in time are fetched by this one
+            late_names = [name for name in waited_names if not metas[name]]
+            if late_names:
+                metas.update(self._fetch_metadata_to_cache(late_names, facility))
+        return metas
+
+    def _fetch_metadata_to_cache(
+        self, names: typing.List[str], facility: typing.Optional[str]
+    ) -> typing.Dict[str, typing.Dict]:
+        metas = {name: self._get_metadata_from_api(name, facility) for name in names}
+        self._tag_metadata_cache.set_many({name: meta for name, meta in metas.items() if meta}, facility)
+        return metas
+
+    def _schedule_metadata_refresh(self, name: str, facility: typing.Optional[str]):
+        """Refresh cached metadata of the tag in the background thread (once at a time for the tag)."""
+        with self._metadata_in_flight_lock:
+            if name in self._metadata_refreshing:
+                return
+            self._metadata_refreshing.add(name)
+            if not self._metadata_refresh_executor:
+                self._metadata_refresh_executor = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix="latigo-metadata-refresh-"
+                )
+        self._metadata_refresh_executor.submit(self._refresh_metadata, name, facility)
+
+    def _refresh_metadata(self, name: str, facility: typing.Optional[str]):
+        token = None
+        try:
+            # other process refreshes the tag if the lock is taken
+            token = self._tag_metadata_cache.acquire_fill_lock(name, facility)
+            if token:
+                meta = self._get_metadata_from_api(name, facility)
+                if _itemes_present(meta):
+                    self._tag_metadata_cache.set_metadata(name, facility, meta)
+        except Exception:
+            logger.exception(f"Failed to refresh cached metadata of the tag '{name}' with facility '{facility}'")
+        finally:
+            if token:
+                self._tag_metadata_cache.release_fill_lock(name, facility, token)
+            with self._metadata_in_flight_lock:
+                self._metadata_refreshing.discard(name)
+
+    def get_meta_by_names(
+        self, names: typing.Iterable[str], facility: typing.Optional[str] = None
+    ) -> typing.Dict[str, typing.Dict]:
+        """Fetch metadata of the multiple tags.
+
+        Cached metadata is fetched with one call to cache. Missing one is fetched from Time Series API
+        concurrently and stored to cache with one more call if client is async,
+        otherwise it's filled for all the concurrent callers as in "get_meta_by_name", but in bulk.
+
+        Return:
+            {tag_name: metadata}.
+        """
+        metas = self._tag_metadata_cache.get_many(names, facility)
+        missing_names = [name for name, meta in metas.items() if not meta]
+        if not missing_names:
+            return metas
+
+        if not self._async_client:
+            metas.update(self._fill_metadata_many_single_flight(missing_names, facility))
+            return metas
+
+        metas.update(
+            self._async_client.run(
+                self._async_client.get_metadata(missing_names, facility, headers=get_auth_headers(self.session))
+            )
+        )
+        fetched_metas = {name: metas[name] for name in missing_names if metas[name]}
+        self._tag_metadata_cache.set_many(fetched_metas, facility)
+        return metas
 
     def _create_id(
         self, name: str, facility: str, description: str = "", unit: str = "", external_id: str = "",
@@ -169,7 +424,47 @@ class TimeSeriesAPIClient:
             unit: is not used for now.
             external_id: is not used for now.
         """
-        body = {
+        body = self._make_id_body(name, facility, description, unit, external_id)
+        res = self._post(self.base_url, json=body, params=None)
+        return parse_request_json(res)
+
+    def _create_ids(
+        self, descriptions: typing.Dict[str, str], facility: str
+    ) -> typing.Dict[str, typing.Union[dict, Exception]]:
+        """Create timeseries tag objects (concurrently if client is async or "max_parallel_writes" is more then 1).
+
+        Args:
+            descriptions: {tag_name: description} of the tags to be created.
+            facility: for now we assume that "facility" is
+                the same for us as "asset".
+
+        Return:
+            {tag_name: created tag object or HTTPError of its creation}.
+        """
+        if self._async_client:
+            bodies = [self._make_id_body(name, facility, description) for name, description in descriptions.items()]
+            results = self._async_client.run(
+                self._async_client.create_ids(bodies, headers=get_auth_headers(self.session))
+            )
+            return dict(zip(descriptions, results))
+
+        names = list(descriptions)
+        if len(names) > 1 and self._write_executor:
+            results = self._write_executor.map(
+                self._create_id_or_error, names, [facility] * len(names), [descriptions[name] for name in names]
+            )
+            return dict(zip(names, results))
+        return {name: self._create_id_or_error(name, facility, descriptions[name]) for name in names}
+
+    def _create_id_or_error(self, name: str, facility: str, description: str) -> typing.Union[dict, Exception]:
+        try:
+            return self._create_id(name=name, facility=facility, description=description)
+        except HTTPError as error:
+            return error
+
+    @staticmethod
+    def _make_id_body(name: str, facility: str, description: str = "", unit: str = "", external_id: str = "") -> dict:
+        return {
             "name": name,
             "description": description,
             "step": True,
@@ -177,8 +472,6 @@ class TimeSeriesAPIClient:
             "facility": facility,
             "externalId": external_id,
         }
-        res = self._post(self.base_url, json=body, params=None)
-        return parse_request_json(res)
 
     def _create_id_if_not_exists(
         self, name: str, facility: str, description: str = "", unit: str = "", external_id: str = "",
@@ -217,11 +510,126 @@ class TimeSeriesAPIClient:
                     }
                 ]
         """
-        url = f"{self.base_url}/data"
-        body = {"items": datapoints_to_store}
+        encoded_items = [
+            (item["id"], [ujson.dumps(point) for point in item["datapoints"]]) for item in datapoints_to_store
+        ]
+        return self.store_multiple_encoded_datapoints(encoded_items)
 
-        res = self._post(url=url, json=body)
-        return parse_request_json(res)
+    def store_multiple_encoded_datapoints(self, encoded_items: typing.List[EncodedItem]) -> dict:
+        """Save prediction results for multiple tag_ids with datapoints that are already encoded to JSON.
+
+        Datapoints are split to the chunks limited by "write_chunk_max_datapoints" and "write_chunk_max_bytes".
+        Chunks are stored concurrently (not more then "max_parallel_writes" at once), the chunks that failed
+        with retriable error are stored once more up to "write_retries" times.
+
+        Args:
+            - encoded_items: (ts_id, [JSON of the datapoint]) per tag (see "store_multiple_datapoints").
+
+        Raise:
+            - the last error if no chunk was stored.
+
+        Return:
+            {"stored": amount of stored datapoints, "failed": amount of not stored datapoints, "message": summary}.
+        """
+        chunks = self._make_datapoints_chunks(encoded_items)
+        stored_points = 0
+        failed_points = 0
+        last_error: typing.Optional[Exception] = None
+
+        for attempt in range(self.write_retries + 1):
+            if attempt:
+                logger.warning("Storing once more %s chunks of datapoints. Attempt %s.", len(chunks), attempt)
+                sleep(self.WRITE_RETRY_DELAY * attempt)
+
+            retriable_chunks = []
+            for (body, points), error in zip(chunks, self._post_datapoints_chunks([body for body, _ in chunks])):
+                if not error:
+                    stored_points += points
+                    continue
+                last_error = error
+                logger.error("Failed to store chunk of %s datapoints: %r", points, error)
+                if _is_retriable(error):
+                    retriable_chunks.append((body, points))
+                else:
+                    failed_points += points
+            chunks = retriable_chunks
+            if not chunks:
+                break
+
+        failed_points += sum(points for _, points in chunks)
+        if failed_points and not stored_points and last_error:
+            raise last_error
+        return {
+            "stored": stored_points,
+            "failed": failed_points,
+            "message": f"{stored_points} datapoints were stored, {failed_points} datapoints failed",
+        }
+
+    def _make_datapoints_chunks(self, encoded_items: typing.List[EncodedItem]) -> typing.List[typing.Tuple[bytes, int]]:
+        """Split datapoints to the request bodies limited by amount of the datapoints and size.
+
+        Datapoints of one tag might be split between several chunks.
+
+        Return:
+            (request body, amount of the datapoints in it) per chunk.
+        """
+        chunks: typing.List[typing.Tuple[bytes, int]] = []
+        chunk_items: typing.List[str] = []
+        chunk_points = 0
+        chunk_size = len('{"items":[]}')
+
+        def add_chunk():
+            nonlocal chunk_items, chunk_points, chunk_size
+            if chunk_items:
+                chunks.append((f'{{"items":[{",".join(chunk_items)}]}}'.encode(), chunk_points))
+            chunk_items, chunk_points, chunk_size = [], 0, len('{"items":[]}')
+
+        for time_series_id, datapoints in encoded_items:
+            item_prefix = f'{{"id":{ujson.dumps(time_series_id)},"datapoints":['
+            item_overhead = len(item_prefix) + len("]},")
+            start = 0
+            size = chunk_size + item_overhead
+            for i, point in enumerate(datapoints):
+                point_size = len(point) + 1
+                is_full = chunk_points + i - start >= self.write_chunk_max_datapoints
+                if (is_full or size + point_size > self.write_chunk_max_bytes) and (i > start or chunk_items):
+                    if i > start:
+                        chunk_items.append(f'{item_prefix}{",".join(datapoints[start:i])}]}}')
+                        chunk_points += i - start
+                    add_chunk()
+                    start = i
+                    size = chunk_size + item_overhead
+                size += point_size
+            if start < len(datapoints):
+                chunk_items.append(f'{item_prefix}{",".join(datapoints[start:])}]}}')
+                chunk_points += len(datapoints) - start
+                chunk_size = size
+        add_chunk()
+        return chunks
+
+    def _post_datapoints_chunks(self, bodies: typing.List[bytes]) -> typing.List[typing.Optional[Exception]]:
+        """Store the chunks of datapoints concurrently.
+
+        Return:
+            None or error of the storing per chunk, in the order of chunks.
+        """
+        if self._async_client:
+            results = self._async_client.run(
+                self._async_client.store_multiple_datapoints(
+                    bodies, headers=get_auth_headers(self.session), limit=self.max_parallel_writes
+                )
+            )
+            return [res if isinstance(res, Exception) else None for res in results]
+        if len(bodies) > 1 and self._write_executor:
+            return list(self._write_executor.map(self._post_datapoints_chunk, bodies))
+        return [self._post_datapoints_chunk(body) for body in bodies]
+
+    def _post_datapoints_chunk(self, body: bytes) -> typing.Optional[Exception]:
+        try:
+            parse_request_json(self._post(url=f"{self.base_url}/data", data=body, headers=JSON_HEADERS))
+        except RequestException as error:
+            return error
+        return None
 
     def replace_cached_metadata_with_new(self, tag_name: str, facility: str, description: str) -> dict:
         """Fetch new tag metadata from TS API and replace it in cache.
@@ -231,6 +639,9 @@ class TimeSeriesAPIClient:
             - facility: internal TS project identifier. Example: "1000";
             - description: tag description.
         """
+        # cached value is outdated, do not take it from the in-process tier anymore
+        self._tag_metadata_cache.invalidate(tag_name)
+
         # get from TS API
         meta = self._get_metadata_from_api(tag_name)
 
@@ -312,3 +723,11 @@ class TimeSeriesAPIClient:
         if len(items) > 1:
             raise ValueError(f"More then 1 tag object were found in TS API for tag name '{tag_name}'. Data: {items}")
         return items[0]
+
+
+def _is_retriable(error: Exception) -> bool:
+    """Check if request that failed with such error might succeed next time (connection error, 429 or 5xx)."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return True
+    return response.status_code == 429 or response.status_code >= 500
@@ -1,4 +1,5 @@
 import logging
+import threading
 import typing
 
 import requests
@@ -10,6 +11,7 @@ from latigo.time_series_api.time_series_exceptions import NoCommonAssetFound
 logger = logging.getLogger(__name__)
 
 timeseries_client_auth_session: typing.Optional[requests.Session] = None
+_auth_session_lock = threading.Lock()
 
 
 """
@@ -51,11 +53,13 @@ def _itemes_present(res: dict) -> bool:
 
 
 def get_auth_session(auth_config: dict, force: bool = False):
+    """Return the session that is shared between all the Time Series API clients (and threads)."""
     global timeseries_client_auth_session
-    if not timeseries_client_auth_session or force:
-        timeseries_client_auth_session = requests_ms_auth.MsRequestsSession(
-            requests_ms_auth.MsSessionConfig(**auth_config)
-        )
+    with _auth_session_lock:
+        if not timeseries_client_auth_session or force:
+            timeseries_client_auth_session = requests_ms_auth.MsRequestsSession(
+                requests_ms_auth.MsSessionConfig(**auth_config)
+            )
 
     return timeseries_client_auth_session
 
@@ -0,0 +1,96 @@
+import logging
+import typing
+from concurrent.futures import ThreadPoolExecutor
+
+from latigo.model_info import Model, ModelInfoProviderInterface
+from latigo.types import PredictionDataSetMetadata
+
+from .misc import MODEL_INPUT_OPERATION
+from .prediction_storage_provider import OutputTagPlan, TimeSeriesAPIPredictionStorageProvider
+
+logger = logging.getLogger(__name__)
+
+# Gordo anomaly detector operations that are made for each target tag of the model
+TAG_OPERATIONS = ("model-output", "tag-anomaly-scaled", "tag-anomaly-unscaled", "anomaly-confidence")
+# Gordo anomaly detector operations that are made for the model as a whole (without tag name)
+TOTAL_OPERATIONS = ("total-anomaly-scaled", "total-anomaly-unscaled", "total-anomaly-confidence")
+MAX_PARALLEL_MODELS = 4
+
+
+class OutputTagsOnboarding:
+    """Create output tags of the models in bulk before their first prediction is stored.
+
+    Output tags of the model are expected from its target tags and the Gordo operations from config.
+    Tags that already exist are only put to cache, missing ones are created concurrently.
+    """
+
+    def __init__(
+        self,
+        model_info_provider: ModelInfoProviderInterface,
+        prediction_storage_provider: TimeSeriesAPIPredictionStorageProvider,
+        config: typing.Optional[dict] = None,
+    ):
+        config = config or {}
+        self.model_info_provider = model_info_provider
+        self.prediction_storage_provider = prediction_storage_provider
+        self.tag_operations = tuple(config.get("tag_operations", TAG_OPERATIONS))
+        self.total_operations = tuple(config.get("total_operations", TOTAL_OPERATIONS))
+        self.max_parallel_models = config.get("max_parallel_models", MAX_PARALLEL_MODELS)
+        if not isinstance(self.max_parallel_models, int) or self.max_parallel_models < 1:
+            raise ValueError(f"'max_parallel_models' should be a positive integer, got '{self.max_parallel_models}'")
+
+    def __str__(self):
+        return f"OutputTagsOnboarding({self.prediction_storage_provider})"
+
+    def expected_prediction_columns(self, model: Model) -> typing.List[typing.Tuple[str, str]]:
+        """Make the columns of the prediction dataframe that are expected for the model.
+
+        Input tags go first, cause facility of the output tags is taken from the first tag of the columns.
+        """
+        target_tags = model.target_tag_list or model.tag_list
+        columns = [(MODEL_INPUT_OPERATION, tag.name) for tag in model.tag_list]
+        columns.extend((operation, tag.name) for operation in self.tag_operations for tag in target_tags)
+        columns.extend((operation, "") for operation in self.total_operations)
+        return columns
+
+    def onboard_model(self, project_name: str, model_name: str) -> OutputTagPlan:
+        """Find or create output tags of the model from the latest revision of the project.
+
+        Raise:
+            - ValueError: if model was not found.
+        """
+        revision = self.model_info_provider.get_project_latest_revisions(project_name)
+        model = self.model_info_provider.get_machine_by_key(project_name, model_name, revision)
+        if not model:
+            raise ValueError(f"Model '{model_name}' of the project '{project_name}' was not found")
+
+        meta_data = PredictionDataSetMetadata(
+            project_name=project_name, model_name=model_name, model_training_period=None, revision=revision
+        )
+        return self.prediction_storage_provider.prepare_output_tags(meta_data, self.expected_prediction_columns(model))
+
+    def onboard(self, model_names_by_project: typing.Dict[str, typing.List[str]]) -> typing.Dict[str, int]:
+        """Onboard the models concurrently, errors of a model are logged and do not stop the others.
+
+        Args:
+            model_names_by_project: { "project_name": [ "model_1", "model_2", etc. ], ... }.
+
+        Return:
+            amount of the "onboarded" and "failed" models.
+        """
+        keys = [(project, model) for project, models in model_names_by_project.items() for model in models]
+        with ThreadPoolExecutor(max_workers=self.max_parallel_models, thread_name_prefix="latigo-onboarding-") as pool:
+            results = list(pool.map(lambda key: self._onboard_model_safe(*key), keys))
+
+        onboarded = sum(results)
+        logger.info(f"Output tags were onboarded for {onboarded} models, {len(keys) - onboarded} models failed")
+        return {"onboarded": onboarded, "failed": len(keys) - onboarded}
+
+    def _onboard_model_safe(self, project_name: str, model_name: str) -> bool:
+        try:
+            plan = self.onboard_model(project_name, model_name)
+        except Exception:
+            logger.exception(f"Could not onboard output tags of the model '{model_name}' of project '{project_name}'")
+            return False
+        logger.debug(f"{len(plan.output_time_series_ids)} output tags are ready for model '{model_name}'")
+        return True
@@ -1,24 +1,48 @@
 import logging
-import math
-from typing import Dict, Tuple
+import threading
+from itertools import repeat
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
 
+import numpy as np
 from requests.exceptions import HTTPError
 
 from latigo.metadata_api.data_structures import OutputTag
 from latigo.prediction_storage import PredictionStorageProviderInterface
 from latigo.log import measure
-from latigo.types import PredictionDataSet
+from latigo.types import PredictionDataSet, PredictionDataSetMetadata
 from latigo.utils import rfc3339_from_datetime
 
 from .client import TimeSeriesAPIClient
-from .misc import INVALID_OPERATIONS, get_time_series_id_from_response, prediction_data_naming_convention
+from .time_series_exceptions import PredictionNotStored
+from .misc import (
+    INVALID_OPERATIONS,
+    _itemes_present,
+    get_time_series_id_from_response,
+    prediction_data_naming_convention,
+)
 
 logger = logging.getLogger(__name__)
 
+_POINT_SUFFIX = ',"status":"0"}'  # the same ending of every encoded datapoint
+
+
+class OutputTagPlan(NamedTuple):
+    """Output tags of the model prediction columns. It's the same till model revision or columns are not changed."""
+
+    revision: Optional[str]
+    columns: Tuple[Tuple[str, str], ...]
+    # ('model-output', '1903.R-29L.MA_Y'): '1903.R-29LT.MA_Y|24ae-6d22-a6-b8-337-999|model-output'
+    output_tag_names: Dict[Tuple[str, str], str]
+    # ('model-output', '1903.R-29LT1047.MA_Y'): '73ef5e6c-9142-4127-be64-a68e6916'
+    output_time_series_ids: Dict[Tuple[str, str], str]
+
 
 class TimeSeriesAPIPredictionStorageProvider(TimeSeriesAPIClient, PredictionStorageProviderInterface):
     def __init__(self, config: dict):
         super().__init__(config)
+        # output tag plan per model, {(project_name, model_name): OutputTagPlan}
+        self._output_tag_plans: Dict[Tuple[str, str], OutputTagPlan] = {}
+        self._output_tag_plans_lock = threading.Lock()
 
     def __str__(self):
         return f"TimeSeriesAPIPredictionStorageProvider({self.base_url})"
@@ -27,6 +51,8 @@ class TimeSeriesAPIPredictionStorageProvider(TimeSeriesAPIClient, PredictionStor
     def put_prediction(self, prediction_data: PredictionDataSet):
         """Store prediction data in time series api.
 
+        Output tags of the model are resolved once per model revision and dataframe columns (see "OutputTagPlan").
+
         Args:
             prediction_data: dataframe as a result of prediction execution and prediction metadata.
 
@@ -42,6 +68,7 @@ class TimeSeriesAPIPredictionStorageProvider(TimeSeriesAPIClient, PredictionStor
             - ValueError: if more then one tag with such name were found.
             - ValueError: if 'facility' is missing.
             - ValueError: no tag was found in the dataframe columns.
+            - PredictionNotStored: if some datapoints were not stored after the retries.
         """
         data = prediction_data.data
         if not data:
@@ -50,20 +77,116 @@ class TimeSeriesAPIPredictionStorageProvider(TimeSeriesAPIClient, PredictionStor
         if len(data) > 1:
             raise Exception(f"Only one prediction could be passed for storing, but passed - '{len(data)}'")
 
+        row = data[0]
+        df = row[1]
+        plan = self._get_output_tag_plan(prediction_data.meta_data, tuple(df.columns))
+        output_time_series_ids = plan.output_time_series_ids
+
+        skipped_values = 0
+        stored_values = 0
+        skipped_tags = 0
+        logger.info(f"Storing predictions for %s columns (before filtering)", len(df.columns))
+
+        # times are formatted once for all the columns. Example: '{"time":"2020-05-30T10:10:00Z","value":'
+        point_prefixes = np.array(
+            [f'{{"time":"{rfc3339_from_datetime(time)}","value":' for time in df.index], dtype=object
+        )
+        encoded_datapoints = []
+        for key, item in df.items():
+            operation, tag_name, *_ = key
+            if operation in INVALID_OPERATIONS:
+                continue
+            time_series_id = output_time_series_ids[key]
+            if not time_series_id:
+                raise ValueError(f"Time Series ID for prediction storing was not found: key - '{key}'")
+
+            values = item.to_numpy(dtype=float)
+            is_stored = np.isfinite(values)
+            values_to_store = values[is_stored]
+            skipped_values += len(values) - len(values_to_store)
+            stored_values += len(values_to_store)
+
+            if not len(values_to_store):  # skip empty datapoints, no need make call to TS API with no data to store
+                skipped_tags += 1
+                continue
+            # "repr" of float is the shortest representation that is valid JSON for the finite values
+            datapoints = list(
+                map("".join, zip(point_prefixes[is_stored], map(repr, values_to_store.tolist()), repeat(_POINT_SUFFIX)))
+            )
+            encoded_datapoints.append((time_series_id, datapoints))
+
+        try:
+            res = self.store_multiple_encoded_datapoints(encoded_datapoints)
+        except HTTPError as error:
+            if error.response is not None and error.response.status_code in (404, 409):
+                self._invalidate_output_tag_plan(prediction_data.meta_data)
+            raise
+        if res["failed"]:
+            # some output tags might be deleted/replaced in TS API
+            self._invalidate_output_tag_plan(prediction_data.meta_data)
+            raise PredictionNotStored(f"[Not all data stored to TS API] Storing results: {res['message']}")
+        if skipped_values:
+            logger.warning(
+                f"[Not all data stored to TS API] {stored_values} values stored, {skipped_values} NaNs/infs skipped. "
+                f"{skipped_tags} tags skipped. Storing results: {res['message']}"
+            )
+
+        return dict(plan.output_tag_names), dict(output_time_series_ids)
+
+    def prepare_output_tags(
+        self, meta_data: PredictionDataSetMetadata, columns: Iterable[Tuple[str, str]]
+    ) -> OutputTagPlan:
+        """Find or create output tags of the model prediction columns ahead of the first prediction storing.
+
+        Missing output tags are created in bulk and their metadata is cached, so the first "put_prediction"
+        of the model makes only cache lookups.
+
+        Args:
+            - meta_data: metadata of the model predictions;
+            - columns: expected prediction dataframe columns. Example: [('model-output', '1903.R-29LT.MA_Y')].
+        """
+        return self._get_output_tag_plan(meta_data, tuple(columns))
+
+    def _get_output_tag_plan(
+        self, meta_data: PredictionDataSetMetadata, columns: Tuple[Tuple[str, str], ...]
+    ) -> OutputTagPlan:
+        """Return cached output tag plan of the model or make the new one if revision or columns were changed."""
+        model_key = (meta_data.project_name, meta_data.model_name)
+        with self._output_tag_plans_lock:
+            plan = self._output_tag_plans.get(model_key)
+        if plan and plan.revision == meta_data.revision and plan.columns == columns:
+            return plan
+
+        plan = self._make_output_tag_plan(meta_data, columns)
+        with self._output_tag_plans_lock:
+            self._output_tag_plans[model_key] = plan
+        return plan
+
+    def _invalidate_output_tag_plan(self, meta_data: PredictionDataSetMetadata):
+        with self._output_tag_plans_lock:
+            self._output_tag_plans.pop((meta_data.project_name, meta_data.model_name), None)
+
+    def _make_output_tag_plan(
+        self, meta_data: PredictionDataSetMetadata, columns: Tuple[Tuple[str, str], ...]
+    ) -> OutputTagPlan:
+        """Resolve output tag names and Time Series IDs for the prediction dataframe columns.
+
+        Output tags that are missing in TS API are created.
+        """
         # output_tag_names: ('model-output', '1903.R-29L.MA_Y'): '1903.R-29LT.MA_Y|24ae-6d22-a6-b8-337-999|model-output'
         output_tag_names: Dict[Tuple[str, str], str] = {}
         # "output_time_series_ids": ('model-output', '1903.R-29LT1047.MA_Y'): '73ef5e6c-9142-4127-be64-a68e6916'
         output_time_series_ids: Dict[Tuple[str, str], str] = {}
-        model_name = prediction_data.meta_data.model_name
-        row = data[0]
-        df = row[1]
+        model_name = meta_data.model_name
 
-        first_not_empty_tag = next((tag_name for _, tag_name in df.columns if tag_name), None)
+        first_not_empty_tag = next((tag_name for _, tag_name in columns if tag_name), None)
         if first_not_empty_tag is None:
-            raise ValueError(f"No tag was found in the dataframe columns {df.columns}")
+            raise ValueError(f"No tag was found in the dataframe columns {columns}")
         common_facility = self.get_facility_by_tag_name(tag_name=first_not_empty_tag)
 
-        for col in df.columns:
+        # output_tag_descriptions: '1903.R-29LT.MA_Y|24ae-6d22-a6-b8-337-999|model-output': 'Gordo model-output - ...'
+        output_tag_descriptions: Dict[str, str] = {}
+        for col in columns:
             operation = col[0]
             tag_name = col[1]
 
@@ -73,59 +196,68 @@ class TimeSeriesAPIPredictionStorageProvider(TimeSeriesAPIClient, PredictionStor
             if not output_tag_name:
                 continue
             output_time_series_ids[col] = ""
-            description = OutputTag.make_output_tag_description(operation, tag_name)
-            try:
-                meta = self._create_id_if_not_exists(
-                    name=output_tag_name, description=description, facility=common_facility,
-                )
-            except HTTPError as error:
-                if error.response.status_code != 409:
-                    raise
-
-                # if such tag_name might already exists in the TS try to get/create once more.
-                meta = self.replace_cached_metadata_with_new(
-                    tag_name=output_tag_name, facility=common_facility, description=description
-                )
+            output_tag_names[col] = output_tag_name
+            output_tag_descriptions[output_tag_name] = OutputTag.make_output_tag_description(operation, tag_name)
 
+        metas = self._get_or_create_output_tags(output_tag_descriptions, facility=common_facility)
+        for col, output_tag_name in output_tag_names.items():
+            meta = metas.get(output_tag_name)
             if not meta:
                 raise ValueError(f"Could not create/find id for name {output_tag_name}, {col}, {meta}")
             time_series_id = get_time_series_id_from_response(meta)
             if not time_series_id:
                 raise ValueError(f"Could not get ID for {output_tag_name}, {col}, {meta}")
-            output_tag_names[col] = output_tag_name
             output_time_series_ids[col] = time_series_id
-        skipped_values = 0
-        stored_values = 0
-        skipped_tags = 0
-        logger.info(f"Storing predictions for %s columns (before filtering)", len(df.columns))
 
-        datapoints_to_store = []
-        for key, item in df.items():
-            operation, tag_name, *_ = key
-            if operation in INVALID_OPERATIONS:
-                continue
-            datapoints = []
-            time_series_id = output_time_series_ids[key]
-            if not time_series_id:
-                raise ValueError(f"Time Series ID for prediction storing was not found: key - '{key}'")
+        return OutputTagPlan(
+            revision=meta_data.revision,
+            columns=columns,
+            output_tag_names=output_tag_names,
+            output_time_series_ids=output_time_series_ids,
+        )
 
-            for time, value in item.items():
-                if math.isnan(value):
-                    skipped_values += 1
-                    continue
-                stored_values += 1
-                datapoints.append({"time": rfc3339_from_datetime(time), "value": value, "status": "0"})
+    def _get_or_create_output_tags(self, output_tag_descriptions: Dict[str, str], facility: str) -> Dict[str, dict]:
+        """Fetch metadata of the output tags with one call to cache and create the tags that are missing in TS API.
 
-            if not datapoints:  # skip empty datapoints, no need make call to TS API with no data to store
-                skipped_tags += 1
-                continue
-            datapoints_to_store.append({"id": time_series_id, "datapoints": datapoints})
+        Missing tags are created concurrently if client is async or "max_parallel_writes" is more then 1.
 
-        res = self.store_multiple_datapoints(datapoints_to_store)
-        if skipped_values:
-            logger.warning(
-                f"[Not all data stored to TS API] {stored_values} values stored, {skipped_values} NaNs skipped. "
-                f"{skipped_tags} tags skipped. Storing results: {res['message']}"
+        Args:
+            - output_tag_descriptions: {output_tag_name: description};
+            - facility: internal TS project identifier. Example: "1000".
+
+        Return:
+            {output_tag_name: metadata}.
+        """
+        try:
+            metas = self.get_meta_by_names(names=output_tag_descriptions, facility=facility)
+        except HTTPError as error:
+            if error.response.status_code != 409:
+                raise
+            # if such tag_names might already exist in the TS try to get/create them once more.
+            return {
+                tag_name: self.replace_cached_metadata_with_new(
+                    tag_name=tag_name, facility=facility, description=description
+                )
+                for tag_name, description in output_tag_descriptions.items()
+            }
+
+        missing_descriptions = {
+            tag_name: description
+            for tag_name, description in output_tag_descriptions.items()
+            if not _itemes_present(metas.get(tag_name))
+        }
+        created_metas = {}
+        for tag_name, created in self._create_ids(missing_descriptions, facility=facility).items():
+            if not isinstance(created, Exception):
+                created_metas[tag_name] = created
+                continue
+            if not isinstance(created, HTTPError) or created.response.status_code != 409:
+                raise created
+            # if such tag_name might already exists in the TS try to get/create once more.
+            metas[tag_name] = self.replace_cached_metadata_with_new(
+                tag_name=tag_name, facility=facility, description=missing_descriptions[tag_name]
             )
 
-        return output_tag_names, output_time_series_ids
+        self._tag_metadata_cache.set_many(created_metas, facility)
+        metas.update(created_metas)
+        return metas
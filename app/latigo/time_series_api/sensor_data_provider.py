@@ -2,7 +2,7 @@ import logging
 import typing
 
 from latigo.sensor_data import SensorDataProviderInterface
-from latigo.types import LatigoSensorTag, SensorDataSet, SensorDataSpec, TimeRange
+from latigo.types import TIME_SERIES_IDS_META_KEY, LatigoSensorTag, SensorDataSet, SensorDataSpec, TimeRange
 
 from ..log import measure
 from .client import TimeSeriesAPIClient
@@ -49,6 +49,10 @@ class TimeSeriesAPISensorDataProvider(TimeSeriesAPIClient, SensorDataProviderInt
         """Fetch sensor data from TS API per the range.
 
         This func uses less calls to fetch the data: 1 call per 100 tags.
+        Resolved Time Series IDs of the tags are returned in the "meta_data" to not resolve them once more.
+
+        Tags that do not exist in TS API are marked in cache (see "get_tags_without_data").
+        Tags with no datapoints in the range are not marked: the next range might already have them.
 
         Note: do not use "tag.asset" in calls to the TS API.
             It's provided by user OR Gordo and not compatible with TS.
@@ -57,16 +61,25 @@ class TimeSeriesAPISensorDataProvider(TimeSeriesAPIClient, SensorDataProviderInt
 
         tag_ids_names: typing.Dict[str, str] = {}
         common_facility = self.get_facility_by_tag_name(tag_name=tag_list[0].name)
+        metas = self.get_meta_by_names(names=[tag.name for tag in tag_list], facility=common_facility)
+        missing_names = []
         for raw_tag in tag_list:
             tag: LatigoSensorTag = raw_tag
             name = tag.name
-            meta = self.get_meta_by_name(name=name, facility=common_facility)
+            meta = metas.get(name)
             if not meta:
                 raise ValueError("'meta' was not found for name '%s' and facility '%s'", name, common_facility)
 
             item = _find_tag_in_data(meta, name)
+            if not item:
+                missing_names.append(name)
+                continue
             tag_ids_names[item["id"]] = name
 
+        if missing_names:
+            self._tag_metadata_cache.set_no_data(missing_names)
+            raise ValueError(f"Tags {missing_names} were not found in TS API for facility '{common_facility}'")
+
         tags_data = self._fetch_data_for_multiple_ids(tag_ids=list(tag_ids_names), time_range=time_range)
         empty_tags_ids = [tag_data["id"] for tag_data in tags_data if not tag_data.get("datapoints", None)]
 
@@ -82,4 +95,11 @@ class TimeSeriesAPISensorDataProvider(TimeSeriesAPIClient, SensorDataProviderInt
             tag_data["name"] = tag_ids_names[tag_id]
 
         dataframes = SensorDataSet.to_gordo_dataframe(tags_data, time_range.from_time, time_range.to_time)
-        return SensorDataSet(time_range=time_range, data=dataframes), None
+        time_series_ids = {name: tag_id for tag_id, name in tag_ids_names.items()}
+        return SensorDataSet(
+            time_range=time_range, data=dataframes, meta_data={TIME_SERIES_IDS_META_KEY: time_series_ids}
+        ), None
+
+    def get_tags_without_data(self, tag_names: typing.Iterable[str]) -> typing.List[str]:
+        """Return the tags that were not found in TS API during last "no_data_cache_ttl" seconds."""
+        return self._tag_metadata_cache.get_no_data(tag_names)
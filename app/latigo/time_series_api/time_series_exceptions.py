@@ -10,3 +10,7 @@ class NoCommonAssetFound(Exception):
             "No common asset found in dataframe columns. " f"Parsed data: {'; '.join(col[1] for col in column_values)}"
         )
         super().__init__(self.message)
+
+
+class PredictionNotStored(Exception):
+    """Raise if some datapoints of the prediction were not stored, so the task should be processed once more."""
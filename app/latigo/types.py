@@ -5,13 +5,16 @@ from collections import namedtuple
 from dataclasses import dataclass, field
 from datetime import datetime
 
+import numpy as np
 import pandas as pd
 from dataclasses_json import DataClassJsonMixin
 
-from latigo.utils import datetime_to_utc_as_str, rfc3339_from_datetime
+from latigo.utils import rfc3339_from_datetime
 
 logger = logging.getLogger(__name__)
 
+TIME_SERIES_API_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
+
 
 @dataclass
 class Task(DataClassJsonMixin):
@@ -50,6 +53,9 @@ class SensorDataSpec:
     tag_list: typing.List[LatigoSensorTag]
 
 
+TIME_SERIES_IDS_META_KEY = "time_series_ids"  # key of {tag_name: time_series_id} in SensorDataSet.meta_data
+
+
 @dataclass
 class SensorDataSet:
     time_range: TimeRange
@@ -84,6 +90,7 @@ class SensorDataSet:
         """Format data for the DataFrames as Gordo required for the predictions.
 
         This function will filter incoming data and skip that is out of prediction time period.
+        Times of the tag are parsed in one pass and filtered with one datetime mask.
 
         Args:
             data: taken from Time Series API income-tag`s data for making predictions on.
@@ -94,35 +101,51 @@ class SensorDataSet:
             DataFrames for predictions (might be filtered).
         """
         dataframes: typing.List = []
-        start_date = datetime_to_utc_as_str(prediction_start_date)
-        end_date = datetime_to_utc_as_str(prediction_end_date)
+        start_date = _to_utc_timestamp(prediction_start_date)
+        end_date = _to_utc_timestamp(prediction_end_date)
+        skipped_tags: typing.Dict[str, int] = {}  # {tag_name: amount of skipped values}
 
         for tag_data in data:
-            values = []
-            index = []
             datapoints = tag_data["datapoints"]
             tag_name = tag_data["name"]
 
-            for point in datapoints:
-                point_time = point["time"]
-                point_value = point["value"]
-
-                # skip data points that are out of prediction time range.
-                if start_date > point_time or point_time > end_date:
-                    logger.error(
-                        f"Skipped value before sending for prediction '{point_value}' with time {point_time}. "
-                        f"From {start_date} to {end_date}. Tag {tag_name}"
-                    )
-                    continue
-                values.append(point_value)
-                index.append(point_time)
-
-            index = pd.to_datetime(index, infer_datetime_format=True, utc=True)
+            index = _parse_time_series_api_times([point["time"] for point in datapoints])
+            values = np.fromiter((point["value"] for point in datapoints), dtype=float, count=len(datapoints))
+
+            # skip data points that are out of prediction time range.
+            in_time_range = (index >= start_date) & (index <= end_date)
+            if not in_time_range.all():
+                skipped_tags[tag_name] = int((~in_time_range).sum())
+                index = index[in_time_range]
+                values = values[in_time_range]
+
             s = pd.Series(data=values, index=index, name=tag_name)
             dataframes.append(s)
+
+        if skipped_tags:
+            logger.error(
+                f"Skipped {sum(skipped_tags.values())} values before sending for prediction that are out of "
+                f"time range from {start_date} to {end_date}. Skipped values per tag: {skipped_tags}"
+            )
         return dataframes
 
 
+def _to_utc_timestamp(target: datetime) -> pd.Timestamp:
+    """Make UTC timestamp from the datetime. If no timezone - UTC timezone is taken."""
+    timestamp = pd.Timestamp(target)
+    if timestamp.tzinfo is None:
+        return timestamp.tz_localize("UTC")
+    return timestamp.tz_convert("UTC")
+
+
+def _parse_time_series_api_times(times: typing.List[str]) -> pd.DatetimeIndex:
+    """Parse RFC3339 times of the Time Series API in one pass. Example of time: "2020-04-10T10:00:00.000Z"."""
+    try:
+        return pd.to_datetime(times, format=TIME_SERIES_API_TIME_FORMAT, utc=True)
+    except ValueError:  # not all the times are in the usual format, e.g. without fractional part of second
+        return pd.to_datetime(times, utc=True)
+
+
 class ModelTrainingPeriod(typing.NamedTuple):
     """Training period of the model that is in the yaml file (not the period of the prediction)."""
 
@@ -154,9 +177,17 @@ class PredictionDataSetMetadata:
 
 @dataclass
 class PredictionDataSet:
+    """Prediction results.
+
+    Dataclass attributes:
+        input_time_series_ids: {tag_name: time_series_id} of the input tags that were resolved on the data fetching.
+            Might be empty if IDs were not resolved.
+    """
+
     time_range: TimeRange
     data: typing.Optional[typing.Any]
     meta_data: PredictionDataSetMetadata
+    input_time_series_ids: typing.Dict[str, str] = field(default_factory=dict)
 
     def ok(self):
         return True
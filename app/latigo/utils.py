@@ -3,6 +3,7 @@ import logging
 import os.path
 import pprint
 import re
+import resource
 import traceback
 import typing
 from concurrent.futures import wait
@@ -251,6 +252,19 @@ def print_process_info():
     print(f"Process id:{os.getpid()}")
 
 
+def get_process_rss_mb() -> float:
+    """Return resident memory (RSS) of the current process in megabytes.
+
+    Current RSS is read from "/proc" on Linux, peak RSS of the process is used on other platforms.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * resource.getpagesize() / (1024 * 1024)
+    except (OSError, IndexError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
 def read_file(fname, strip=True):
     fn = os.path.join(os.path.dirname(os.path.abspath(__file__)), fname)
     data = ""
@@ -9,7 +9,6 @@ import fakeredis
 import inject
 import pandas as pd
 import pytest
-from redis import StrictRedis
 from requests import Response
 
 latigo_path: str = os.path.abspath(os.path.join(os.path.dirname(__file__), "../app/"))
@@ -19,6 +18,7 @@ from latigo.executor import PredictionExecutor
 from latigo.gordo import GordoModelInfoProvider
 from latigo.scheduler import Scheduler
 from latigo.time_series_api import TimeSeriesAPIClient
+from latigo.time_series_api.cache_backends import CacheBackend
 
 
 SCHEDULER_PREDICTION_DELAY = 1  # days
@@ -176,10 +176,25 @@ def is_executor_ready():
     return inner
 
 
+@pytest.fixture
+def get_task_from(basic_executor):
+    """Provide factory of the "get_task" side effect that returns the given tasks and then stops the executor."""
+    def make_get_task(tasks):
+        queued_tasks = iter(tasks)
+
+        def get_task():
+            task = next(queued_tasks, None)
+            if task is None:
+                basic_executor._is_ready = False
+            return task
+        return get_task
+    return make_get_task
+
+
 @pytest.fixture(autouse=True)
 def configure_dependencies():
     inject.clear_and_configure(
-        lambda binder: binder.bind(StrictRedis, fakeredis.FakeStrictRedis()), bind_in_runtime=False
+        lambda binder: binder.bind(CacheBackend, fakeredis.FakeStrictRedis()), bind_in_runtime=False
     )
     yield
     inject.clear()
@@ -1,7 +1,11 @@
 from unittest.mock import Mock, patch
 
+from gordo.client.io import BadGordoRequest
+from gordo.machine.dataset.sensor_tag import SensorTag
+
 import pytest
 
+from latigo.types import LatigoSensorTag
 from tests.factories.gordo import MachineFactory
 
 parametrized_get_model_data = [
@@ -61,3 +65,71 @@ def test_get_all_model_names_by_project(models_by_project, gordo_model_info_prov
     ):
         res = gordo_model_info_provider.get_all_model_names_by_project(list(models_by_project.keys()))
     assert models_by_project == res
+
+
+def make_machine(name: str, tag_names=("tag-1", "tag-2")) -> Mock:
+    machine = Mock(project_name="project", dataset=Mock(tag_list=[SensorTag(tag, "asset") for tag in tag_names]))
+    machine.name = name
+    return machine
+
+
+@patch("latigo.gordo.model_info_provider.GordoClientPool.allocate_instance")
+def test_revision_machines_are_fetched_once(allocate_instance_mock, gordo_model_info_provider):
+    client = allocate_instance_mock.return_value
+    client.get_revisions.return_value = {"latest": "111"}
+    client._get_machines.return_value = [make_machine("model-1"), make_machine("model-2", ["tag-3"])]
+
+    period = gordo_model_info_provider.get_model_training_dates("project", "model-1", revision="111")
+    spec = gordo_model_info_provider.get_spec("project", "model-2")
+    gordo_model_info_provider.get_spec("project", "model-1", revision="111")
+
+    client._get_machines.assert_called_once_with(revision="111")
+    client.get_revisions.assert_called_once_with()
+    assert period.train_start_date == client._get_machines.return_value[0].dataset.train_start_date
+    assert spec.tag_list == [LatigoSensorTag("tag-3", "asset")]
+
+
+@patch("latigo.gordo.model_info_provider.GordoClientPool.allocate_instance")
+def test_new_revision_is_fetched(allocate_instance_mock, gordo_model_info_provider):
+    client = allocate_instance_mock.return_value
+    client.get_revisions.side_effect = [{"latest": "111"}, {"latest": "222"}]
+    client._get_machines.return_value = [make_machine("model-1")]
+    gordo_model_info_provider.revision_cache_ttl = 0
+
+    assert gordo_model_info_provider.get_project_latest_revisions("project") == "111"
+    gordo_model_info_provider.get_spec("project", "model-1", revision="111")
+    assert gordo_model_info_provider.get_project_latest_revisions("project") == "222"
+    gordo_model_info_provider.get_spec("project", "model-1", revision="222")
+
+    assert client._get_machines.call_count == 2
+
+
+@patch("latigo.gordo.model_info_provider.GordoClientPool.allocate_instance")
+def test_machine_missing_in_revision_is_fetched_separately(allocate_instance_mock, gordo_model_info_provider):
+    client = allocate_instance_mock.return_value
+    client._get_machines.side_effect = [[make_machine("model-1")], [make_machine("model-2")]]
+
+    model = gordo_model_info_provider.get_machine_by_key("project", "model-2", revision="111")
+    gordo_model_info_provider.get_machine_by_key("project", "model-2", revision="111")
+
+    assert model.model_name == "model-2"
+    assert client._get_machines.call_count == 2
+    client._get_machines.assert_called_with(revision="111", machine_names=["model-2"])
+
+
+@patch("latigo.gordo.model_info_provider.GordoClientPool.allocate_instance")
+def test_machines_are_fetched_one_by_one_if_revision_failed(allocate_instance_mock, gordo_model_info_provider):
+    client = allocate_instance_mock.return_value
+    failed_machine_error = BadGordoRequest(
+        "We failed to get response while fetching resource: Machine metadata for 'model-2'"
+    )
+    client._get_machines.side_effect = [failed_machine_error, [make_machine("model-1")], failed_machine_error]
+
+    for _ in range(2):
+        model = gordo_model_info_provider.get_machine_by_key("project", "model-1", revision="111")
+        assert model.model_name == "model-1"
+        assert gordo_model_info_provider.get_machine_by_key("project", "model-2", revision="111") is None
+
+    # revision is not re-fetched, broken machine is not re-fetched till its missing entry expires
+    assert client._get_machines.call_count == 3
+    client._get_machines.assert_called_with(revision="111", machine_names=["model-2"])
@@ -1,29 +1,108 @@
 """Test for the Kafka producers and consumers."""
-from unittest.mock import patch, sentinel, Mock, ANY
+import threading
+import typing
+from datetime import datetime, timezone
+from time import monotonic, sleep
+from unittest.mock import patch, sentinel, Mock, ANY, call
 
 import pytest
+from confluent_kafka import KafkaError, TopicPartition
 
-from latigo.task_queue.kafka import KafkaTaskQueueSender
+from latigo.task_queue import deserialize_task, deserialize_tasks, serialize_task
+from latigo.task_queue.kafka import KafkaTaskQueueReceiver, KafkaTaskQueueSender, OffsetTracker, get_task_format
 from latigo.types import Task
+from tests.factories.task import TaskFactory
 
 
 @pytest.fixture
 def sender():
     """Provide KafkaTaskQueueSender with mocked Producer."""
+    config = {"bootstrap.servers": "mock"}
     with patch("latigo.task_queue.kafka.Producer"), patch(
-        "latigo.task_queue.kafka.prepare_kafka_config", return_value=(sentinel.config, sentinel.topic, None)
+        "latigo.task_queue.kafka.prepare_kafka_config", return_value=(config, sentinel.topic, None)
     ):
         return KafkaTaskQueueSender({"connection_string": "mock"})
 
 
 def test_put_task(sender):
-    task = Mock(spec=Task)
+    task = TaskFactory()
 
     sender.put_task(task)
-    sender.producer.produce.assert_called_once_with(sentinel.topic, task.to_json.return_value, on_delivery=ANY)
+    sender.producer.produce.assert_called_once_with(
+        sentinel.topic, serialize_task(task), headers={"task-format": b"json"}, on_delivery=ANY
+    )
     sender.producer.poll.assert_called_once_with(0)
 
 
+def test_sender_batches_and_compresses(sender):
+    assert sender.config == {"bootstrap.servers": "mock", "linger.ms": 50, "compression.type": "gzip"}
+
+
+def test_put_tasks(sender):
+    tasks = [TaskFactory() for _ in range(3)]
+    callbacks = []
+    sender.producer.produce.side_effect = lambda *args, on_delivery, **kwargs: callbacks.append(on_delivery)
+
+    def flush(timeout):
+        callbacks[0](None, Mock())
+        callbacks[1](Mock(), Mock())  # delivery failed, the last task is not reported at all
+        return 1
+
+    sender.producer.flush.side_effect = flush
+
+    report = sender.put_tasks(tasks)
+    assert report.delivered == 1
+    assert report.failed_tasks == [tasks[1], tasks[2]]
+    assert sender.producer.produce.call_count == 3
+    sender.producer.flush.assert_called_once_with(60)
+
+
+def test_put_tasks_waits_when_producer_queue_is_full(sender):
+    sender.producer.produce.side_effect = [BufferError(), None]
+    sender.producer.flush.return_value = 0
+
+    sender.put_tasks([TaskFactory()])
+    assert sender.producer.produce.call_count == 2
+    sender.producer.poll.assert_called_once_with(1)
+
+
+@pytest.mark.parametrize("task_format", ["binary", "json"])
+def test_task_serialization(task_format):
+    task = Task(
+        project_name="project",
+        model_name="модель",
+        from_time=datetime(2020, 5, 30, 10, 0, tzinfo=timezone.utc),
+        to_time=datetime(2020, 5, 30, 10, 30, 0, 123000, tzinfo=timezone.utc),
+    )
+    message = make_message(serialize_task(task, task_format), headers=[("task-format", task_format.encode())])
+
+    assert get_task_format(message) == task_format
+    assert deserialize_task(message.value(), get_task_format(message)) == task
+
+
+def test_binary_task_is_compact():
+    task = TaskFactory()
+
+    assert len(serialize_task(task, "binary")) < len(serialize_task(task)) / 2
+
+
+@pytest.mark.parametrize(
+    "task_bytes, task_format",
+    [
+        (b"\x02" + serialize_task(TaskFactory(), "binary")[1:], "binary"),  # unknown version
+        (serialize_task(TaskFactory(), "binary")[:-1], "binary"),
+        (b"{}", "json"),
+        (b"{}", "unknown"),
+    ],
+)
+def test_deserialize_broken_task(task_bytes, task_format):
+    assert deserialize_task(task_bytes, task_format) is None
+
+
+def test_message_without_format_header_is_json():
+    assert get_task_format(make_message(b"{}")) == "json"
+
+
 def test_close(sender):
     sender.close()
     sender.producer.flush.assert_called_once_with()
@@ -34,3 +113,288 @@ def test_close_already_closed(sender):
 
     sender.close()
     sender.producer.flush.assert_called_once_with()
+
+
+def make_message(value: bytes, error=None, headers=None) -> Mock:
+    return Mock(value=Mock(return_value=value), error=Mock(return_value=error), headers=Mock(return_value=headers))
+
+
+def make_consume(messages: typing.List[Mock]) -> typing.Callable:
+    """Make "Consumer.consume" that returns each of the messages once, up to "num_messages" per call."""
+    messages = list(messages)
+
+    def consume(num_messages, timeout):
+        batch, messages[:] = messages[:num_messages], messages[num_messages:]
+        return batch
+
+    return consume
+
+
+def make_task_bytes(model_name: str) -> bytes:
+    return (
+        f'{{"project_name": "project", "model_name": "{model_name}", '
+        f'"from_time": 1590832200.0, "to_time": 1590834000.0}}'
+    ).encode()
+
+
+@pytest.fixture
+def receiver():
+    """Provide KafkaTaskQueueReceiver with mocked Consumer."""
+    with patch("latigo.task_queue.kafka.Consumer"), patch(
+        "latigo.task_queue.kafka.prepare_kafka_config", return_value=(sentinel.config, sentinel.topic, None)
+    ):
+        return KafkaTaskQueueReceiver({"connection_string": "mock", "prefetch_size": 3})
+
+
+def test_get_tasks_prefetches(receiver):
+    receiver.consumer.consume.side_effect = make_consume(
+        [make_message(make_task_bytes(f"model-{i}")) for i in range(3)]
+    )
+
+    tasks = receiver.get_tasks(max_n=2, timeout=1)
+    assert [task.model_name for task in tasks] == ["model-0", "model-1"]
+    # long poll for the first message, then the ones that were already fetched are drained without waiting
+    assert receiver.consumer.consume.call_args_list == [
+        call(num_messages=1, timeout=ANY),
+        call(num_messages=2, timeout=0),
+    ]
+
+    assert [task.model_name for task in receiver.get_tasks(max_n=2, timeout=1)] == ["model-2"]
+    assert receiver.consumer.consume.call_count == 2
+
+
+def test_get_tasks_skips_broken_messages(receiver):
+    error = Mock(code=Mock(return_value=KafkaError._PARTITION_EOF))
+    receiver.consumer.consume.side_effect = make_consume(
+        [
+            make_message(b"broken"),
+            make_message(None, error=error),
+            make_message(make_task_bytes("model")),
+        ]
+    )
+
+    assert [task.model_name for task in receiver.get_tasks(max_n=5, timeout=1)] == ["model"]
+
+
+def test_get_tasks_timeout(receiver):
+    receiver.consumer.consume.return_value = []
+
+    assert receiver.get_tasks(max_n=5, timeout=0.1) == []
+
+
+def test_get_task_from_prefetched(receiver):
+    receiver._prefetched.append(sentinel.task)
+
+    assert receiver.get_task() is sentinel.task
+    receiver.consumer.consume.assert_not_called()
+
+
+def test_deserialize_tasks():
+    tasks = deserialize_tasks([make_task_bytes("model-1"), make_task_bytes("model-2")])
+
+    assert [task.model_name for task in tasks] == ["model-1", "model-2"]
+    assert tasks[0].from_time == datetime.fromtimestamp(1590832200.0, tz=timezone.utc)
+
+
+def test_deserialize_tasks_of_mixed_formats():
+    binary_task = TaskFactory()
+    tasks_bytes = [make_task_bytes("model-1"), serialize_task(binary_task, "binary"), make_task_bytes("model-2")]
+    tasks = deserialize_tasks(tasks_bytes, ["json", "binary", "json"])
+
+    assert [task.model_name for task in tasks] == ["model-1", binary_task.model_name, "model-2"]
+
+
+def test_deserialize_tasks_with_broken_one():
+    tasks = deserialize_tasks([make_task_bytes("model"), b"broken"])
+
+    assert tasks[0].model_name == "model"
+    assert tasks[1] is None
+
+
+def test_offset_tracker_commits_contiguous_offsets():
+    tracker = OffsetTracker()
+    partition = ("topic", 0)
+    for offset in range(10, 13):
+        tracker.received(partition, offset)
+
+    tracker.done(partition, 11)
+    assert tracker.pop_offsets_to_commit() == {partition: 10}
+
+    tracker.done(partition, 10)
+    assert tracker.pop_offsets_to_commit() == {partition: 12}
+    assert tracker.pop_offsets_to_commit() == {}
+
+    tracker.done(partition, 12)
+    tracker.uncommit([partition])
+    assert tracker.pop_offsets_to_commit() == {partition: 13}
+
+
+@pytest.fixture
+def manual_commit_receiver():
+    with patch("latigo.task_queue.kafka.Consumer"), patch(
+        "latigo.task_queue.kafka.prepare_kafka_config", return_value=({"enable.auto.commit": True}, "topic", None)
+    ):
+        return KafkaTaskQueueReceiver(
+            {"connection_string": "mock", "prefetch_size": 3, "manual_commit": True, "commit_interval": 0}
+        )
+
+
+def make_partition_message(value: bytes, offset: int) -> Mock:
+    msg = make_message(value)
+    msg.topic.return_value, msg.partition.return_value, msg.offset.return_value = "topic", 0, offset
+    return msg
+
+
+def test_manual_commit_after_task_done(manual_commit_receiver):
+    receiver = manual_commit_receiver
+    assert receiver.config["enable.auto.commit"] is False
+    receiver.consumer.consume.side_effect = make_consume(
+        [
+            make_partition_message(make_task_bytes("model-1"), 5),
+            make_partition_message(b"broken", 6),
+            make_partition_message(make_task_bytes("model-2"), 7),
+        ]
+    )
+
+    first, second = receiver.get_tasks(max_n=2, timeout=1)
+    receiver.consumer.commit.assert_called_once_with(offsets=[TopicPartition("topic", 0, 5)], asynchronous=True)
+
+    receiver.task_done(second)
+    assert receiver.consumer.commit.call_count == 1  # first task is still in flight
+
+    receiver.task_done(first)
+    receiver.consumer.commit.assert_called_with(offsets=[TopicPartition("topic", 0, 8)], asynchronous=True)
+
+
+def test_manual_commit_of_failed_async_commit(manual_commit_receiver):
+    receiver = manual_commit_receiver
+    assert receiver.config["on_commit"] == receiver.on_commit_callback
+    receiver.consumer.consume.side_effect = make_consume([make_partition_message(make_task_bytes("model-1"), 5)])
+    receiver.task_done(receiver.get_tasks(max_n=1, timeout=1)[0])
+    receiver.consumer.commit.assert_called_with(offsets=[TopicPartition("topic", 0, 6)], asynchronous=True)
+
+    receiver.consumer.commit.reset_mock()
+    receiver._commit()
+    receiver.consumer.commit.assert_not_called()  # nothing new to commit
+
+    receiver.on_commit_callback(KafkaError(KafkaError.REQUEST_TIMED_OUT), [TopicPartition("topic", 0, 6)])
+    receiver._commit()
+    receiver.consumer.commit.assert_called_once_with(offsets=[TopicPartition("topic", 0, 6)], asynchronous=True)
+
+
+def test_manual_commit_on_revoke(manual_commit_receiver):
+    receiver = manual_commit_receiver
+    receiver.commit_interval = 60
+    receiver.consumer.consume.side_effect = make_consume(
+        [
+            make_partition_message(make_task_bytes(f"model-{i}"), i) for i in range(3)
+        ]
+    )
+    task = receiver.get_tasks(max_n=1, timeout=1)[0]
+    receiver.task_done(task)
+
+    receiver.on_revoke_callback(receiver.consumer, [TopicPartition("topic", 0)])
+    receiver.consumer.commit.assert_called_with(offsets=[TopicPartition("topic", 0, 1)], asynchronous=False)
+    assert not receiver._prefetched
+    assert not receiver._task_offsets
+
+
+def test_manual_commit_on_revoke_during_consume(manual_commit_receiver):
+    receiver = manual_commit_receiver
+
+    def consume(num_messages, timeout):
+        # re-balancing callbacks are called by "consume"
+        receiver.on_revoke_callback(receiver.consumer, [TopicPartition("topic", 0)])
+        return []
+
+    receiver.consumer.consume.side_effect = consume
+    assert receiver.get_tasks(max_n=1, timeout=0.1) == []
+
+
+def test_get_task_poll_timeout_grows_while_idle(receiver):
+    receiver.max_idle_poll_timeout = 5
+    with patch.object(receiver, "get_tasks", side_effect=[[], [], [], [], [sentinel.task]]) as get_tasks_mock:
+        for _ in range(4):
+            assert receiver.get_task() is None
+        assert receiver.get_task() is sentinel.task
+
+    timeouts = [kwargs["timeout"] for _, kwargs in get_tasks_mock.call_args_list]
+    assert timeouts == [1, 2, 4, 5, 5]
+    assert receiver._current_poll_timeout == receiver.poll_timeout
+
+
+def test_partitions_are_paused_while_busy(receiver):
+    receiver.pause_when_busy = True
+    receiver.max_in_flight = 2
+    receiver.consumer.consume.side_effect = make_consume(
+        [make_message(make_task_bytes(f"model-{i}")) for i in range(2)]
+    )
+
+    first = receiver.get_tasks(max_n=1, timeout=1)[0]
+    # one task is in flight and one is prefetched
+    receiver.consumer.pause.assert_called_once_with(receiver.consumer.assignment.return_value)
+
+    second = receiver.get_tasks(max_n=1, timeout=1)[0]
+    receiver.task_done(first)
+    receiver.consumer.resume.assert_called_once_with(receiver.consumer.assignment.return_value)
+
+    receiver.task_done(second)
+    assert receiver.consumer.pause.call_count == 1
+    assert receiver.consumer.resume.call_count == 1
+
+
+def test_consumer_is_kept_alive_while_paused(receiver):
+    receiver.pause_when_busy = True
+    receiver.keepalive_interval = 0.01
+    receiver.consumer.consume.return_value = []
+    receiver._paused = True
+
+    receiver.set_max_in_flight(1)
+    sleep(0.1)
+    receiver.close()
+
+    receiver.consumer.consume.assert_called_with(num_messages=3, timeout=0)
+    assert not receiver._keepalive_thread.is_alive()
+
+
+def test_manual_commit_retry_task(manual_commit_receiver):
+    receiver = manual_commit_receiver
+    receiver.max_task_retries = 1
+    receiver.consumer.consume.side_effect = make_consume([make_partition_message(make_task_bytes("model"), offset=0)])
+
+    task = receiver.get_tasks(max_n=1, timeout=1)[0]
+    receiver.retry_task(task)
+    receiver.consumer.commit.assert_called_once_with(offsets=[TopicPartition("topic", 0, 0)], asynchronous=True)
+
+    # task is received once more from the prefetch buffer, the next failure marks it as done
+    assert receiver.get_tasks(max_n=1, timeout=1) == [task]
+    assert receiver.consumer.consume.call_count == 2  # long poll and drain of the first "get_tasks"
+    receiver.retry_task(task)
+    receiver.consumer.commit.assert_called_with(offsets=[TopicPartition("topic", 0, 1)], asynchronous=True)
+    assert not receiver._task_retries
+
+
+def test_retry_task_does_not_wait_for_long_poll(manual_commit_receiver):
+    receiver = manual_commit_receiver
+    receiver.consumer.consume.side_effect = make_consume([make_partition_message(make_task_bytes("model"), 0)])
+    task = receiver.get_tasks(max_n=1, timeout=1)[0]
+    polling = threading.Event()
+
+    def consume(num_messages, timeout):
+        polling.set()
+        sleep(timeout)
+        return []
+
+    receiver.consumer.consume.side_effect = consume
+    received = []
+    poller = threading.Thread(target=lambda: received.extend(receiver.get_tasks(max_n=1, timeout=1)), daemon=True)
+    poller.start()
+    assert polling.wait(timeout=1)
+
+    started_at = monotonic()
+    receiver.retry_task(task)
+    assert monotonic() - started_at < 0.5
+
+    # retried task is taken from the buffer after the poll
+    poller.join(timeout=2)
+    assert received == [task]
@@ -1,12 +1,24 @@
 import logging
-from unittest.mock import MagicMock, patch, ANY
+import multiprocessing
+import signal
+import threading
+from functools import partial
+from time import monotonic, sleep
+from unittest.mock import MagicMock, Mock, patch, ANY
 
+import pandas as pd
 import pytest
+from gordo.machine.dataset.sensor_tag import SensorTag
 from requests import HTTPError, Timeout, Response
 
 from latigo.executor import GORDO_EXCEPTIONS, IOC_DATA_EXCEPTIONS, PredictionExecutor
+from latigo.executor.pipeline import PredictionPipeline
+from latigo.executor.process_pool import ExecutorProcessPool
 from latigo.gordo import NoTagDataInDataLake
-from latigo.time_series_api.time_series_exceptions import NoCommonAssetFound
+from latigo.task_queue import serialize_task
+from latigo.task_queue.kafka import KafkaTaskQueueReceiver
+from latigo.time_series_api.time_series_exceptions import NoCommonAssetFound, PredictionNotStored
+from latigo.types import TIME_SERIES_IDS_META_KEY, LatigoSensorTag, SensorDataSet, SensorDataSpec
 from tests.factories.task import TaskFactory
 
 
@@ -31,24 +43,261 @@ def test_process_one_prediction_task_no_task(logger_warn_mock, basic_executor):
 @patch("latigo.executor.PredictionExecutor.execute_prediction_for_task", new=MagicMock())
 def test_process_one_prediction_task_success(basic_executor):
     task = TaskFactory()
-    with patch.object(basic_executor.task_queue, "get_task", return_value=task):
+    with patch.object(basic_executor.task_queue, "get_task", return_value=task), patch.object(
+        basic_executor.task_queue, "task_done"
+    ) as task_done_mock:
         basic_executor.process_one_prediction_task()
+    task_done_mock.assert_called_once_with(task)
+
+
+@pytest.mark.parametrize("error", [NoCommonAssetFound([]), KeyboardInterrupt()])
+def test_process_prediction_task_failed(error, basic_executor):
+    task = TaskFactory()
+    with patch.object(basic_executor, "execute_prediction_for_task", side_effect=error), patch.object(
+        basic_executor.task_queue, "task_done"
+    ) as task_done_mock:
+        basic_executor._run_safely(basic_executor.process_prediction_task, task)
+
+    # failed task is done, but interrupted one should be received once more
+    assert task_done_mock.called == isinstance(error, Exception)
+
+
+def test_process_prediction_task_retried(basic_executor):
+    task = TaskFactory()
+    with patch.object(
+        basic_executor, "execute_prediction_for_task", side_effect=PredictionNotStored("failed")
+    ), patch.object(basic_executor.task_queue, "retry_task") as retry_task_mock, patch.object(
+        basic_executor.task_queue, "task_done"
+    ) as task_done_mock:
+        basic_executor._run_safely(basic_executor.process_prediction_task, task)
+
+    retry_task_mock.assert_called_once_with(task)
+    task_done_mock.assert_not_called()
+
+
+def test_run_concurrently(basic_executor, get_task_from):
+    tasks = TaskFactory.build_batch(5)
+    basic_executor.max_concurrent_tasks = 2
+
+    with patch.object(basic_executor.task_queue, "get_task", side_effect=get_task_from(tasks)), patch.object(
+        basic_executor, "process_prediction_task"
+    ) as process_mock:
+        basic_executor.run()
+
+    processed_models = sorted(call_args[0][0].model_name for call_args in process_mock.call_args_list)
+    assert processed_models == [t.model_name for t in tasks]
+
+
+def test_run_concurrently_logs_task_errors(basic_executor, get_task_from, caplog):
+    tasks = [TaskFactory()]
+    basic_executor.max_concurrent_tasks = 2
+
+    with patch.object(basic_executor.task_queue, "get_task", side_effect=get_task_from(tasks)), patch.object(
+        basic_executor, "process_prediction_task", side_effect=NoCommonAssetFound([])
+    ):
+        basic_executor.run()
+
+    assert any(message.startswith("Prediction was not stored") for message in caplog.messages)
+
+
+def test_run_pipeline(basic_executor, get_task_from):
+    tasks = TaskFactory.build_batch(4)
+    basic_executor.pipeline = PredictionPipeline(basic_executor, {"predict_workers": 2, "store_workers": 2})
+
+    with patch.object(basic_executor.task_queue, "get_task", side_effect=get_task_from(tasks)), patch.object(
+        basic_executor.model_info_provider, "get_project_latest_revisions", return_value="revision"
+    ), patch.object(
+        basic_executor, "execute_prediction_for_task", side_effect=lambda task, revision: task.model_name
+    ), patch.object(
+        basic_executor, "store_prediction_data_and_metadata"
+    ) as store_mock:
+        basic_executor.run()
+
+    assert sorted(call_args[0][0] for call_args in store_mock.call_args_list) == [t.model_name for t in tasks]
+
+
+def test_run_pipeline_skips_failed_prediction(basic_executor, get_task_from, caplog):
+    tasks = [TaskFactory()]
+    basic_executor.pipeline = PredictionPipeline(basic_executor, {})
+
+    with patch.object(basic_executor.task_queue, "get_task", side_effect=get_task_from(tasks)), patch.object(
+        basic_executor, "execute_prediction_for_task", side_effect=NoCommonAssetFound([])
+    ), patch.object(basic_executor, "store_prediction_data_and_metadata") as store_mock:
+        basic_executor.run()
+
+    store_mock.assert_not_called()
+    assert any(message.startswith("Prediction was not stored") for message in caplog.messages)
+
+
+@pytest.mark.parametrize("pipeline_config", [{"predict_workers": 0}, {"queue_size": "1"}])
+def test_pipeline_invalid_config(pipeline_config, basic_executor):
+    with pytest.raises(ValueError):
+        PredictionPipeline(basic_executor, pipeline_config)
+
+
+def test_pipeline_max_in_flight_tasks(basic_executor):
+    pipeline = PredictionPipeline(basic_executor, {"predict_workers": 4, "store_workers": 2, "queue_size": 3})
+
+    assert pipeline.max_in_flight_tasks == 8
+
+
+def test_executor_stops_after_max_tasks_per_process(basic_executor):
+    basic_executor.max_tasks_per_process = 2
+    with patch.object(basic_executor.task_queue, "get_task", side_effect=TaskFactory.build_batch(5)), patch.object(
+        basic_executor, "process_prediction_task"
+    ) as process_mock:
+        basic_executor.run()
+
+    assert process_mock.call_count == 2
+
+
+@patch("latigo.executor.get_process_rss_mb", new=MagicMock(return_value=1024))
+def test_executor_stops_after_max_rss(basic_executor):
+    basic_executor.max_rss_mb = 512
+    with patch.object(basic_executor.task_queue, "get_task", side_effect=TaskFactory.build_batch(5)), patch.object(
+        basic_executor, "process_prediction_task"
+    ) as process_mock:
+        basic_executor.run()
+
+    assert process_mock.call_count == 1
+
+
+def test_executor_process_pool_restarts_exited_workers():
+    pool = ExecutorProcessPool(processes=2, target=lambda: None)
+
+    with patch("latigo.executor.process_pool.sleep", side_effect=[None, None, KeyboardInterrupt]), patch(
+        "latigo.executor.process_pool.signal.signal"
+    ), patch("latigo.executor.process_pool.multiprocessing.Process") as process_mock:
+        process_mock.return_value.is_alive.return_value = False
+        process_mock.return_value.exitcode = 0
+        pool.run()
+
+    assert process_mock.return_value.start.call_count == 6  # 2 workers started and 2 times restarted
+
+
+def test_executor_process_pool_stops_after_startup_failures():
+    pool = ExecutorProcessPool(processes=1, target=lambda: None)
+    clock = [0.0]
+    started_at = []
+
+    def fake_sleep(seconds):
+        clock[0] += seconds
+
+    with patch("latigo.executor.process_pool.sleep", side_effect=fake_sleep), patch(
+        "latigo.executor.process_pool.monotonic", side_effect=lambda: clock[0]
+    ), patch("latigo.executor.process_pool.signal.signal"), patch(
+        "latigo.executor.process_pool.multiprocessing.Process"
+    ) as process_mock:
+        process_mock.return_value.is_alive.return_value = False
+        process_mock.return_value.exitcode = 1
+        process_mock.return_value.start.side_effect = lambda: started_at.append(clock[0])
+        with pytest.raises(SystemExit):
+            pool.run()
+
+    # restarts are delayed by 1, 2, 4 and 8 seconds after the failures (checked every second)
+    assert started_at == [0, 2, 5, 10, 19]
+
+
+def wait_in_worker(started: multiprocessing.Queue):
+    started.put(None)
+    sleep(60)
+
+
+def test_executor_process_pool_terminates_workers():
+    started = multiprocessing.Queue()
+    pool = ExecutorProcessPool(processes=2, target=partial(wait_in_worker, started))
+    default_handler = signal.signal(signal.SIGTERM, pool._stop)  # handler of the pool is inherited on fork
+    try:
+        pool._restart_exited_workers()
+        for _ in range(pool.processes):
+            started.get(timeout=10)
+
+        start = monotonic()
+        pool._terminate_workers()
+    finally:
+        signal.signal(signal.SIGTERM, default_handler)
+
+    assert monotonic() - start < pool.TERMINATE_TIMEOUT
+    assert [worker.exitcode for worker in pool._workers] == [-signal.SIGTERM] * 2
+
+
+@pytest.mark.parametrize("processes", [0, "2"])
+def test_executor_process_pool_invalid_processes(processes):
+    with pytest.raises(ValueError):
+        ExecutorProcessPool(processes=processes, target=lambda: None)
 
 
 def test_execute_prediction_for_task_success(basic_executor):
     task = TaskFactory()
     revision = "000"
 
+    input_time_series_ids = {"tag-1": "id-1", "tag-2": "id-2"}
+    df = pd.DataFrame(
+        columns=pd.MultiIndex.from_tuples(
+            [("model-input", "tag-1"), ("model-input", "tag-2"), ("model-output", "tag-1")]
+        )
+    )
+    data_provider = basic_executor.prediction_executor_provider.config["data_provider"]
+    sensor_data = SensorDataSet(
+        time_range=ANY, data=[pd.Series()], meta_data={TIME_SERIES_IDS_META_KEY: {**input_time_series_ids, "x": "y"}}
+    )
+
+    def predict(**kwargs):
+        # Gordo client loads the data for the prediction with the data provider
+        with patch.object(data_provider, "sensor_data_provider") as sensor_data_provider:
+            sensor_data_provider.get_data_for_range.return_value = (sensor_data, None)
+            list(data_provider.load_series(task.from_time, task.to_time, [SensorTag("tag-1", None)]))
+        return [[ANY, df, []]]
+
     client_mock = MagicMock(name="client_mock")
-    client_mock.predict.return_value = [[ANY, ANY, []]]
+    client_mock.predict.side_effect = predict
     with patch.object(
         basic_executor.prediction_executor_provider.gordo_pool, "allocate_instance", return_value=client_mock
     ):
-        basic_executor.execute_prediction_for_task(task=task, revision=revision)
+        res = basic_executor.execute_prediction_for_task(task=task, revision=revision)
 
         client_mock.predict.assert_called_once_with(
             start=task.from_time, end=task.to_time, targets=[task.model_name], revision=revision
         )
+    assert res.input_time_series_ids == input_time_series_ids
+    assert not data_provider._collectors
+
+
+def test_execute_prediction_for_task_ids_not_resolved(basic_executor):
+    df = pd.DataFrame(columns=pd.MultiIndex.from_tuples([("model-input", "tag-1"), ("model-output", "tag-1")]))
+    client_mock = MagicMock(name="client_mock")
+    client_mock.predict.return_value = [[ANY, df, []]]
+    with patch.object(
+        basic_executor.prediction_executor_provider.gordo_pool, "allocate_instance", return_value=client_mock
+    ):
+        res = basic_executor.execute_prediction_for_task(task=TaskFactory(), revision="000")
+
+    assert res.input_time_series_ids == {}
+
+
+def test_get_tags_time_series_ids_for_model_resolved_on_fetch(basic_executor):
+    prediction_data = Mock(input_time_series_ids={"tag-1": "id-1"})
+    basic_executor.model_info_provider.get_spec.reset_mock()
+
+    res = basic_executor._get_tags_time_series_ids_for_model(prediction_data)
+
+    assert res == {"tag-1": "id-1"}
+    basic_executor.model_info_provider.get_spec.assert_not_called()
+
+
+def test_execute_prediction_for_task_skips_tags_without_data(basic_executor):
+    task = TaskFactory()
+    spec = SensorDataSpec(tag_list=[LatigoSensorTag(name=name, asset=None) for name in ["tag-1", "tag-2"]])
+    basic_executor.sensor_data_provider._tag_metadata_cache.set_no_data(["tag-2"])
+
+    with patch.object(basic_executor.model_info_provider, "get_spec", return_value=spec), patch.object(
+        basic_executor.prediction_executor_provider, "execute_prediction"
+    ) as execute_mock:
+        with pytest.raises(NoTagDataInDataLake) as e_info:
+            basic_executor.execute_prediction_for_task(task=task, revision="000")
+
+    assert "tag-2" in str(e_info.value)
+    execute_mock.assert_not_called()
 
 
 @pytest.mark.parametrize("exception", GORDO_EXCEPTIONS+IOC_DATA_EXCEPTIONS+(NoCommonAssetFound([]),))
@@ -90,3 +339,59 @@ def test_execute_prediction_for_unknown_errors(exception, basic_executor: Predic
     with patch.object(basic_executor.prediction_executor_provider, "execute_prediction", side_effect=exception):
         basic_executor.run()
     assert ('latigo.executor', logging.ERROR, error_message) in caplog.record_tuples
+
+
+def test_run_pipeline_pauses_partitions_while_predict_stage_is_stalled(basic_executor):
+    with patch("latigo.task_queue.kafka.Consumer"), patch(
+        "latigo.task_queue.kafka.prepare_kafka_config", return_value=({"bootstrap.servers": "mock"}, "topic", None)
+    ):
+        receiver = KafkaTaskQueueReceiver(
+            {"connection_string": "mock", "pause_when_busy": True, "keepalive_interval": 0.01}
+        )
+    messages = [
+        Mock(
+            value=Mock(return_value=serialize_task(task)),
+            error=Mock(return_value=None),
+            headers=Mock(return_value=[]),
+        )
+        for task in TaskFactory.build_batch(10)
+    ]
+    keepalive_polls = []
+
+    def consume(num_messages, timeout):
+        if receiver._paused:  # paused partitions return nothing
+            keepalive_polls.append(timeout)
+            return []
+        return [messages.pop(0)] if messages else []
+
+    receiver.consumer.consume.side_effect = consume
+    basic_executor.task_queue = receiver
+    basic_executor.pipeline = PredictionPipeline(basic_executor, {})
+    receiver.set_max_in_flight(basic_executor.pipeline.max_in_flight_tasks)
+    prediction_released = threading.Event()
+
+    with patch.object(
+        basic_executor.model_info_provider, "get_project_latest_revisions", return_value="revision"
+    ), patch.object(
+        basic_executor, "execute_prediction_for_task", side_effect=lambda task, revision: prediction_released.wait()
+    ), patch.object(
+        basic_executor, "store_prediction_data_and_metadata"
+    ):
+        pipeline_thread = threading.Thread(target=basic_executor.pipeline.run, daemon=True)
+        pipeline_thread.start()
+        deadline = monotonic() + 5
+        while not keepalive_polls and monotonic() < deadline:
+            sleep(0.01)
+        is_paused, left_messages = receiver._paused, len(messages)
+
+        basic_executor._is_ready = False
+        prediction_released.set()
+        pipeline_thread.join(timeout=5)
+        receiver.close()
+
+    # one task is predicted, one waits in the queue and the receive worker is blocked with the third one
+    assert is_paused
+    assert keepalive_polls and keepalive_polls[0] == 0  # consumer is polled in the background to stay in the group
+    assert left_messages == 7
+
+    assert not pipeline_thread.is_alive()
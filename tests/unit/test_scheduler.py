@@ -5,6 +5,7 @@ import pytest
 
 from latigo.gordo import Task
 from latigo.scheduler import Scheduler
+from latigo.task_queue import DeliveryReport
 from tests.conftest import SCHEDULER_PREDICTION_DELAY, SCHEDULER_PREDICTION_INTERVAL
 
 DATETIME_UTC_NOW = datetime.fromisoformat("2020-04-10T10:00:00.000000+00:00")
@@ -16,6 +17,7 @@ PROJECTS_FROM_API = ["ioc-1000", "ioc-1099"]
 def test_perform_prediction_step_put_task(scheduler, microsecond):
     """Validates task serialisation and using UTC time."""
     with patch("latigo.scheduler.datetime") as mock_dt, patch.object(scheduler, "task_queue") as task_queue:
+        task_queue.put_tasks.return_value = DeliveryReport(delivered=1, failed_tasks=[])
         mock_dt.datetime.now.return_value = DATETIME_UTC_NOW.replace(microsecond=microsecond)
         scheduler.perform_prediction_step()
 
@@ -23,7 +25,7 @@ def test_perform_prediction_step_put_task(scheduler, microsecond):
     to_time = from_time + timedelta(minutes=+SCHEDULER_PREDICTION_INTERVAL)
 
     task_queue.assert_has_calls(
-        [call.put_task(Task(project_name="project", model_name="model", from_time=from_time, to_time=to_time))]
+        [call.put_tasks([Task(project_name="project", model_name="model", from_time=from_time, to_time=to_time)])]
     )
 
 
@@ -34,10 +36,11 @@ def test_run(scheduler: Scheduler):
         scheduler, "models_metadata_info_provider"
     ) as md_client:
         md_client.get_projects.return_value = ["project1"]
+        task_queue.put_tasks.return_value = DeliveryReport(delivered=1, failed_tasks=[])
         scheduler.run()
 
     task_queue.assert_has_calls(
-        [call.put_task(Task(project_name="project", model_name=ANY, from_time=ANY, to_time=ANY))]
+        [call.put_tasks([Task(project_name="project", model_name=ANY, from_time=ANY, to_time=ANY)])]
     )
 
 
@@ -47,30 +50,58 @@ def test_run(scheduler: Scheduler):
 ])
 @patch("latigo.metadata_api.client.MetadataAPIClient.get_projects", new=MagicMock(return_value=PROJECTS_FROM_API))
 def test_perform_prediction_step_multiple_projects(models_by_project, scheduler):
-    with patch.object(scheduler.task_queue, "put_task") as mock_put_task, patch.object(
+    with patch.object(scheduler.task_queue, "put_tasks") as mock_put_tasks, patch.object(
         scheduler.model_info_provider, "get_all_model_names_by_project", new=Mock(return_value=models_by_project)
     ), patch("latigo.scheduler.datetime") as mock_dt:
         mock_dt.datetime.now.return_value = DATETIME_UTC_NOW
+        mock_put_tasks.return_value = DeliveryReport(delivered=2, failed_tasks=[])
         scheduler.perform_prediction_step()
 
     from_datetime = DATETIME_UTC_NOW + timedelta(days=-SCHEDULER_PREDICTION_DELAY)
     to_time = from_datetime + timedelta(minutes=+SCHEDULER_PREDICTION_INTERVAL)
 
-    expected_calls = []
+    expected_tasks = []
     for project_name, models in models_by_project.items():
         for model_name in models:
-            expected_calls.append(
-                call(
-                    Task(
-                        project_name=project_name,
-                        model_name=model_name,
-                        from_time=from_datetime,
-                        to_time=to_time,
-                    )
+            expected_tasks.append(
+                Task(
+                    project_name=project_name,
+                    model_name=model_name,
+                    from_time=from_datetime,
+                    to_time=to_time,
                 )
             )
 
-    mock_put_task.assert_has_calls(expected_calls)
+    mock_put_tasks.assert_called_once_with(expected_tasks)
+
+
+def test_put_tasks_retries_failed(scheduler):
+    tasks = [
+        Task(project_name="project", model_name=f"model_{i}", from_time=DATETIME_UTC_NOW, to_time=DATETIME_UTC_NOW)
+        for i in range(3)
+    ]
+    reports = [
+        DeliveryReport(delivered=1, failed_tasks=tasks[1:]),
+        DeliveryReport(delivered=1, failed_tasks=tasks[2:]),
+        DeliveryReport(delivered=1, failed_tasks=[]),
+    ]
+    with patch.object(scheduler.task_queue, "put_tasks", side_effect=reports) as mock_put_tasks:
+        report = scheduler.put_tasks(tasks)
+
+    assert mock_put_tasks.call_args_list == [call(tasks), call(tasks[1:]), call(tasks[2:])]
+    assert report == DeliveryReport(delivered=3, failed_tasks=[])
+
+
+def test_put_tasks_gives_up_after_retries(scheduler):
+    tasks = [Task(project_name="project", model_name="model", from_time=DATETIME_UTC_NOW, to_time=DATETIME_UTC_NOW)]
+    scheduler.put_tasks_retries = 1
+    with patch.object(
+        scheduler.task_queue, "put_tasks", return_value=DeliveryReport(delivered=0, failed_tasks=tasks)
+    ) as mock_put_tasks:
+        report = scheduler.put_tasks(tasks)
+
+    assert mock_put_tasks.call_count == 2
+    assert report.failed == 1
 
 
 @pytest.mark.parametrize("scheduler", [(True, True, True, True)], indirect=["scheduler"])
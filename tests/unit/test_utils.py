@@ -15,6 +15,7 @@ from latigo.utils import (
     local_datetime_to_utc_as_str,
     get_thread_pool_executor,
     run_async_in_threads_executor, get_batches,
+    get_process_rss_mb,
 )
 
 logger = logging.getLogger("latigo.utils")
@@ -186,3 +187,10 @@ def test_run_async_in_threads_executor():
 def test_get_batches(items, expected, batch_size: int):
     res = get_batches(items, batch_size=batch_size)
     assert list(res) == expected
+
+
+def test_get_process_rss_mb():
+    rss_before = get_process_rss_mb()
+    data = bytearray(64 * 1024 * 1024)  # noqa: F841 (memory should be allocated while measuring)
+
+    assert 0 < rss_before < get_process_rss_mb()
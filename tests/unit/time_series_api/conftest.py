@@ -106,7 +106,9 @@ def fetch_data_for_multiple_ids_resp(tag_ids: List[str]):
     ]
 
 
-def make_sensor_data_set(from_time: datetime, to_time: datetime, tags_data: List[dict]) -> SensorDataSet:
+def make_sensor_data_set(
+    from_time: datetime, to_time: datetime, tags_data: List[dict], meta_data: dict = None
+) -> SensorDataSet:
     dataframes = []
     tag_names = ["0", "1", "2"]
 
@@ -122,4 +124,6 @@ def make_sensor_data_set(from_time: datetime, to_time: datetime, tags_data: List
         s = pd.Series(data=values, index=datatime_index, name=tag_name)
         dataframes.append(s)
 
-    return SensorDataSet(time_range=TimeRange(from_time=from_time, to_time=to_time), data=dataframes)
+    return SensorDataSet(
+        time_range=TimeRange(from_time=from_time, to_time=to_time), data=dataframes, meta_data=meta_data or {}
+    )
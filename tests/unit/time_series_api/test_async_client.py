@@ -0,0 +1,111 @@
+import asyncio
+from datetime import datetime
+from unittest.mock import Mock, patch
+
+import pytest
+from aiohttp import web
+from requests.exceptions import HTTPError
+
+from latigo.time_series_api import TimeSeriesAPIClient
+from latigo.time_series_api.async_client import AsyncTimeSeriesAPIClient
+from latigo.types import TimeRange
+
+
+class FakeTimeSeriesAPI:
+    """Time Series API that counts how many requests are handled at once."""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.headers = []
+
+    async def _handle(self, request: web.Request, response: dict, status: int = 200) -> web.Response:
+        self.headers.append(request.headers.get("Authorization"))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.05)
+        self.in_flight -= 1
+        return web.json_response(response, status=status)
+
+    async def get_metadata(self, request: web.Request) -> web.Response:
+        name = request.query["name"]
+        return await self._handle(request, {"data": {"items": [{"id": f"id-{name}", "name": name}]}})
+
+    async def fetch_data(self, request: web.Request) -> web.Response:
+        items = [{"id": item["id"], "datapoints": []} for item in await request.json()]
+        return await self._handle(request, {"data": {"items": items}})
+
+    async def create_id(self, request: web.Request) -> web.Response:
+        name = (await request.json())["name"]
+        if name == "conflict":
+            return await self._handle(request, {"statusCode": 409}, status=409)
+        return await self._handle(request, {"data": {"items": [{"id": f"id-{name}", "name": name}]}})
+
+    async def store_data(self, request: web.Request) -> web.Response:
+        return await self._handle(request, {"statusCode": 200, "message": "stored"})
+
+
+@pytest.fixture
+def fake_api():
+    fake_api = FakeTimeSeriesAPI()
+    app = web.Application()
+    app.router.add_get("/ts", fake_api.get_metadata)
+    app.router.add_post("/ts", fake_api.create_id)
+    app.router.add_post("/ts/query/data", fake_api.fetch_data)
+    app.router.add_post("/ts/data", fake_api.store_data)
+
+    runner = web.AppRunner(app)
+    AsyncTimeSeriesAPIClient.run(runner.setup())
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    AsyncTimeSeriesAPIClient.run(site.start())
+    fake_api.base_url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/ts"
+    yield fake_api
+    AsyncTimeSeriesAPIClient.run(runner.cleanup())
+
+
+@pytest.fixture
+def async_client(fake_api, auth_config) -> TimeSeriesAPIClient:
+    session = Mock(token={"access_token": "token"}, auto_adding_headers={})
+    with patch("latigo.time_series_api.client.get_auth_session", return_value=session):
+        return TimeSeriesAPIClient(
+            {"base_url": fake_api.base_url, "async": True, "max_parallel_batches": 2, "auth": auth_config}
+        )
+
+
+def test_get_meta_by_names_async(async_client, fake_api):
+    names = [f"tag-{i}" for i in range(10)]
+
+    res = async_client.get_meta_by_names(names, facility="1901")
+
+    assert res == {name: {"data": {"items": [{"id": f"id-{name}", "name": name}]}} for name in names}
+    assert fake_api.max_in_flight > 1
+    assert set(fake_api.headers) == {"Bearer token"}
+    cached = async_client._tag_metadata_cache.get_metadata("tag-0", "1901")
+    assert cached == {"data": {"items": [{"id": "id-tag-0", "name": "tag-0", "facility": None}]}}
+
+
+def test_fetch_data_for_multiple_ids_async(async_client, fake_api):
+    time_range = TimeRange(
+        from_time=datetime.fromisoformat("2020-04-10T10:00:00.000000+00:00"),
+        to_time=datetime.fromisoformat("2020-04-10T10:30:00.000000+00:00"),
+    )
+    tag_ids = [str(i) for i in range(450)]
+
+    res = async_client._fetch_data_for_multiple_ids(tag_ids=tag_ids, time_range=time_range)
+
+    assert [item["id"] for item in res] == tag_ids
+    assert fake_api.max_in_flight == async_client.max_parallel_batches
+
+
+def test_create_ids_async(async_client):
+    res = async_client._create_ids({"tag": "description", "conflict": "description"}, facility="1901")
+
+    assert res["tag"] == {"data": {"items": [{"id": "id-tag", "name": "tag"}]}}
+    assert isinstance(res["conflict"], HTTPError)
+    assert res["conflict"].response.status_code == 409
+
+
+def test_store_multiple_datapoints_async(async_client):
+    res = async_client.store_multiple_datapoints([{"id": "id", "datapoints": [{"time": "t", "value": 1.0}]}])
+
+    assert res == {"stored": 1, "failed": 0, "message": "1 datapoints were stored, 0 datapoints failed"}
@@ -0,0 +1,93 @@
+from time import sleep
+
+import inject
+import pytest
+
+from latigo.time_series_api import TagMetadataCache
+from latigo.time_series_api.cache_backends import (
+    CacheBackend,
+    SQLiteCacheBackend,
+    cache_backend_factory,
+    delete_if_equal,
+)
+
+
+@pytest.fixture
+def sqlite_backend(tmp_path) -> SQLiteCacheBackend:
+    return SQLiteCacheBackend(path=str(tmp_path / "cache" / "latigo.sqlite3"))
+
+
+def test_sqlite_get_set(sqlite_backend):
+    assert sqlite_backend.get("key") is None
+
+    assert sqlite_backend.set(name="key", value="value", ex=10) is True
+    assert sqlite_backend.set(name="number", value=1) is True
+
+    assert sqlite_backend.get("key") == b"value"
+    assert sqlite_backend.mget(["key", "missing", "number"]) == [b"value", None, b"1"]
+    assert 0 < sqlite_backend.ttl("key") <= 10
+    assert sqlite_backend.ttl("number") == -1
+    assert sqlite_backend.ttl("missing") == -2
+
+
+def test_sqlite_key_is_expired(sqlite_backend):
+    sqlite_backend.set(name="key", value="value", px=100)
+    sleep(0.1)
+
+    assert sqlite_backend.get("key") is None
+    assert sqlite_backend.set(name="key", value="new", ex=10, nx=True) is True
+    assert sqlite_backend.get("key") == b"new"
+
+
+def test_sqlite_set_if_not_exists_and_delete(sqlite_backend):
+    assert sqlite_backend.set(name="lock", value="token-1", px=1000, nx=True) is True
+    assert sqlite_backend.set(name="lock", value="token-2", px=1000, nx=True) is None
+    assert sqlite_backend.get("lock") == b"token-1"
+
+    assert sqlite_backend.delete("lock") == 1
+    assert sqlite_backend.get("lock") is None
+
+
+def test_sqlite_pipeline(sqlite_backend):
+    pipeline = sqlite_backend.pipeline(transaction=False)
+    for i in range(3):
+        pipeline.set(name=f"key-{i}", value=f"value-{i}", ex=10)
+
+    assert pipeline.execute() == [True, True, True]
+    assert sqlite_backend.mget([f"key-{i}" for i in range(3)]) == [b"value-0", b"value-1", b"value-2"]
+
+
+def test_sqlite_is_shared_between_instances(sqlite_backend):
+    sqlite_backend.set(name="key", value="value", ex=10)
+
+    assert SQLiteCacheBackend(path=sqlite_backend.path).get("key") == b"value"
+
+
+def test_sqlite_delete_if_equal(sqlite_backend):
+    sqlite_backend.set(name="key-1", value="token-1", ex=10)
+    sqlite_backend.set(name="key-2", value="other-token", ex=10)
+
+    assert delete_if_equal(sqlite_backend, {"key-1": b"token-1", "key-2": b"token-2", "missing": b"token"}) == 1
+    assert sqlite_backend.mget(["key-1", "key-2"]) == [None, b"other-token"]
+
+
+def test_tag_metadata_cache_with_sqlite(sqlite_backend):
+    inject.clear_and_configure(lambda binder: binder.bind(CacheBackend, sqlite_backend), bind_in_runtime=False)
+    metas = {"tag-1": {"data": {"items": [{"id": "1", "name": "tag-1", "facility": "1901"}]}}, "tag-2": None}
+    cache = TagMetadataCache(local_cache_size=0)
+
+    cache.set_many({"tag-1": metas["tag-1"]}, "1901")
+    token = cache.acquire_fill_lock("tag-2", "1901")
+    assert token and cache.acquire_fill_lock("tag-2", "1901") is None
+    cache.release_fill_lock("tag-2", "1901", token)
+
+    assert cache.get_many(metas, "1901") == metas
+    assert cache.acquire_fill_lock("tag-2", "1901")
+
+
+def test_cache_backend_factory(tmp_path):
+    backend = cache_backend_factory({"type": "sqlite", "path": str(tmp_path / "cache.sqlite3")})
+    assert isinstance(backend, SQLiteCacheBackend)
+
+    with pytest.raises(ValueError):
+        cache_backend_factory({"type": "memcached"})
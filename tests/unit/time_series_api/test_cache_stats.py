@@ -0,0 +1,53 @@
+import logging
+from unittest.mock import patch
+
+import pylogctx
+
+from latigo.time_series_api.cache_stats import CacheStats
+
+
+def test_latency_histogram():
+    stats = CacheStats("test cache")
+    with patch("latigo.time_series_api.cache_stats.monotonic", side_effect=[0, 0.003, 1, 3]):
+        with stats.timed("get"):
+            pass
+        with stats.timed("get"):
+            pass
+
+    histogram = stats.snapshot()["latencies"]["get"]
+    assert histogram["count"] == 2
+    assert histogram["sum"] == 2.003
+    assert histogram["buckets"]["<=0.005"] == 1
+    assert histogram["buckets"]["+inf"] == 1
+    assert sum(histogram["buckets"].values()) == 2
+
+
+def test_track_nested_and_context():
+    stats = CacheStats("test cache")
+    with stats.track("cache") as outer:
+        stats.count("hits")
+        with stats.track() as inner:
+            stats.count("misses", 2)
+        stats.count("bytes_read", 0)
+
+    assert inner["misses"] == 2 and inner["hits"] == 0
+    assert outer["misses"] == 2 and outer["hits"] == 1
+    assert pylogctx.context.as_dict()["cache"] == {"hits": 1, "misses": 2}
+    assert stats.snapshot()["hit_ratio"] == 0.3333
+    pylogctx.context.clear()
+
+
+def test_count_outside_of_track():
+    stats = CacheStats("test cache")
+    stats.count("hits")
+
+    assert stats.snapshot()["counters"]["hits"] == 1
+    assert stats.snapshot()["hit_ratio"] == 1
+
+
+def test_summary_is_logged(caplog):
+    stats = CacheStats("test cache", summary_interval=0)
+    with caplog.at_level(logging.INFO), stats.track():
+        stats.count("misses")
+
+    assert "Statistics of the test cache" in caplog.text
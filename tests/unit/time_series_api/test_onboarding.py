@@ -0,0 +1,74 @@
+from unittest.mock import Mock, patch
+
+import pytest
+
+from latigo.model_info import Model
+from latigo.time_series_api import OutputTagsOnboarding, get_time_series_id_from_response
+from latigo.types import LatigoSensorTag
+
+
+@pytest.fixture
+def model() -> Model:
+    return Model(
+        model_name="model",
+        project_name="1903",
+        tag_list=[LatigoSensorTag(name="1903.R1", asset="1903"), LatigoSensorTag(name="1903.R2", asset="1903")],
+        target_tag_list=[LatigoSensorTag(name="1903.R1", asset="1903")],
+    )
+
+
+@pytest.fixture
+def model_info_provider(model) -> Mock:
+    return Mock(get_project_latest_revisions=Mock(return_value="revision"), get_machine_by_key=Mock(return_value=model))
+
+
+@pytest.fixture
+def onboarding(model_info_provider, prediction_storage) -> OutputTagsOnboarding:
+    config = {"tag_operations": ["model-output"], "total_operations": ["total-anomaly-confidence"]}
+    return OutputTagsOnboarding(model_info_provider, prediction_storage, config)
+
+
+def test_expected_prediction_columns(onboarding, model):
+    assert onboarding.expected_prediction_columns(model) == [
+        ("model-input", "1903.R1"),
+        ("model-input", "1903.R2"),
+        ("model-output", "1903.R1"),
+        ("total-anomaly-confidence", ""),
+    ]
+
+
+def test_onboard_model_creates_missing_tags(onboarding, prediction_storage, tag_metadata):
+    prediction_storage._tag_metadata_cache.set_metadata("1903.R1|model|model-output", "1903", tag_metadata)
+
+    with patch.object(prediction_storage, "get_facility_by_tag_name", return_value="1903"), patch.object(
+        prediction_storage, "_get_metadata_from_api", return_value={"data": {"items": []}}
+    ), patch.object(prediction_storage, "_create_id", return_value=tag_metadata) as create_id_mock:
+        plan = onboarding.onboard_model("1903", "model")
+
+    create_id_mock.assert_called_once_with(
+        name="1903.INDICATOR|model|total-anomaly-confidence",
+        facility="1903",
+        description="Gordo total-anomaly-confidence - ",
+    )
+    assert plan.revision == "revision"
+    assert plan.output_time_series_ids == {
+        ("model-output", "1903.R1"): "tag_id",
+        ("total-anomaly-confidence", ""): "tag_id",
+    }
+    cache = prediction_storage._tag_metadata_cache
+    assert get_time_series_id_from_response(
+        cache.get_metadata("1903.INDICATOR|model|total-anomaly-confidence", "1903")
+    ) == "tag_id"
+
+
+def test_onboard_counts_failed_models(onboarding, model_info_provider, prediction_storage):
+    model_info_provider.get_machine_by_key.side_effect = [None, None]
+
+    res = onboarding.onboard({"1903": ["model-1"], "1904": ["model-2"]})
+
+    assert res == {"onboarded": 0, "failed": 2}
+
+
+def test_invalid_max_parallel_models(model_info_provider, prediction_storage):
+    with pytest.raises(ValueError):
+        OutputTagsOnboarding(model_info_provider, prediction_storage, {"max_parallel_models": 0})
@@ -1,6 +1,12 @@
 from unittest.mock import MagicMock, Mock, patch, call
 
+import pytest
+import ujson
 from requests import Response
+from requests.exceptions import HTTPError
+
+from latigo.time_series_api.time_series_exceptions import PredictionNotStored
+from tests.conftest import make_response
 
 store_data_for_id_resp = {"statusCode": 200}
 
@@ -48,3 +54,77 @@ def test_put_prediction_409_error(prediction_storage, prediction_data, tag_metad
     ]
     replace_cached_mock.assert_has_calls(calls)
     assert res
+
+
+@patch("latigo.time_series_api.prediction_storage_provider.rfc3339_from_datetime", new=Mock(side_effect=lambda x: x))
+def test_put_prediction_encodes_datapoints(prediction_data, prediction_storage, tag_metadata):
+    df = prediction_data.data[0][1]
+    df[("model-output", "1903.R2")] = [float("nan"), float("inf")]
+    store_result = {"stored": 4, "failed": 0, "message": "stored"}
+    with patch.object(prediction_storage, "_get_metadata_from_api", return_value=tag_metadata), patch.object(
+        prediction_storage, "store_multiple_encoded_datapoints", return_value=store_result
+    ) as store_mock, patch.object(prediction_storage, "get_facility_by_tag_name", return_value="1903"):
+        prediction_storage.put_prediction(prediction_data)
+
+    items = [
+        {"id": time_series_id, "datapoints": [ujson.loads(point) for point in datapoints]}
+        for time_series_id, datapoints in store_mock.call_args[0][0]
+    ]
+    assert items == [
+        {
+            "id": "tag_id",
+            "datapoints": [
+                {"time": "2020-05-30T10:10:00Z", "value": 14.28, "status": "0"},
+                {"time": "2020-05-30T10:20:00Z", "value": 14.28, "status": "0"},
+            ],
+        },
+        {
+            "id": "tag_id",
+            "datapoints": [
+                {"time": "2020-05-30T10:10:00Z", "value": 5721942.0, "status": "0"},
+                {"time": "2020-05-30T10:20:00Z", "value": 5832050.0, "status": "0"},
+            ],
+        },
+    ]
+
+
+@patch("latigo.time_series_api.prediction_storage_provider.rfc3339_from_datetime", new=Mock(side_effect=lambda x: x))
+def test_put_prediction_reuses_output_tag_plan(prediction_data, prediction_storage, tag_metadata):
+    store_result = {"stored": 6, "failed": 0, "message": "stored"}
+    with patch.object(prediction_storage, "_get_metadata_from_api", return_value=tag_metadata), patch.object(
+        prediction_storage, "store_multiple_encoded_datapoints", return_value=store_result
+    ), patch.object(prediction_storage, "get_facility_by_tag_name", return_value="1903") as get_facility_mock:
+        first_res = prediction_storage.put_prediction(prediction_data)
+        with patch.object(prediction_storage, "get_meta_by_names") as get_meta_mock:
+            second_res = prediction_storage.put_prediction(prediction_data)
+        get_meta_mock.assert_not_called()
+
+        prediction_data.meta_data.revision = "new-revision"
+        prediction_storage.put_prediction(prediction_data)
+
+    assert first_res == second_res
+    assert get_facility_mock.call_count == 2  # the plan was made for the first and the new revision
+
+
+@patch("latigo.time_series_api.prediction_storage_provider.rfc3339_from_datetime", new=Mock(side_effect=lambda x: x))
+def test_put_prediction_invalidates_output_tag_plan_on_404(prediction_data, prediction_storage, tag_metadata):
+    not_found_error = HTTPError(response=make_response({}, status_code=404))
+    with patch.object(prediction_storage, "_get_metadata_from_api", return_value=tag_metadata), patch.object(
+        prediction_storage, "store_multiple_encoded_datapoints", side_effect=not_found_error
+    ), patch.object(prediction_storage, "get_facility_by_tag_name", return_value="1903"):
+        with pytest.raises(HTTPError):
+            prediction_storage.put_prediction(prediction_data)
+
+    assert prediction_storage._output_tag_plans == {}
+
+
+@patch("latigo.time_series_api.prediction_storage_provider.rfc3339_from_datetime", new=Mock(side_effect=lambda x: x))
+def test_put_prediction_raises_if_not_all_data_stored(prediction_data, prediction_storage, tag_metadata):
+    store_result = {"stored": 4, "failed": 2, "message": "4 datapoints were stored, 2 datapoints failed"}
+    with patch.object(prediction_storage, "_get_metadata_from_api", return_value=tag_metadata), patch.object(
+        prediction_storage, "store_multiple_encoded_datapoints", return_value=store_result
+    ), patch.object(prediction_storage, "get_facility_by_tag_name", return_value="1903"):
+        with pytest.raises(PredictionNotStored):
+            prediction_storage.put_prediction(prediction_data)
+
+    assert prediction_storage._output_tag_plans == {}
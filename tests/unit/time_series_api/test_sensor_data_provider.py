@@ -1,7 +1,10 @@
 from datetime import datetime
 from unittest.mock import patch
 
-from latigo.types import TimeRange
+import pandas as pd
+import pytest
+
+from latigo.types import TIME_SERIES_IDS_META_KEY, SensorDataSet, TimeRange
 from tests.factories.time_series_api import SensorDataSpecFactory
 
 from tests.unit.time_series_api.conftest import (
@@ -18,14 +21,89 @@ def test_get_data_for_range(ts_api):
     spec = SensorDataSpecFactory()
     tags_data_from_api = fetch_data_for_multiple_ids_resp([str(i) for i in range(len(spec.tag_list))])
 
-    with patch.object(
-        ts_api,
-        "get_meta_by_name",
-        side_effect=[get_meta_by_name_resp(tag_id=str(i), name=tag.name) for i, tag in enumerate(spec.tag_list)],
-    ), patch.object(ts_api, "_fetch_data_for_multiple_ids", return_value=tags_data_from_api), patch.object(
-        ts_api, "get_facility_by_tag_name", return_value="1755"
-    ):
+    metas = {tag.name: get_meta_by_name_resp(tag_id=str(i), name=tag.name) for i, tag in enumerate(spec.tag_list)}
+
+    with patch.object(ts_api, "get_meta_by_names", return_value=metas) as get_meta_by_names_mock, patch.object(
+        ts_api, "_fetch_data_for_multiple_ids", return_value=tags_data_from_api
+    ), patch.object(ts_api, "get_facility_by_tag_name", return_value="1755"):
         res = ts_api.get_data_for_range(spec=spec, time_range=time_range)
 
-    expected = make_sensor_data_set(from_time=datetime_from, to_time=datetime_to, tags_data=tags_data_from_api), None
+    get_meta_by_names_mock.assert_called_once_with(names=[tag.name for tag in spec.tag_list], facility="1755")
+    time_series_ids = {tag.name: str(i) for i, tag in enumerate(spec.tag_list)}
+    expected = make_sensor_data_set(
+        from_time=datetime_from,
+        to_time=datetime_to,
+        tags_data=tags_data_from_api,
+        meta_data={TIME_SERIES_IDS_META_KEY: time_series_ids},
+    ), None
     assert res == expected
+
+
+def test_get_data_for_range_does_not_mark_tags_without_datapoints(ts_api):
+    time_range = TimeRange(
+        from_time=datetime.fromisoformat("2020-04-10T10:00:00.000000+00:00"),
+        to_time=datetime.fromisoformat("2020-04-10T10:30:00.000000+00:00"),
+    )
+    spec = SensorDataSpecFactory()
+    tag_names = [tag.name for tag in spec.tag_list]
+    tags_data_from_api = fetch_data_for_multiple_ids_resp([str(i) for i in range(len(tag_names))])
+    tags_data_from_api[0]["datapoints"] = []
+    metas = {name: get_meta_by_name_resp(tag_id=str(i), name=name) for i, name in enumerate(tag_names)}
+
+    with patch.object(ts_api, "get_meta_by_names", return_value=metas), patch.object(
+        ts_api, "_fetch_data_for_multiple_ids", return_value=tags_data_from_api
+    ), patch.object(ts_api, "get_facility_by_tag_name", return_value="1755"):
+        ts_api.get_data_for_range(spec=spec, time_range=time_range)
+
+    assert ts_api.get_tags_without_data(tag_names) == []
+
+
+def test_get_data_for_range_marks_missing_tags(ts_api):
+    time_range = TimeRange(
+        from_time=datetime.fromisoformat("2020-04-10T10:00:00.000000+00:00"),
+        to_time=datetime.fromisoformat("2020-04-10T10:30:00.000000+00:00"),
+    )
+    spec = SensorDataSpecFactory()
+    tag_names = [tag.name for tag in spec.tag_list]
+    metas = {name: get_meta_by_name_resp(tag_id=str(i), name=name) for i, name in enumerate(tag_names)}
+    metas[tag_names[-1]] = {"data": {"items": []}}
+
+    with patch.object(ts_api, "get_meta_by_names", return_value=metas), patch.object(
+        ts_api, "get_facility_by_tag_name", return_value="1755"
+    ):
+        with pytest.raises(ValueError):
+            ts_api.get_data_for_range(spec=spec, time_range=time_range)
+
+    assert ts_api.get_tags_without_data(tag_names) == [tag_names[-1]]
+
+
+def test_to_gordo_dataframe_filters_out_of_time_range(caplog):
+    datetime_from = datetime.fromisoformat("2020-04-10T10:00:00.000000+00:00")
+    datetime_to = datetime.fromisoformat("2020-04-10T12:30:00.000000+02:00")
+    tags_data = [
+        {
+            "name": "tag-1",
+            "datapoints": [
+                {"time": "2020-04-10T09:59:59.999Z", "value": 1, "status": 192},
+                {"time": "2020-04-10T10:00:00.000Z", "value": 2, "status": 192},
+                {"time": "2020-04-10T10:30:00.000Z", "value": 3, "status": 192},
+                {"time": "2020-04-10T10:30:00.001Z", "value": 4, "status": 192},
+            ],
+        },
+        {"name": "tag-2", "datapoints": [{"time": "2020-04-10T10:15:00Z", "value": 5.5, "status": 192}]},
+        {"name": "tag-3", "datapoints": []},
+    ]
+
+    res = SensorDataSet.to_gordo_dataframe(tags_data, datetime_from, datetime_to)
+
+    expected = [
+        pd.Series([2.0, 3.0], index=pd.to_datetime(["2020-04-10T10:00:00Z", "2020-04-10T10:30:00Z"]), name="tag-1"),
+        pd.Series([5.5], index=pd.to_datetime(["2020-04-10T10:15:00Z"]), name="tag-2"),
+        pd.Series([], index=pd.DatetimeIndex([], tz="UTC"), name="tag-3", dtype=float),
+    ]
+    assert len(res) == len(expected)
+    for series, expected_series in zip(res, expected):
+        pd.testing.assert_series_equal(series, expected_series)
+    skipped_logs = [record for record in caplog.records if "Skipped" in record.getMessage()]
+    assert len(skipped_logs) == 1
+    assert "Skipped 2 values" in skipped_logs[0].getMessage()
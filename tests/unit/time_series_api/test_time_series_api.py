@@ -1,11 +1,17 @@
 import logging
 from datetime import datetime
-from time import sleep
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, Timer
+from time import monotonic, sleep, time
 from typing import Optional
-from unittest.mock import ANY, call, patch
+from unittest.mock import ANY, MagicMock, call, patch
 
 import pytest
+import ujson
+from requests.exceptions import HTTPError
 
+from latigo.time_series_api import TagMetadataCache, TimeSeriesAPIClient
+from latigo.time_series_api.cache_stats import CacheStats
 from latigo.time_series_api.misc import _itemes_present
 from latigo.types import TimeRange
 from tests.conftest import make_response
@@ -28,6 +34,11 @@ def make_tag_object(ts_id: str = "001", facility: Optional[str] = "1755", name:
     }
 
 
+def make_cached_metadata(*tag_objects: dict) -> dict:
+    """Make metadata as it's returned from cache: only with the fields that are kept in cache."""
+    return {"data": {"items": [{field: obj[field] for field in TagMetadataCache.ITEM_FIELDS} for obj in tag_objects]}}
+
+
 def test_itemes_present():
     assert False == _itemes_present(None)
     assert False == _itemes_present({})
@@ -39,7 +50,7 @@ def test_itemes_present():
 def test_get_meta_by_name(time_series_api_client):
     tag_name = "1901.A-21T.MA_Y"
     facility = "1901"
-    tag_metadata = {"data": []}
+    tag_metadata = {"data": {"items": [make_tag_object(facility=facility)]}}
 
     assert time_series_api_client._tag_metadata_cache.get_metadata(tag_name, facility) is None
 
@@ -47,13 +58,44 @@ def test_get_meta_by_name(time_series_api_client):
         res = time_series_api_client.get_meta_by_name(tag_name, facility)
 
     assert res == tag_metadata
-    assert time_series_api_client._tag_metadata_cache.get_metadata(tag_name, facility) == tag_metadata
+    cached_metadata = make_cached_metadata(make_tag_object(facility=facility))
+    assert time_series_api_client._tag_metadata_cache.get_metadata(tag_name, facility) == cached_metadata
+
+
+def test_get_meta_by_name_without_facility_is_reused(time_series_api_client):
+    tag_name = "1901.A-21T.MA_Y"
+    tag_objects = [make_tag_object(ts_id="1", facility="1901"), make_tag_object(ts_id="2", facility="1902")]
+
+    with patch.object(
+        time_series_api_client, "_get_metadata_from_api", return_value={"data": {"items": tag_objects}}
+    ) as api_mock:
+        time_series_api_client.get_meta_by_name(tag_name)
+        res = time_series_api_client.get_meta_by_name(tag_name, "1902")
+        missing = time_series_api_client.get_meta_by_name(tag_name, "1903")
+
+    api_mock.assert_called_once_with(tag_name, None)
+    assert res == make_cached_metadata(tag_objects[1])
+    assert missing == {"data": {"items": []}}
+
+
+def test_cache_with_facility_does_not_answer_other_facilities(time_series_api_client):
+    cache = time_series_api_client._tag_metadata_cache
+    cache.set_metadata("tag", "1901", {"data": {"items": [make_tag_object(facility="1901")]}})
+
+    assert cache.get_metadata("tag", "1901") == make_cached_metadata(make_tag_object(facility="1901"))
+    assert cache.get_metadata("tag", None) is None
+    assert cache.get_metadata("tag", "1902") is None
+    assert ujson.loads(cache._cache.get(cache._make_metadata_key("tag"))) == {
+        "facility": "1901",
+        "items": [{"id": "001", "name": "GRA-0001E.PV", "facility": "1901"}],
+        "expires_at": ANY,
+    }
 
 
 def test_value_in_cache_is_expired(time_series_api_client):
     tag_name = "1901.A-21T.MA_Y"
     facility = "1901"
-    tag_metadata = {"data": []}
+    tag_metadata = {"data": {"items": []}}
     seconds_to_expire = 1
     cache = time_series_api_client._tag_metadata_cache
     cache.CACHE_TIME_TO_LIVE = seconds_to_expire
@@ -65,6 +107,38 @@ def test_value_in_cache_is_expired(time_series_api_client):
     assert cache.get_metadata(tag_name, facility) is None
 
 
+def test_cache_get_set_many(time_series_api_client):
+    facility = "1901"
+    metas = {"1901.A-21T.MA_Y": {"data": {"items": [make_tag_object(ts_id="1")]}}, "1901.B.MA_Y": {"data": []}}
+    cache = time_series_api_client._tag_metadata_cache
+
+    assert cache.get_many([*metas, "missing"], facility) == {name: None for name in [*metas, "missing"]}
+
+    cache.set_many(metas, facility)
+
+    assert cache.get_many([*metas, "missing"], facility) == {
+        "1901.A-21T.MA_Y": make_cached_metadata(make_tag_object(ts_id="1")),
+        "1901.B.MA_Y": {"data": {"items": []}},
+        "missing": None,
+    }
+    assert cache.get_many(metas, "other-facility") == {name: None for name in metas}
+
+
+def test_get_meta_by_names(time_series_api_client):
+    facility = "1901"
+    cached_meta = {"data": {"items": [make_tag_object(ts_id="1")]}}
+    api_meta = {"data": {"items": [make_tag_object(ts_id="2")]}}
+    cache = time_series_api_client._tag_metadata_cache
+    cache.set_metadata("cached", facility, cached_meta)
+
+    with patch.object(time_series_api_client, "_get_metadata_from_api", return_value=api_meta) as api_mock:
+        res = time_series_api_client.get_meta_by_names(["cached", "not-cached"], facility)
+
+    assert res == {"cached": make_cached_metadata(make_tag_object(ts_id="1")), "not-cached": api_meta}
+    api_mock.assert_called_once_with("not-cached", facility)
+    assert cache.get_metadata("not-cached", facility) == make_cached_metadata(make_tag_object(ts_id="2"))
+
+
 def test_fetch_data_for_multiple_ids(time_series_api_client):
     datetime_from = datetime.fromisoformat("2020-04-10T10:00:00.000000+00:00")
     datetime_to = datetime.fromisoformat("2020-04-10T10:30:00.000000+00:00")
@@ -79,7 +153,34 @@ def test_fetch_data_for_multiple_ids(time_series_api_client):
     with patch.object(time_series_api_client, "_post", side_effect=response_data) as mocked_post:
         time_series_api_client._fetch_data_for_multiple_ids(tag_ids=tag_ids, time_range=time_range)
 
-    mocked_post.assert_has_calls(expected_calls)
+    mocked_post.assert_has_calls(expected_calls, any_order=True)
+
+
+def test_fetch_data_for_multiple_ids_in_parallel(time_series_api_client):
+    time_range = TimeRange(
+        from_time=datetime.fromisoformat("2020-04-10T10:00:00.000000+00:00"),
+        to_time=datetime.fromisoformat("2020-04-10T10:30:00.000000+00:00"),
+    )
+    tag_ids = [str(i) for i in range(450)]
+    in_flight = []
+    max_in_flight = []
+    lock = Lock()
+
+    def post(url, json):
+        with lock:
+            in_flight.append(url)
+            max_in_flight.append(len(in_flight))
+        sleep(0.05)
+        with lock:
+            in_flight.pop()
+        return make_response({"data": {"items": [{"id": item["id"]} for item in json]}})
+
+    with patch.object(time_series_api_client, "_post", side_effect=post) as mocked_post:
+        res = time_series_api_client._fetch_data_for_multiple_ids(tag_ids=tag_ids, time_range=time_range)
+
+    assert [item["id"] for item in res] == tag_ids
+    assert mocked_post.call_count == 5
+    assert 1 < max(max_in_flight) <= time_series_api_client.max_parallel_batches
 
 
 def _make_multiple_ids_req_data(tag_id: str, time_range: TimeRange):
@@ -173,16 +274,310 @@ def test_replace_cached_metadata_with_new(time_series_api_client):
 
     assert res == tag_metadata
     create_id_mocked.assert_called_once_with(name=tag_name, facility=facility, description="description")
-    assert time_series_api_client._tag_metadata_cache.get_metadata(tag_name, facility) == tag_metadata
+    cached_metadata = make_cached_metadata(make_tag_object())
+    assert time_series_api_client._tag_metadata_cache.get_metadata(tag_name, facility) == cached_metadata
+
+
+def test_replace_cached_metadata_invalidates_local_cache(time_series_api_client):
+    tag_name = "1901.A-21T.MA_Y"
+    facility = "1901"
+    old_metadata = {"data": {"items": [make_tag_object(ts_id="old")]}}
+    new_metadata = {"data": {"items": [make_tag_object(ts_id="new")]}}
+    cache = time_series_api_client._tag_metadata_cache
+    cache.set_metadata(tag_name, facility, old_metadata)
+
+    with patch.object(time_series_api_client, "_get_metadata_from_api", side_effect=HTTPError("API is down")):
+        with pytest.raises(HTTPError):
+            time_series_api_client.replace_cached_metadata_with_new(tag_name, facility, "description")
+    assert cache._get_local(cache._make_metadata_key(tag_name)) is None
+
+    with patch.object(time_series_api_client, "_get_metadata_from_api", return_value=new_metadata):
+        time_series_api_client.replace_cached_metadata_with_new(tag_name, facility, "description")
+    assert cache.get_metadata(tag_name, facility) == make_cached_metadata(make_tag_object(ts_id="new"))
+
+
+def test_local_cache_is_checked_before_redis():
+    cache = TagMetadataCache(local_cache_size=2, local_cache_ttl=60)
+    metas = {name: {"data": {"items": [make_tag_object(ts_id=name)]}} for name in ["tag-1", "tag-2", "tag-3"]}
+    cache.set_many(metas, "1901")
+    metas = {name: make_cached_metadata(make_tag_object(ts_id=name)) for name in metas}
+
+    with patch.object(cache._cache, "mget", wraps=cache._cache.mget) as mget_mock:
+        assert cache.get_many(["tag-2", "tag-3"], "1901") == {"tag-2": metas["tag-2"], "tag-3": metas["tag-3"]}
+        mget_mock.assert_not_called()
+
+        # least recently used "tag-1" was evicted from the in-process tier, but is still in Redis
+        assert cache.get_many(["tag-1", "tag-3"], "1901") == {"tag-1": metas["tag-1"], "tag-3": metas["tag-3"]}
+        mget_mock.assert_called_once_with([cache._make_metadata_key("tag-1")])
+
+
+def test_local_cache_is_expired():
+    cache = TagMetadataCache(local_cache_size=10, local_cache_ttl=1)
+    key = cache._make_metadata_key("tag")
+    cache.set_metadata("tag", "1901", {"data": {"items": [make_tag_object()]}})
+    assert cache._get_local(key)
+
+    sleep(1)
+    assert cache._get_local(key) is None
+    assert cache.get_metadata("tag", "1901") == make_cached_metadata(make_tag_object())
+
+
+def test_local_cache_does_not_outlive_redis_record():
+    cache = TagMetadataCache(local_cache_size=10, local_cache_ttl=600)
+    key = cache._make_metadata_key("tag")
+    record = {"facility": "1901", "items": [make_tag_object()], "expires_at": int(time()) + 1}
+    cache._cache.set(name=key, value=ujson.dumps(record), ex=1)
+
+    assert cache.get_metadata("tag", "1901")
+    _, expires_at = cache._local_cache[key]
+    assert expires_at - monotonic() <= 1
+
+
+def test_missing_tag_is_cached_for_negative_cache_ttl():
+    cache = TagMetadataCache(negative_cache_ttl=1)
+    cache.set_many({"missing": {"data": {"items": []}}, "tag": {"data": {"items": [make_tag_object()]}}}, "1901")
+
+    assert cache._cache.ttl(cache._make_metadata_key("missing")) == 1
+    assert cache._cache.ttl(cache._make_metadata_key("tag")) >= TagMetadataCache.CACHE_TIME_TO_LIVE
+    assert cache.get_metadata("missing", "1901") == {"data": {"items": []}}
+
+    sleep(1)
+    assert cache.get_metadata("missing", "1901") is None
+    assert cache.get_metadata("tag", "1901") == make_cached_metadata(make_tag_object())
+
+
+def test_cache_ttl_is_spread_by_jitter():
+    cache = TagMetadataCache()
+    cache.set_many({f"tag-{i}": {"data": {"items": [make_tag_object()]}} for i in range(20)}, "1901")
+
+    ttls = {cache._cache.ttl(cache._make_metadata_key(f"tag-{i}")) for i in range(20)}
+    max_ttl = TagMetadataCache.CACHE_TIME_TO_LIVE * (1 + TagMetadataCache.TIME_TO_LIVE_JITTER)
+    assert len(ttls) > 1
+    assert all(TagMetadataCache.CACHE_TIME_TO_LIVE <= ttl <= max_ttl for ttl in ttls)
+
+
+def test_get_meta_by_name_single_flight_in_process(time_series_api_client):
+    tag_metadata = {"data": {"items": [make_tag_object()]}}
+
+    def get_metadata_from_api(name, facility):
+        sleep(0.2)
+        return tag_metadata
+
+    with patch.object(
+        time_series_api_client, "_get_metadata_from_api", side_effect=get_metadata_from_api
+    ) as api_mock, ThreadPoolExecutor(max_workers=5) as pool:
+        results = list(pool.map(lambda _: time_series_api_client.get_meta_by_name("tag", "1901"), range(5)))
+
+    api_mock.assert_called_once_with("tag", "1901")
+    assert results == [tag_metadata] * 5
+    assert not time_series_api_client._metadata_in_flight
+
+
+def test_get_meta_by_name_waits_for_other_process(time_series_api_client):
+    cache = time_series_api_client._tag_metadata_cache
+    assert cache.acquire_fill_lock("tag", "1901")  # taken by other process
+    assert cache.acquire_fill_lock("tag", "1901") is None
+    tag_metadata = {"data": {"items": [make_tag_object()]}}
+    timer = Timer(0.1, cache.set_metadata, args=("tag", "1901", tag_metadata))
+    timer.start()
+
+    with patch.object(time_series_api_client, "_get_metadata_from_api") as api_mock:
+        res = time_series_api_client.get_meta_by_name("tag", "1901")
+
+    timer.join()
+    api_mock.assert_not_called()
+    assert res == make_cached_metadata(make_tag_object())
+
+
+def test_fill_lock_is_released(time_series_api_client):
+    with patch.object(time_series_api_client, "_get_metadata_from_api", side_effect=HTTPError("API is down")):
+        with pytest.raises(HTTPError):
+            time_series_api_client.get_meta_by_name("tag", "1901")
+
+    assert time_series_api_client._tag_metadata_cache.acquire_fill_lock("tag", "1901")
+
+
+def test_get_meta_by_names_fills_in_bulk(time_series_api_client):
+    cache = time_series_api_client._tag_metadata_cache
+    assert cache.acquire_fill_lock("tag-2", "1901")  # taken by other process
+    tag_metadata = {"data": {"items": [make_tag_object()]}}
+    timer = Timer(0.1, cache.set_metadata, args=("tag-2", "1901", tag_metadata))
+    timer.start()
+
+    with patch.object(
+        time_series_api_client, "_get_metadata_from_api", return_value=tag_metadata
+    ) as api_mock, patch.object(cache, "set_many", wraps=cache.set_many) as set_many_mock:
+        res = time_series_api_client.get_meta_by_names(["tag-1", "tag-2", "tag-3"], "1901")
+
+    timer.join()
+    assert api_mock.call_args_list == [call("tag-1", "1901"), call("tag-3", "1901")]
+    set_many_mock.assert_called_once_with({"tag-1": tag_metadata, "tag-3": tag_metadata}, "1901")
+    assert res == {"tag-1": tag_metadata, "tag-2": make_cached_metadata(make_tag_object()), "tag-3": tag_metadata}
+    assert cache.acquire_fill_locks(["tag-1", "tag-3"], "1901").keys() == {"tag-1", "tag-3"}
+    assert not time_series_api_client._metadata_in_flight
+
+
+def test_release_fill_lock_keeps_lock_of_other_process():
+    cache = TagMetadataCache()
+    token = cache.acquire_fill_lock("tag", "1901")
+    key = cache._make_fill_lock_key("tag", "1901")
+    cache._cache.set(name=key, value="other-token")  # the lock expired and was taken by other process
+
+    cache.release_fill_lock("tag", "1901", token)
+    assert cache._cache.get(key) == b"other-token"
+
+    cache.release_fill_locks({"tag": "other-token"}, "1901")
+    assert cache._cache.get(key) is None
+
+
+@patch("latigo.time_series_api.client.get_auth_session", new=MagicMock())
+def test_get_meta_by_name_refreshes_ahead(config):
+    client = TimeSeriesAPIClient({**config["sensor_data"], "metadata_refresh_ahead": 0.1})
+    cache = client._tag_metadata_cache
+    cache.set_metadata("tag", "1901", {"data": {"items": [make_tag_object(ts_id="old")]}})
+    new_metadata = {"data": {"items": [make_tag_object(ts_id="new")]}}
+    refresh_time = time() + TagMetadataCache.CACHE_TIME_TO_LIVE
+
+    with patch.object(client, "_get_metadata_from_api", return_value=new_metadata) as api_mock:
+        assert client.get_meta_by_name("tag", "1901") == make_cached_metadata(make_tag_object(ts_id="old"))
+        api_mock.assert_not_called()
+
+        with patch("latigo.time_series_api.cache.time", return_value=refresh_time):
+            # cached value is returned at once and refreshed in the background
+            assert client.get_meta_by_name("tag", "1901") == make_cached_metadata(make_tag_object(ts_id="old"))
+        client._metadata_refresh_executor.shutdown(wait=True)
+
+    api_mock.assert_called_once_with("tag", "1901")
+    assert client.get_meta_by_name("tag", "1901") == make_cached_metadata(make_tag_object(ts_id="new"))
+    assert not client._metadata_refreshing
+
+
+def test_no_data_tags():
+    cache = TagMetadataCache(no_data_cache_ttl=1)
+    cache.set_no_data(["tag-1", "tag-2"])
+
+    assert cache.get_no_data(["tag-1", "tag-2", "tag-3"]) == ["tag-1", "tag-2"]
+
+    sleep(1)
+    assert cache.get_no_data(["tag-1", "tag-2", "tag-3"]) == []
+
+
+def test_no_data_tags_disabled():
+    cache = TagMetadataCache(no_data_cache_ttl=0)
+    cache.set_no_data(["tag-1"])
+
+    assert cache.get_no_data(["tag-1"]) == []
+
+
+def test_cache_stats_are_counted():
+    cache = TagMetadataCache()
+    cache.stats = CacheStats("test cache")
+    with cache.stats.track() as totals:
+        cache.set_many({name: {"data": {"items": [make_tag_object()]}} for name in ["tag-1", "tag-2"]}, "1901")
+        cache.invalidate("tag-1")
+        cache.get_many(["tag-1", "tag-2", "missing"], "1901")  # "tag-1" is taken from Redis
+        cache.get_metadata("tag-1", "1901")
+
+    counters = cache.stats.snapshot()["counters"]
+    assert totals == {**counters, "calls": 2, "seconds": ANY}
+    assert counters["hits"] == 3
+    assert counters["local_hits"] == 2
+    assert counters["misses"] == 1
+    assert counters["bytes_written"] > counters["bytes_read"] > 0
+    assert set(cache.stats.snapshot()["latencies"]) == {"set_many", "mget"}
+
+
+def test_cache_write_failures_are_counted():
+    cache = TagMetadataCache()
+    cache.stats = CacheStats("test cache")
+    with patch.object(cache._cache, "set", return_value=None), pytest.raises(Exception):
+        cache.set_metadata("tag", "1901", {"data": {"items": [make_tag_object()]}})
+
+    assert cache.stats.snapshot()["counters"]["write_failures"] == 1
+
+
+@pytest.mark.parametrize("local_cache_size, local_cache_ttl", [(-1, 10), (10, -1), (10, "10")])
+def test_local_cache_invalid_config(local_cache_size, local_cache_ttl):
+    with pytest.raises(ValueError):
+        TagMetadataCache(local_cache_size=local_cache_size, local_cache_ttl=local_cache_ttl)
+
+
+@pytest.mark.parametrize("refresh_ahead", [-0.1, 1, "0.1"])
+def test_refresh_ahead_invalid_config(refresh_ahead):
+    with pytest.raises(ValueError):
+        TagMetadataCache(refresh_ahead=refresh_ahead, refresh=MagicMock())
 
 
 def test_store_multiple_datapoints(time_series_api_client):
     ts_ids_amount = 3
-    items = [make_tag_object() for _ in range(ts_ids_amount)]
-    expected_resp = {"statusCode": 200, "message": f"Successfully wrote datapoints to {ts_ids_amount} timeseries"}
+    items = [
+        {"id": str(i), "datapoints": [{"time": "2020-04-10T10:00:00Z", "value": 1.5, "status": "0"}]}
+        for i in range(ts_ids_amount)
+    ]
+    api_resp = {"statusCode": 200, "message": f"Successfully wrote datapoints to {ts_ids_amount} timeseries"}
+
+    with patch.object(time_series_api_client, "_post", return_value=make_response(api_resp)) as mocked_post:
+        res = time_series_api_client.store_multiple_datapoints(items)
+
+    mocked_post.assert_called_once_with(
+        url=f"{time_series_api_client.base_url}/data", data=ANY, headers={"Content-Type": "application/json"}
+    )
+    assert ujson.loads(mocked_post.call_args[1]["data"]) == {"items": items}
+    assert res == {"stored": 3, "failed": 0, "message": "3 datapoints were stored, 0 datapoints failed"}
+
+
+def test_store_multiple_datapoints_in_chunks(time_series_api_client):
+    time_series_api_client.write_chunk_max_datapoints = 3
+    items = [
+        {"id": "id-1", "datapoints": [{"time": str(i), "value": float(i), "status": "0"} for i in range(5)]},
+        {"id": "id-2", "datapoints": [{"time": "5", "value": 5.0, "status": "0"}]},
+    ]
 
-    with patch.object(time_series_api_client, "_post", return_value=make_response(expected_resp)) as mocked_post:
+    with patch.object(time_series_api_client, "_post", return_value=make_response({})) as mocked_post:
         res = time_series_api_client.store_multiple_datapoints(items)
 
-    mocked_post.assert_called_once_with(url=f"{time_series_api_client.base_url}/data", json={"items": items})
-    assert res == expected_resp
+    bodies = sorted((ujson.loads(call_args[1]["data"]) for call_args in mocked_post.call_args_list), key=str)
+    assert bodies == [
+        {"items": [{"id": "id-1", "datapoints": items[0]["datapoints"][:3]}]},
+        {"items": [{"id": "id-1", "datapoints": items[0]["datapoints"][3:]}, items[1]]},
+    ]
+    assert res == {"stored": 6, "failed": 0, "message": "6 datapoints were stored, 0 datapoints failed"}
+
+
+def test_make_datapoints_chunks_by_size(time_series_api_client):
+    time_series_api_client.write_chunk_max_bytes = 100
+    encoded_items = [("id-1", ['{"time":"%s","value":1.0,"status":"0"}' % i for i in range(5)])]
+
+    chunks = time_series_api_client._make_datapoints_chunks(encoded_items)
+
+    assert [points for _, points in chunks] == [1, 1, 1, 1, 1]
+    assert all(len(body) <= 100 for body, _ in chunks)
+    assert [ujson.loads(body)["items"][0]["datapoints"][0]["time"] for body, _ in chunks] == ["0", "1", "2", "3", "4"]
+
+
+def test_store_multiple_datapoints_retries_failed_chunks(time_series_api_client):
+    time_series_api_client.write_chunk_max_datapoints = 1
+    time_series_api_client.WRITE_RETRY_DELAY = 0
+    items = [{"id": f"id-{i}", "datapoints": [{"time": "1", "value": 1.0, "status": "0"}]} for i in range(3)]
+    responses = {"id-0": [503, 200], "id-1": [200], "id-2": [400]}
+
+    def post(url, data, headers):
+        status_code = responses[ujson.loads(data)["items"][0]["id"]].pop(0)
+        return make_response({}, status_code=status_code)
+
+    with patch.object(time_series_api_client, "_post", side_effect=post) as mocked_post:
+        res = time_series_api_client.store_multiple_datapoints(items)
+
+    assert mocked_post.call_count == 4  # only the chunk that failed with 503 was stored once more
+    assert res == {"stored": 2, "failed": 1, "message": "2 datapoints were stored, 1 datapoints failed"}
+
+
+def test_store_multiple_datapoints_all_chunks_failed(time_series_api_client):
+    time_series_api_client.WRITE_RETRY_DELAY = 0
+    items = [{"id": "id", "datapoints": [{"time": "1", "value": 1.0, "status": "0"}]}]
+
+    with patch.object(time_series_api_client, "_post", return_value=make_response({}, status_code=500)) as mocked_post:
+        with pytest.raises(HTTPError):
+            time_series_api_client.store_multiple_datapoints(items)
+
+    assert mocked_post.call_count == time_series_api_client.write_retries + 1